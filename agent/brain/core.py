@@ -1,4 +1,3 @@
-from agent.utils.key_rotator import get_next_gemini_key
 # agent/brain/core.py (Hardened)
 # -*- coding: utf-8 -*-
 import os
@@ -7,9 +6,12 @@ from typing import TypedDict, Annotated, List
 from langchain_core.messages import BaseMessage
 from langgraph.graph import StateGraph, END
 from langgraph.prebuilt import ToolNode
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_deepseek import ChatDeepSeek
 from agent.brain.tools import available_tools
+from agent.llm.clients import get_chat_model
+from agent.llm.gateway import llm_gateway, record_langchain_usage, PRIORITY_HIGH
+from agent.llm.metrics import llm_metrics
+from agent.llm.router import llm_router
+from agent.utils.key_rotator import gemini_key_pool, deepseek_key_pool
 
 class AgentState(TypedDict):
     messages: Annotated[List[BaseMessage], operator.add]
@@ -18,23 +20,36 @@ class AgentState(TypedDict):
 
 tool_node = ToolNode(available_tools)
 
+def _invoke(provider: str, model_name: str, messages: List[BaseMessage]):
+    pool = gemini_key_pool if provider.lower() == "gemini" else deepseek_key_pool
+
+    def attempt():
+        # 每次尝试从 key 池取最空闲的健康 key；模型实例与 bind_tools 结果按 provider/key/model 复用
+        with pool.lease() as lease:
+            llm_with_tools = get_chat_model(provider, model_name, temperature=0, tools=available_tools or [],
+                                            api_key=lease.key)
+            response = llm_with_tools.invoke(messages)
+            usage = getattr(response, "usage_metadata", None) or {}
+            lease.tokens = int(usage.get("total_tokens") or 0)
+            return response
+
+    # 经网关准入：受 provider/model 并发上限与 429 冷却约束
+    with llm_metrics.track("call_model", provider.lower(), model_name):
+        response = llm_gateway.run(provider.lower(), model_name, attempt,
+                                   call_site="call_model", priority=PRIORITY_HIGH)
+        record_langchain_usage(response)
+    return response
+
 def call_model(state: AgentState):
     provider = state["llm_provider"]
     model_name = state["model_name"]
 
-    if provider == "Gemini":
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key: raise ValueError("GEMINI_API_KEY is not set")
-        llm = ChatGoogleGenerativeAI(model=model_name, temperature=0, google_api_key=api_key)
-    elif provider == "DeepSeek":
-        api_key = os.getenv("DEEPSEEK_API_KEY")
-        if not api_key: raise ValueError("DEEPSEEK_API_KEY is not set")
-        llm = ChatDeepSeek(model=model_name, temperature=0, api_key=api_key)
+    if llm_router.enabled_for("call_model"):
+        # 界面选择的模型作为首选，路由层在支持 tool calling 的后端中挑最快且健康的
+        response = llm_router.execute("call_model", lambda b: _invoke(b.provider, b.model, state["messages"]),
+                                      preferred=(provider, model_name))
     else:
-        raise ValueError(f"Unsupported LLM provider: {provider}")
-
-    llm_with_tools = llm.bind_tools(available_tools or [])
-    response = llm_with_tools.invoke(state["messages"])
+        response = _invoke(provider, model_name, state["messages"])
     return {"messages": [response]}
 
 def should_continue(state: AgentState):
@@ -131,7 +131,8 @@ def generate_video_with_browser_automation(prompt_path: str, debugging_port: int
         task_id = flow_task_manager.add_task(
             prompt_content=prompt_text,
             debugging_port=debugging_port,
-            flow_url=flow_url
+            flow_url=flow_url,
+            prompt_path=prompt_path
         )
         print(f"✅ Task added successfully with ID: {task_id}")
 
@@ -0,0 +1,243 @@
+# agent/collectors/bili_dash.py
+# -*- coding: utf-8 -*-
+"""
+agent/collectors/bili_dash.py
+===========================================================
+作用：
+  不依赖 yt-dlp 子进程的 B 站视频下载器（仅用于分析）。
+  - 通过 playurl 接口（复用 collectors/bilibili.py 的 Cookie 会话）解析 DASH 流
+  - 选择满足最低清晰度要求的最小视频流与最小音频流，优先 AVC 编码
+  - 按固定块大小并发发起 HTTP Range 请求，写入 .part 文件；
+    已完成的块记录在 .part.json 中，中断后再次下载只补缺失的块；
+    流大小/块大小变化或超过 partial_max_age_seconds 的断点视为失效，重新下载
+  - 音视频用 ffmpeg 流拷贝合并为 mp4
+  失败时由调用方（gemini_vision.download_video）回退到 yt-dlp。
+
+配置见 config/default.yaml 的 video.download 段。
+"""
+import json
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+
+from agent.config import config_section
+
+VIEW_API = "https://api.bilibili.com/x/web-interface/view"
+PLAYURL_API = "https://api.bilibili.com/x/player/playurl"
+AVC_CODECID = 7
+_local = threading.local()
+_view_cache: Dict[str, Dict[str, Any]] = {}
+_view_lock = threading.Lock()
+
+
+def _download_cfg() -> Dict[str, Any]:
+    return config_section("video").get("download") or {}
+
+
+def _session() -> requests.Session:
+    """每个线程一个会话，请求头复用 collectors/bilibili.py 的 Cookie / UA"""
+    s = getattr(_local, "session", None)
+    if s is None:
+        from agent.collectors.bilibili import SESSION
+        s = requests.Session()
+        s.headers.update(SESSION.headers)
+        s.headers.update({"Referer": "https://www.bilibili.com/"})
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        s.mount("https://", adapter)
+        _local.session = s
+    return s
+
+
+# ---------------- 解析 ----------------
+
+def _api_json(url: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    r = _session().get(url, params=params, timeout=10)
+    r.raise_for_status()
+    data = r.json()
+    if data.get("code", 0) != 0:
+        raise RuntimeError(f"B站接口错误 {data.get('code')}: {data.get('message')}")
+    return data.get("data") or {}
+
+
+def _urls(rep: Dict[str, Any]) -> List[str]:
+    primary = rep.get("baseUrl") or rep.get("base_url")
+    backups = rep.get("backupUrl") or rep.get("backup_url") or []
+    return [u for u in [primary, *backups] if u]
+
+
+def pick_representations(dash: Dict[str, Any], min_height: int, max_height: int) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    """选最小的合格视频流（min_height ≤ 高度 ≤ max_height，优先 AVC）与最小的音频流"""
+    videos = dash.get("video") or []
+    if not videos:
+        raise RuntimeError("playurl 未返回 DASH 视频流")
+    fitting = [v for v in videos if min_height <= int(v.get("height") or 0) <= max_height]
+    if not fitting:
+        # 没有落在区间内的：取不低于下限的最低清晰度，再不行取全部里最低的
+        above = [v for v in videos if int(v.get("height") or 0) >= min_height]
+        lowest = min(int(v.get("height") or 0) for v in (above or videos))
+        fitting = [v for v in (above or videos) if int(v.get("height") or 0) == lowest]
+    avc = [v for v in fitting if v.get("codecid") == AVC_CODECID]
+    video = min(avc or fitting, key=lambda v: int(v.get("bandwidth") or 0))
+    audios = dash.get("audio") or []
+    audio = min(audios, key=lambda a: int(a.get("bandwidth") or 0)) if audios else None
+    return video, audio
+
+
+def video_info(bvid: str) -> Dict[str, Any]:
+    """view 接口的视频信息（cid、duration 等）；同一进程内每个 BV 号只请求一次"""
+    with _view_lock:
+        cached = _view_cache.get(bvid)
+    if cached is None:
+        cached = _api_json(VIEW_API, {"bvid": bvid})
+        with _view_lock:
+            _view_cache[bvid] = cached
+    return cached
+
+
+def video_duration(bvid: str) -> Optional[float]:
+    try:
+        return float(video_info(bvid).get("duration") or 0) or None
+    except Exception:
+        return None
+
+
+def resolve_dash(bvid: str) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+    cfg = _download_cfg()
+    cid = video_info(bvid)["cid"]
+    data = _api_json(PLAYURL_API, {"bvid": bvid, "cid": cid, "fnval": 16, "fourk": 0})
+    return pick_representations(data.get("dash") or {}, int(cfg.get("min_height", 360)),
+                                int(cfg.get("max_height", 480)))
+
+
+# ---------------- 分块并发下载 ----------------
+
+def _content_length(urls: List[str]) -> Tuple[str, int]:
+    last_exc: Optional[Exception] = None
+    for url in urls:
+        try:
+            r = _session().get(url, headers={"Range": "bytes=0-0"}, timeout=10, stream=True)
+            r.close()
+            total = r.headers.get("Content-Range", "").rsplit("/", 1)[-1]
+            if r.status_code == 206 and total.isdigit():
+                return url, int(total)
+            last_exc = RuntimeError(f"不支持 Range 请求: HTTP {r.status_code}")
+        except requests.RequestException as e:
+            last_exc = e
+    raise RuntimeError(f"无法获取流大小: {last_exc}")
+
+
+def download_ranged(urls: List[str], target: Path, workers: int = 4, chunk_size: int = 4 * 1024 * 1024,
+                    max_age_seconds: Optional[float] = None) -> Path:
+    """
+    并发 Range 下载到 target。中途失败时保留 target.part 与 target.part.json，
+    下次调用只下载缺失的块；断点早于 max_age_seconds 时丢弃重下。
+    """
+    if target.exists():
+        return target
+    url, total = _content_length(urls)
+    part = target.with_name(target.name + ".part")
+    state_file = target.with_name(target.name + ".part.json")
+    done: set = set()
+    stale = (max_age_seconds is not None and state_file.exists()
+             and time.time() - state_file.stat().st_mtime > max_age_seconds)
+    if part.exists() and state_file.exists() and not stale:
+        try:
+            state = json.loads(state_file.read_text(encoding="utf-8"))
+            if state.get("total") == total and state.get("chunk_size") == chunk_size:
+                done = set(state.get("done") or [])
+        except Exception:
+            done = set()
+    if not done or part.stat().st_size != total:
+        done = set()
+        with open(part, "wb") as f:
+            f.truncate(total)
+
+    n_chunks = (total + chunk_size - 1) // chunk_size
+    todo = [i for i in range(n_chunks) if i not in done]
+    lock = threading.Lock()
+
+    def fetch(i: int) -> None:
+        start = i * chunk_size
+        end = min(total, start + chunk_size) - 1
+        last_exc: Optional[Exception] = None
+        for u in [url] + [x for x in urls if x != url]:
+            try:
+                r = _session().get(u, headers={"Range": f"bytes={start}-{end}"}, timeout=30)
+                if r.status_code != 206 or len(r.content) != end - start + 1:
+                    raise RuntimeError(f"HTTP {r.status_code}, {len(r.content)} bytes")
+                with lock:
+                    with open(part, "r+b") as f:
+                        f.seek(start)
+                        f.write(r.content)
+                    done.add(i)
+                    state_file.write_text(json.dumps({"total": total, "chunk_size": chunk_size,
+                                                      "done": sorted(done)}), encoding="utf-8")
+                return
+            except Exception as e:
+                last_exc = e
+        raise RuntimeError(f"分块 {i} 下载失败: {last_exc}")
+
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="bili-dash") as pool:
+        for fut in [pool.submit(fetch, i) for i in todo]:
+            fut.result()
+
+    part.replace(target)
+    state_file.unlink(missing_ok=True)
+    return target
+
+
+def dash_artifacts(output: Path) -> List[Path]:
+    """download_bilibili_dash 为 output 产生的中间文件（音视频流、断点续传状态、合并临时文件）"""
+    out = [output.with_name(output.name + ".part.mp4")]
+    for kind in ("video", "audio"):
+        stream = output.with_name(f"{output.stem}.{kind}.m4s")
+        out += [stream, stream.with_name(stream.name + ".part"), stream.with_name(stream.name + ".part.json")]
+    return out
+
+
+def cleanup_dash_artifacts(output: Path) -> None:
+    for f in dash_artifacts(output):
+        f.unlink(missing_ok=True)
+
+
+def download_bilibili_dash(bvid: str, output: Path) -> Path:
+    """解析并下载最小合格的 DASH 音视频流，合并为 output（mp4）"""
+    if not shutil.which("ffmpeg"):
+        raise RuntimeError("找不到 ffmpeg，无法合并 DASH 音视频流")
+    cfg = _download_cfg()
+    workers = int(cfg.get("range_workers", 4))
+    chunk_size = int(cfg.get("range_chunk_bytes", 4 * 1024 * 1024))
+    max_age = float(cfg.get("partial_max_age_seconds", 86400))
+    video, audio = resolve_dash(bvid)
+    print(f"📡 DASH: {video.get('height')}p codecid={video.get('codecid')} "
+          f"≈{int(video.get('bandwidth') or 0) // 1000}kbps")
+
+    v_file = output.with_name(f"{output.stem}.video.m4s")
+    a_file = output.with_name(f"{output.stem}.audio.m4s")
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        jobs = [pool.submit(download_ranged, _urls(video), v_file, workers, chunk_size, max_age)]
+        if audio is not None:
+            jobs.append(pool.submit(download_ranged, _urls(audio), a_file, workers, chunk_size, max_age))
+        for job in jobs:
+            job.result()
+
+    tmp = output.with_name(output.name + ".part.mp4")
+    cmd = ["ffmpeg", "-y", "-loglevel", "error", "-i", str(v_file)]
+    if audio is not None:
+        cmd += ["-i", str(a_file)]
+    cmd += ["-c", "copy", "-movflags", "+faststart", str(tmp)]
+    try:
+        subprocess.run(cmd, check=True, capture_output=True, text=True)
+    except subprocess.CalledProcessError as e:
+        tmp.unlink(missing_ok=True)
+        raise RuntimeError(f"合并 DASH 音视频失败: {e.stderr}")
+    tmp.replace(output)
+    for f in (v_file, a_file):
+        f.unlink(missing_ok=True)
+    return output
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 import os, yaml
+from functools import lru_cache
 from typing import Any, Dict
 from dotenv import load_dotenv
 
@@ -31,3 +32,14 @@ class Settings:
             else:
                 return default
         return node
+
+@lru_cache(maxsize=1)
+def _config_file() -> Dict[str, Any]:
+    try:
+        return load_yaml(os.getenv("MANGO_CONFIG", os.path.join("config", "default.yaml")))
+    except Exception:
+        return {}
+
+def config_section(name: str) -> Dict[str, Any]:
+    """config/default.yaml（可用环境变量 MANGO_CONFIG 指定）的一个顶层段，如 video / prompt / flow / llm；缺失时返回空字典"""
+    return _config_file().get(name) or {}
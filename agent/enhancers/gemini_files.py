@@ -0,0 +1,194 @@
+# agent/enhancers/gemini_files.py
+# -*- coding: utf-8 -*-
+"""
+agent/enhancers/gemini_files.py
+===========================================================
+作用：
+  已上传 Gemini 文件的本地登记表：content hash → Gemini 文件名 + 过期时间。
+  - 同一视频（按内容哈希）在文件有效期内再次分析时直接复用，跳过上传与 PROCESSING 等待
+  - 文件归属于上传时使用的 key（项目），登记表按 key 指纹区分；复用时固定使用该 key
+  - 惰性刷新：仅在准备复用时查询一次远端状态，远端已不存在/失败则删除条目并重新上传
+  - 主动清理：临近过期的文件从远端删除并移出登记表（释放项目文件配额）
+
+登记表默认保存在 outputs/cache/gemini_files.json（video.gemini_files.registry_path）。
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from agent.config import config_section
+from agent.enhancers.video_store import video_store
+from agent.llm.clients import gemini_key, upload_gemini_file, get_gemini_file, delete_gemini_file
+from agent.utils.io import write_json
+from agent.utils.key_rotator import gemini_key_pool
+
+DEFAULT_REGISTRY_PATH = os.path.join("outputs", "cache", "gemini_files.json")
+DEFAULT_TTL_SECONDS = 47 * 3600          # Gemini 文件保留 48 小时，留一小时余量
+_HASH_CHUNK = 1024 * 1024
+
+
+def key_fingerprint(api_key: str) -> str:
+    """key 的不可逆指纹，登记表中不落明文 key"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+
+def file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _expiry_epoch(file_obj: Any) -> float:
+    exp = getattr(file_obj, "expiration_time", None)
+    if isinstance(exp, datetime):
+        return exp.timestamp()
+    return time.time() + DEFAULT_TTL_SECONDS
+
+
+class GeminiFileRegistry:
+    def __init__(self, path: Optional[str] = None, reuse_margin_seconds: Optional[float] = None,
+                 purge_interval_seconds: Optional[float] = None):
+        cfg = config_section("video").get("gemini_files") or {}
+        self.path = path or cfg.get("registry_path") or DEFAULT_REGISTRY_PATH
+        # 剩余有效期不足该值的文件不再复用（避免分析途中过期）
+        self.reuse_margin = float(reuse_margin_seconds if reuse_margin_seconds is not None
+                                  else cfg.get("reuse_margin_seconds", 1800))
+        self.purge_interval = float(purge_interval_seconds if purge_interval_seconds is not None
+                                    else cfg.get("purge_interval_seconds", 600))
+        self.enabled = bool(cfg.get("reuse", True))
+        self._lock = threading.Lock()
+        self._hash_memo: Dict[Tuple[str, int, float], str] = {}
+        self._last_purge = 0.0
+
+    # ---------------- 登记表读写 ----------------
+
+    def _load(self) -> Dict[str, Any]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f) or {}
+        except Exception:
+            return {}
+
+    def _save(self, data: Dict[str, Any]) -> None:
+        write_json(self.path, data)
+
+    def content_hash(self, path: Path) -> str:
+        st = path.stat()
+        memo_key = (str(path.resolve()), st.st_size, st.st_mtime)
+        digest = self._hash_memo.get(memo_key)
+        if digest is None:
+            digest = self._hash_memo[memo_key] = file_sha256(path)
+        return digest
+
+    # ---------------- 复用 / 上传 ----------------
+
+    def _lookup(self, digest: str) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """在当前仍配置的 key 中找一个有效期足够的已上传文件"""
+        keys = {key_fingerprint(k): k for k in gemini_key_pool.keys}
+        now = time.time()
+        with self._lock:
+            entries = self._load().get(digest) or {}
+        for fp, entry in entries.items():
+            if fp in keys and entry.get("expires_at", 0) - now > self.reuse_margin:
+                return keys[fp], entry
+        return None
+
+    def _forget(self, digest: str, fp: str) -> None:
+        with self._lock:
+            data = self._load()
+            (data.get(digest) or {}).pop(fp, None)
+            if digest in data and not data[digest]:
+                data.pop(digest)
+            self._save(data)
+
+    def _remember(self, digest: str, api_key: str, file_obj: Any, path: Path) -> None:
+        with self._lock:
+            data = self._load()
+            data.setdefault(digest, {})[key_fingerprint(api_key)] = {
+                "name": file_obj.name,
+                "uri": getattr(file_obj, "uri", ""),
+                "expires_at": _expiry_epoch(file_obj),
+                "uploaded_at": time.time(),
+                "size": path.stat().st_size,
+                "source_path": str(path).replace("\\", "/"),
+            }
+            self._save(data)
+
+    def acquire(self, path: Path, api_key: Optional[str] = None) -> Tuple[str, Any]:
+        """
+        返回 (api_key, Gemini File)。命中登记表且远端仍有效时直接复用，否则上传。
+        之后的 generate 必须使用返回的 api_key。
+        """
+        path = Path(path)
+        self.maybe_purge()
+        digest = (video_store.sha_of(path) or self.content_hash(path)) if self.enabled else ""
+        if self.enabled and api_key is None:
+            found = self._lookup(digest)
+            if found is not None:
+                key, entry = found
+                try:
+                    file_obj = get_gemini_file(entry["name"], api_key=key)
+                    if file_obj.state.name != "FAILED":
+                        print(f"♻️ 复用已上传的 Gemini 文件: {entry['name']} ({path.name})")
+                        return key, file_obj
+                except Exception as e:
+                    print(f"⚠️ 登记的 Gemini 文件已失效，重新上传: {e}")
+                self._forget(digest, key_fingerprint(key))
+
+        key = gemini_key(api_key)
+        print(f"☁️ 上传到 Gemini: {path.name}")
+        file_obj = upload_gemini_file(path, api_key=key)
+        if self.enabled:
+            self._remember(digest, key, file_obj, path)
+        return key, file_obj
+
+    # ---------------- 清理 ----------------
+
+    def maybe_purge(self) -> None:
+        if time.time() - self._last_purge >= self.purge_interval:
+            self._last_purge = time.time()
+            try:
+                self.purge_expired()
+            except Exception as e:
+                print(f"⚠️ 清理过期 Gemini 文件失败: {e}")
+
+    def purge_expired(self) -> int:
+        """删除已不可复用（临近过期或对应 key 已移除）的文件，返回移除的条目数"""
+        keys = {key_fingerprint(k): k for k in gemini_key_pool.keys}
+        if not keys:
+            return 0  # key 未加载时无法判断归属，不动登记表
+        now = time.time()
+        doomed = []
+        with self._lock:
+            data = self._load()
+            for digest, entries in list(data.items()):
+                for fp, entry in list(entries.items()):
+                    if entry.get("expires_at", 0) - now <= self.reuse_margin or fp not in keys:
+                        doomed.append((fp, entry["name"]))
+                        entries.pop(fp)
+                if not entries:
+                    data.pop(digest)
+            if doomed:
+                self._save(data)
+        for fp, name in doomed:
+            if fp in keys:
+                try:
+                    delete_gemini_file(name, api_key=keys[fp])
+                except Exception:
+                    pass  # 远端可能已自动过期删除
+        if doomed:
+            print(f"🧹 已清理 {len(doomed)} 个过期的 Gemini 文件")
+        return len(doomed)
+
+
+# 全局登记表实例
+gemini_file_registry = GeminiFileRegistry()
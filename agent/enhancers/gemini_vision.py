@@ -3,49 +3,45 @@
 import os
 import re
 import time
+import asyncio
 import hashlib
 import subprocess
 import json
 from pathlib import Path
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Sequence, Tuple
 
-import google.generativeai as genai
+from agent.llm.clients import get_gemini_file
+from agent.llm.gateway import gemini_generate
 from agent.prompt.composer_json import compose_v1_json, save_v1_json
 from agent.registry.store import register_prompt
-from agent.config import Settings
+from agent.config import Settings, config_section
+from agent.enhancers.video_proxy import make_analysis_proxy
+from agent.enhancers.video_store import video_store
+from agent.enhancers.video_fingerprint import Fingerprint, compute_fingerprint, fingerprint_index
+from agent.enhancers.video_window import AnalysisWindow, plan_window, concat_segments
 
 
-def _init_gemini():
-    from agent.utils.key_rotator import get_next_gemini_key
-    gemini_key = get_next_gemini_key()
-    if not gemini_key:
-        raise ValueError("GEMINI_API_KEYS not set in .env file")
-    genai.configure(api_key=gemini_key)
+# 不超过 480p 的最好视频流 + 最小的音频流；都没有时退回最小的合流
+DEFAULT_ANALYSIS_FORMAT = "bv*[height<=480][ext=mp4]+wa[ext=m4a]/b[height<=480]/wv*+wa/w"
 
 
-_init_gemini()
+def _video_id(url: str) -> str:
+    bvid_match = re.search(r'(BV[a-zA-Z0-9_]+)', url)
+    return bvid_match.group(1) if bvid_match else hashlib.md5(url.encode()).hexdigest()[:10]
 
 
-def download_video(url: str, output_dir: str = "outputs/videos") -> Path:
-    """使用 yt-dlp 下载视频，并返回文件路径"""
-    # ... (此函数保持不变)
-    print(f"📥 准备下载视频: {url}")
-    output_path = Path(output_dir)
-    output_path.mkdir(parents=True, exist_ok=True)
-    bvid_match = re.search(r'(BV[a-zA-Z0-9_]+)', url)
-    bvid = bvid_match.group(1) if bvid_match else hashlib.md5(url.encode()).hexdigest()[:10]
-    video_file = output_path / f"{bvid}.mp4"
-    if video_file.exists() and video_file.stat().st_size > 1024 * 10:
-        print(f"✅ 视频已存在: {video_file}")
-        return video_file
+def _yt_dlp_headers() -> list:
     bili_cookie = os.getenv("BILI_COOKIE", "")
-    command = ["yt-dlp", "-f", "bestvideo[ext=mp4]+bestaudio[ext=m4a]/best", "--merge-output-format", "mp4",
-               "--add-header", f"Cookie:{bili_cookie}", "--add-header", "Referer:https://www.bilibili.com/", "--output",
-               str(video_file), url]
+    return ["--add-header", f"Cookie:{bili_cookie}", "--add-header", "Referer:https://www.bilibili.com/"]
+
+
+def _run_yt_dlp(url: str, output: Path, extra: Sequence[str] = ()) -> None:
+    # 只为分析下载：取满足最低清晰度要求的最小流，而不是最高画质
+    fmt = (config_section("video").get("download") or {}).get("format", DEFAULT_ANALYSIS_FORMAT)
+    command = ["yt-dlp", "-f", fmt, "--merge-output-format", "mp4", *extra, *_yt_dlp_headers(),
+               "--output", str(output), url]
     try:
         subprocess.run(command, check=True, capture_output=True, text=True)
-        print(f"✅ 视频下载成功: {video_file}")
-        return video_file
     except subprocess.CalledProcessError as e:
         print(f"❌ 视频下载失败. yt-dlp 报错:\n--- \n{e.stderr}\n---")
         raise RuntimeError(f"无法下载视频: {url}")
@@ -53,49 +49,215 @@ def download_video(url: str, output_dir: str = "outputs/videos") -> Path:
         raise RuntimeError("找不到 yt-dlp 命令。请确保已安装。")
 
 
-def analyze_video_and_generate_prompt(hotspot: Dict[str, Any], series: str) -> Dict[str, Any]:
-    video_url = hotspot.get("url")
-    if not video_url:
-        raise ValueError("热点数据缺少 'url' 字段")
+def _download_native(bvid: str, video_file: Path) -> bool:
+    """优先用原生 DASH 并发下载器；未开启或失败时返回 False，由 yt-dlp 兜底"""
+    if not (config_section("video").get("download") or {}).get("native", True):
+        return False
+    from agent.collectors.bili_dash import download_bilibili_dash
+    try:
+        download_bilibili_dash(bvid, video_file)
+        return True
+    except Exception as e:
+        # 保留 .part / .part.json：yt-dlp 也失败时，下次下载从断点续传
+        print(f"⚠️ 原生 DASH 下载失败，回退到 yt-dlp: {e}")
+        return False
+
+
+def probe_duration(url: str) -> Optional[float]:
+    """不下载，只取视频时长（秒）"""
+    try:
+        out = subprocess.run(["yt-dlp", "--skip-download", "--print", "duration", *_yt_dlp_headers(), url],
+                             check=True, capture_output=True, text=True, timeout=60).stdout.strip()
+        return float(out.splitlines()[-1])
+    except Exception:
+        return None
 
-    video_path = download_video(video_url)
-    print(f"🧠 正在使用 Gemini 分析视频: {video_path.name}...")
-    model = genai.GenerativeModel('models/gemini-2.5-flash')
 
-    video_file_obj = genai.upload_file(path=video_path)
+def source_duration(url: str) -> Optional[float]:
+    """
+    源视频时长：先查视频存储里记下的；B 站视频其次用 view 接口（原生下载本来就要请求，结果在进程内复用），
+    最后才用 yt-dlp 探测。查到的时长记入存储，再次分析同一视频时不再联网。
+    """
+    vid = _video_id(url)
+    duration = video_store.duration(vid)
+    if duration:
+        return duration
+    if vid.startswith("BV"):
+        from agent.collectors.bili_dash import video_duration
+        duration = video_duration(vid)
+    duration = duration or probe_duration(url)
+    if duration:
+        video_store.remember_duration(vid, duration)
+    return duration
 
-    prompt_text = f'''
+
+def download_video(url: str, output_dir: str = "outputs/videos", window: Optional[AnalysisWindow] = None) -> Path:
+    """
+    下载视频（指定 window 时只下载窗口内的片段并拼接）到受管视频存储，并返回文件路径。
+    下载先写临时文件，校验完整后才原子入库；output_dir 下的旧版 <bvid>.mp4 会被收编。
+    """
+    print(f"📥 准备下载视频: {url}")
+    bvid = _video_id(url)
+    key = f"{bvid}.w{window.tag}" if window else bvid
+    with video_store.key_lock(key):
+        cached = video_store.lookup(key)
+        if cached is not None:
+            print(f"✅ 视频已存在: {cached}")
+            return cached
+
+        tmp_file = video_store.temp_path(key)
+        legacy = Path(output_dir) / f"{bvid}.mp4"
+        if window is None and legacy.exists() and legacy.stat().st_size > 1024 * 10:
+            os.replace(legacy, tmp_file)
+            try:
+                return video_store.commit(key, tmp_file, source_url=url)
+            except RuntimeError:
+                pass  # 旧文件不完整，重新下载
+
+        if window is None:
+            if not (bvid.startswith("BV") and _download_native(bvid, tmp_file)):
+                tmp_file.unlink(missing_ok=True)   # yt-dlp 会把已存在的同名文件当成下载完成
+                _run_yt_dlp(url, tmp_file)
+                # yt-dlp 兜底成功后断点不再有用
+                from agent.collectors.bili_dash import cleanup_dash_artifacts
+                cleanup_dash_artifacts(tmp_file)
+        else:
+            segments = []
+            try:
+                for i, (start, end) in enumerate(window.ranges):
+                    seg_file = tmp_file.with_name(f"{tmp_file.stem}.seg{i}.mp4")
+                    seg_file.unlink(missing_ok=True)
+                    _run_yt_dlp(url, seg_file, ["--download-sections", f"*{start:.0f}-{end:.0f}"])
+                    segments.append(seg_file)
+                concat_segments(segments, tmp_file)
+            finally:
+                for seg_file in segments:
+                    seg_file.unlink(missing_ok=True)
+        video_file = video_store.commit(key, tmp_file, source_url=url, kind="window" if window else "source")
+    print(f"✅ 视频下载成功: {video_file}")
+    return video_file
+
+
+ANALYSIS_PROMPT_TMPL = '''
     Analyze the provided video. Return a JSON object with three keys: "english_description", "chinese_title", and "video_summary".
     - "english_description": A rich, descriptive paragraph in English about the video's visual elements.
     - "chinese_title": A short, descriptive, filename-friendly title in Chinese, under 15 characters.
     - "video_summary": A concise, one-sentence summary of the video's content in Chinese.
-    Original video title for context: "{hotspot.get('title', 'N/A')}"
+    Original video title for context: "{title}"
     '''
 
-    print("⏳ 等待 Gemini 文件处理完成...")
-    while video_file_obj.state.name == "PROCESSING":
-        time.sleep(5)
-        video_file_obj = genai.get_file(video_file_obj.name)
 
-    if video_file_obj.state.name == "FAILED":
+def _poll_delays():
+    """处理状态轮询的退避序列：从 initial 开始按 factor 增长，封顶 max"""
+    cfg = config_section("video").get("poll") or {}
+    delay = float(cfg.get("initial_seconds", 1.0))
+    while True:
+        yield delay
+        delay = min(delay * float(cfg.get("factor", 1.5)), float(cfg.get("max_seconds", 8.0)))
+
+
+def _poll_timeout() -> float:
+    return float((config_section("video").get("poll") or {}).get("timeout_seconds", 600))
+
+
+# ---------------- 分析阶段（供顺序调用与流水线复用） ----------------
+
+def prepare_analysis_video(url: str, duration: Optional[float] = None) -> Tuple[Path, Dict[str, Any]]:
+    """
+    下载（长视频只取分析窗口）并生成分析代理，返回 (上传用视频路径, 写入 Prompt meta 的附加信息)。
+    duration 未知时经 source_duration 获取（已记录的时长不再联网）。
+    """
+    if not duration and (config_section("video").get("window") or {}).get("mode", "segments") != "full":
+        duration = source_duration(url)
+    window = plan_window(duration)
+    source = download_video(url, window=window)
+    proxy, proxy_info = make_analysis_proxy(source)
+    extra_meta: Dict[str, Any] = {"analysis_proxy": proxy_info}
+    extra_meta["analysis_window"] = window.to_meta() if window else {"mode": "full", "source_duration": duration}
+    return proxy, extra_meta
+
+
+def upload_video(video_path: Path) -> Tuple[str, Any]:
+    """返回 (api_key, Gemini File)：有效期内上传过的同内容视频直接复用，否则上传"""
+    from agent.enhancers.gemini_files import gemini_file_registry
+    return gemini_file_registry.acquire(video_path)
+
+
+def _check_active(video_file_obj) -> bool:
+    state = video_file_obj.state.name
+    if state == "FAILED":
         raise ValueError(f"Gemini 文件处理失败: {video_file_obj.state}")
-    print("\n✅ Gemini 文件处理完成，状态: ACTIVE")
+    return state != "PROCESSING"
+
+
+def wait_until_active(video_file_obj, api_key: str):
+    """同步等待 Gemini 文件处理完成（指数退避轮询）"""
+    deadline = time.monotonic() + _poll_timeout()
+    delays = _poll_delays()
+    while not _check_active(video_file_obj):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Gemini 文件处理超时: {video_file_obj.name}")
+        time.sleep(next(delays))
+        video_file_obj = get_gemini_file(video_file_obj.name, api_key=api_key)
+    return video_file_obj
+
 
-    response = model.generate_content([prompt_text, video_file_obj],
-                                      generation_config={"response_mime_type": "application/json"})
+async def await_until_active(video_file_obj, api_key: str):
+    """wait_until_active 的异步版本：轮询间隔不占用线程"""
+    deadline = time.monotonic() + _poll_timeout()
+    delays = _poll_delays()
+    while not _check_active(video_file_obj):
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"Gemini 文件处理超时: {video_file_obj.name}")
+        await asyncio.sleep(next(delays))
+        video_file_obj = await asyncio.to_thread(get_gemini_file, video_file_obj.name, api_key)
+    return video_file_obj
+
+
+def describe_video(video_file_obj, hotspot: Dict[str, Any], api_key: str) -> Dict[str, Any]:
+    """让 Gemini 描述已处理完成的视频，返回解析后的 JSON（失败时带 error 字段）"""
+    prompt_text = ANALYSIS_PROMPT_TMPL.format(title=hotspot.get('title', 'N/A'))
+    response_text = gemini_generate([prompt_text, video_file_obj], model='models/gemini-2.5-flash',
+                                    call_site="analyze_video", api_key=api_key,
+                                    generation_config={"response_mime_type": "application/json"})
 
     # --- 这里是关键的健壮性修改 ---
     try:
-        gemini_result = json.loads(response.text)
+        return json.loads(response_text)
     except json.JSONDecodeError as e:
         print(f"❌ Gemini 返回的不是有效的JSON！错误: {e}")
         print("--- Gemini 原始回复 ---")
-        print(response.text)
+        print(response_text)
         print("-----------------------")
         # 返回一个清晰的错误信息，而不是让整个工具崩溃
-        return {"error": "Gemini did not return valid JSON.", "raw_response": response.text}
+        return {"error": "Gemini did not return valid JSON.", "raw_response": response_text}
     # ---------------------------
 
+
+def find_prior_analysis(video_path: Path, extra_meta: Dict[str, Any]) -> Tuple[Optional[Fingerprint], Optional[Dict[str, Any]]]:
+    """计算感知指纹并查找近似视频（重新上传）的已有分析结果"""
+    duration = (extra_meta.get("analysis_window") or {}).get("source_duration")
+    fp = compute_fingerprint(video_path, duration)
+    if fp is None:
+        return None, None
+    prior = fingerprint_index.find(fp)
+    if prior is not None:
+        print(f"♻️ 与已分析视频 {prior['video_key']} 近似（平均汉明距离 {prior['distance']}），复用分析结果")
+        extra_meta["reused_analysis"] = {k: prior[k] for k in ("video_key", "source_url", "distance")}
+    return fp, prior
+
+
+def remember_analysis(fp: Optional[Fingerprint], video_url: str, gemini_result: Dict[str, Any]) -> None:
+    if fp is not None and "error" not in gemini_result:
+        fingerprint_index.add(fp, _video_id(video_url), video_url, gemini_result)
+
+
+def compose_from_analysis(gemini_result: Dict[str, Any], series: str,
+                          extra_meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """根据 Gemini 分析结果生成并登记 v1 Prompt；extra_meta 合并进 Prompt 的 meta"""
+    if "error" in gemini_result:
+        return gemini_result
+
     english_description = gemini_result.get("english_description", "No description provided.")
     chinese_title = gemini_result.get("chinese_title", "未命名视频")
     video_summary = gemini_result.get("video_summary", "无摘要信息。")
@@ -111,9 +273,33 @@ def analyze_video_and_generate_prompt(hotspot: Dict[str, Any], series: str) -> D
         chinese_name=chinese_title
     )
     prompt_obj["meta"]["video_summary"] = video_summary
+    prompt_obj["meta"].update(extra_meta or {})
 
     saved_path = save_v1_json(prompt_obj)
     register_prompt(prompt_obj, saved_path, status="ready")
     print(f"🚀 已根据 Gemini 分析结果生成 v1 Prompt: {saved_path}")
 
-    return {"saved_path": saved_path, "prompt_content": prompt_obj, "video_summary": video_summary}
\ No newline at end of file
+    return {"saved_path": saved_path, "prompt_content": prompt_obj, "video_summary": video_summary}
+
+
+def analyze_video_and_generate_prompt(hotspot: Dict[str, Any], series: str) -> Dict[str, Any]:
+    """单个热点的顺序分析；多个热点请用 agent.enhancers.video_pipeline.analyze_hotspots"""
+    video_url = hotspot.get("url")
+    if not video_url:
+        raise ValueError("热点数据缺少 'url' 字段")
+
+    video_path, extra_meta = prepare_analysis_video(video_url, hotspot.get("duration"))
+    fp, prior = find_prior_analysis(video_path, extra_meta)
+    if prior is not None:
+        return compose_from_analysis(prior["analysis"], series, extra_meta)
+
+    print(f"🧠 正在使用 Gemini 分析视频: {video_path.name}...")
+    # 上传与生成必须使用同一个 key（文件归属于 key 所在的项目）
+    api_key, video_file_obj = upload_video(video_path)
+    print("⏳ 等待 Gemini 文件处理完成...")
+    video_file_obj = wait_until_active(video_file_obj, api_key)
+    print("\n✅ Gemini 文件处理完成，状态: ACTIVE")
+
+    gemini_result = describe_video(video_file_obj, hotspot, api_key)
+    remember_analysis(fp, video_url, gemini_result)
+    return compose_from_analysis(gemini_result, series, extra_meta)
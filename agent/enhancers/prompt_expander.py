@@ -1,28 +1,47 @@
 # agent/enhancers/prompt_expander.py (最终稳定版)
 # -*- coding: utf-8 -*-
+"""
+作用：
+  对一个基础 Prompt 做 N 次创意扩展。两种模式：
+  - concurrent：每个变体一次调用，并行提交，实际并发由 LLM 网关的限流器约束
+  - batched：一次调用让模型返回包含 N 个变体的 JSON 数组，基础 Prompt 只发送一次
+  每个变体都用 VideoPromptJSON 校验，不合格的丢弃；全部完成后一次性写入索引。
+  batched 模式返回的合格变体不足 N 个时，缺口用 concurrent 模式补齐。
+  与基础 Prompt 或已接受的兄弟变体近重复的（见 agent/prompt/similarity.py）会被拒绝，
+  并带着“避开这些概念”的提示重新生成，最多 prompt.dedup.max_regenerations 轮。
+"""
+import contextvars
 import os
 import re
 import json
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Dict, Any, Optional
 
-import google.generativeai as genai
+from agent.llm.gateway import gemini_generate, PRIORITY_LOW
 from agent.interactive.refiner import _read_json
-from agent.registry.store import register_prompt
-from agent.utils.io import write_json, ensure_dir
-
-
-def _init_gemini():
-    from agent.utils.key_rotator import get_next_gemini_key
-    gemini_key = get_next_gemini_key()
-    if not gemini_key:
-        raise ValueError("GEMINI_API_KEYS not set in .env file")
-    genai.configure(api_key=gemini_key)
-
-
-_init_gemini()
+from agent.prompt.schema_json import VideoPromptJSON
+from agent.prompt.similarity import dedup_cfg, find_near_duplicate
+from agent.registry.store import register_prompts
+from agent.utils.io import write_json
+
+EXPAND_MODEL = 'models/gemini-2.5-flash'
+EXPAND_MODES = ("concurrent", "batched")
+
+
+def _avoid_section(avoid: Optional[List[str]]) -> str:
+    if not avoid:
+        return ""
+    listed = "\n".join(f"- {c}" for c in avoid)
+    return f"""
+# AVOID
+The following concepts are already taken. Your variation must be clearly different from ALL of them
+(a synonym swap or reworded sentence is NOT enough):
+{listed}
+"""
 
 
-def _construct_expansion_prompt(base_prompt_str: str, user_hint: Optional[str] = None) -> str:
+def _construct_expansion_prompt(base_prompt_str: str, user_hint: Optional[str] = None,
+                                avoid: Optional[List[str]] = None) -> str:
     common_instructions =f"""
 You are a controlled prompt editor. Your task is to generate ONE subtle variation of the following JSON prompt.
 
@@ -40,7 +59,7 @@ You are a controlled prompt editor. Your task is to generate ONE subtle variatio
 
 BASE PROMPT:
 {base_prompt_str}
-"""
+{_avoid_section(avoid)}"""
 
     if user_hint:
         return f'''{common_instructions}
@@ -54,51 +73,165 @@ BASE PROMPT:
         '''
 
 
+def _construct_batch_prompt(base_prompt_str: str, n: int, user_hint: Optional[str] = None) -> str:
+    single = _construct_expansion_prompt(base_prompt_str, user_hint)
+    return f'''{single}
+
+# BATCH
+Instead of ONE variation, generate {n} variations that are clearly different from each other
+(each one must follow all the rules above on its own).
+Return ONLY a JSON object of the form {{"variants": [<variation 1>, ..., <variation {n}>]}}
+containing exactly {n} full JSON prompts with the same structure as the BASE PROMPT.
+'''
+
+
+def _parse_variants(response_text: str) -> List[Dict[str, Any]]:
+    data = json.loads(response_text)
+    if isinstance(data, dict):
+        data = data.get("variants", [data])
+    return [v for v in data if isinstance(v, dict)] if isinstance(data, list) else []
+
+
+def _finalize_variant(obj: Dict[str, Any], name: str) -> Dict[str, Any]:
+    """改名并按 VideoPromptJSON 校验；不合格时抛 ValidationError"""
+    obj["name"] = name
+    VideoPromptJSON.model_validate(obj)
+    return obj
+
+
+def _generate_one(prompt_text: str, variant: int) -> Dict[str, Any]:
+    response_text = gemini_generate(
+        prompt_text,
+        model=EXPAND_MODEL,
+        call_site="expand_prompt",
+        generation_config={"response_mime_type": "application/json"},
+        priority=PRIORITY_LOW,
+        variant=variant
+    )
+    variants = _parse_variants(response_text)
+    if not variants:
+        raise ValueError("模型未返回 JSON 对象")
+    return variants[0]
+
+
+def _expand_concurrent(base_prompt_str: str, indices: List[int], user_hint: Optional[str],
+                       names: Dict[int, str], attempt: int = 0,
+                       avoid: Optional[List[str]] = None) -> Dict[int, Dict[str, Any]]:
+    """每个变体一次调用，并行提交（并发上限由网关限流器决定）"""
+    prompt_text = _construct_expansion_prompt(base_prompt_str, user_hint, avoid)
+    results: Dict[int, Dict[str, Any]] = {}
+    if not indices:
+        return results
+    with ThreadPoolExecutor(max_workers=len(indices), thread_name_prefix="expand") as pool:
+        # 复制 contextvars，保证调用指标记到当前请求名下
+        # 重新生成时换一个 variant 编号，避免命中缓存 / 合并到同一次调用
+        futures = {i: pool.submit(contextvars.copy_context().run, _generate_one, prompt_text,
+                                  attempt * len(names) + i) for i in indices}
+        for i, fut in futures.items():
+            try:
+                results[i] = _finalize_variant(fut.result(), names[i])
+            except Exception as e:
+                print(f"  - ❌ 生成第 {i + 1} 个变体时失败: {e}")
+    return results
+
+
+def _expand_batched(base_prompt_str: str, indices: List[int], user_hint: Optional[str],
+                    names: Dict[int, str]) -> Dict[int, Dict[str, Any]]:
+    """一次调用返回 N 个变体"""
+    results: Dict[int, Dict[str, Any]] = {}
+    try:
+        response_text = gemini_generate(
+            _construct_batch_prompt(base_prompt_str, len(indices), user_hint),
+            model=EXPAND_MODEL,
+            call_site="expand_prompt",
+            generation_config={"response_mime_type": "application/json"},
+            priority=PRIORITY_LOW
+        )
+        variants = _parse_variants(response_text)
+    except Exception as e:
+        print(f"  - ❌ 批量生成变体失败: {e}")
+        return results
+    pending = list(indices)
+    for k, obj in enumerate(variants):
+        if not pending:
+            break
+        try:
+            results[pending[0]] = _finalize_variant(obj, names[pending[0]])
+            pending.pop(0)
+        except Exception as e:
+            print(f"  - ❌ 批量结果中第 {k + 1} 个变体不合格: {e}")
+    return results
+
+
 def expand_prompt(
         prompt_path: str,
         num_expansions: int,
-        user_hint: Optional[str] = None
+        user_hint: Optional[str] = None,
+        mode: str = "concurrent"
 ) -> List[Dict[str, Any]]:
     """
     对一个基础Prompt进行N次创意扩展。
+    mode: concurrent（并行逐个生成）/ batched（一次调用生成 N 个）
     """
-    print(f"🚀 开始创意扩展任务，基础Prompt: {prompt_path}, 扩展数量: {num_expansions}")
+    if mode not in EXPAND_MODES:
+        raise ValueError(f"未知的扩展模式: {mode}（可选: {', '.join(EXPAND_MODES)}）")
+    print(f"🚀 开始创意扩展任务，基础Prompt: {prompt_path}, 扩展数量: {num_expansions}, 模式: {mode}")
     base_prompt_obj = _read_json(prompt_path)
     base_prompt_str = json.dumps(base_prompt_obj, ensure_ascii=False, indent=2)
 
-    model = genai.GenerativeModel('models/gemini-2.5-flash')
+    # --- 文件名处理 ---
+    original_name_stem = re.sub(r'_v\d+$', '', base_prompt_obj.get("name", "untitled"))
+    names = {i: f"{original_name_stem}_expanded_{i + 1}" for i in range(num_expansions)}
+    indices = list(range(num_expansions))
+
+    cfg = dedup_cfg()
+    dedup = bool(cfg.get("enabled", True))
+    rounds = 1 + (max(0, int(cfg.get("max_regenerations", 2))) if dedup else 0)
+    accepted: Dict[int, Dict[str, Any]] = {}
+    references = [("base", base_prompt_obj)]
+    pending = indices
+    for attempt in range(rounds):
+        if attempt == 0 and mode == "batched":
+            variants = _expand_batched(base_prompt_str, pending, user_hint, names)
+            missing = [i for i in pending if i not in variants]
+            if missing:
+                print(f"  - ⚠️ 批量结果缺少 {len(missing)} 个合格变体，改为并行补齐")
+                variants.update(_expand_concurrent(base_prompt_str, missing, user_hint, names))
+        elif attempt == 0:
+            variants = _expand_concurrent(base_prompt_str, pending, user_hint, names)
+        else:
+            print(f"  - 🔁 第 {attempt} 轮重新生成 {len(pending)} 个变体")
+            avoid = [str((obj.get("prompt") or {}).get("concept", "")) for _, obj in references]
+            variants = _expand_concurrent(base_prompt_str, pending, user_hint, names, attempt=attempt,
+                                          avoid=[c for c in avoid if c])
+
+        for i in sorted(variants):
+            dup = find_near_duplicate(variants[i], references, cfg) if dedup else None
+            if dup is not None:
+                label, sim = dup
+                print(f"  - ♻️ 第 {i + 1} 个变体与 {label} 近重复（相似度 {sim.score:.2f}，"
+                      f"改动字段 {len(sim.changed_fields)} 个），已拒绝")
+                continue
+            accepted[i] = variants[i]
+            references.append((names[i], variants[i]))
+        pending = [i for i in indices if i not in accepted]
+        if not pending:
+            break
+    if pending and dedup:
+        print(f"  - ⚠️ 仍有 {len(pending)} 个变体未能生成合格且不重复的结果，已跳过")
+    variants = accepted
+
+    # --- 保存与批量注册 ---
     generated_prompts = []
-
-    for i in range(num_expansions):
-        print(f"  - 正在生成第 {i + 1}/{num_expansions} 个变体...")
-        prompt_text = _construct_expansion_prompt(base_prompt_str, user_hint)
-
-        try:
-            response = model.generate_content(
-                prompt_text,
-                generation_config={"response_mime_type": "application/json"}
-            )
-            new_prompt_obj = json.loads(response.text)
-
-            # --- 文件名处理 ---
-            original_name_stem = re.sub(r'_v\d+$', '', base_prompt_obj.get("name", "untitled"))
-            new_name = f"{original_name_stem}_expanded_{i + 1}"
-            new_prompt_obj["name"] = new_name
-
-            # --- 保存与注册 ---
-            save_path = os.path.join("prompts", "generated", f"{new_name}.json")
-            ensure_dir(os.path.dirname(save_path))
-            write_json(save_path, new_prompt_obj)
-            register_prompt(new_prompt_obj, save_path, status="ready")
-
-            generated_prompts.append({
-                "saved_path": save_path,
-                "prompt_content": new_prompt_obj
-            })
-            print(f"  - ✅ 已保存变体: {save_path}")
-
-        except Exception as e:
-            print(f"  - ❌ 生成第 {i + 1} 个变体时失败: {e}")
-            continue
-
-    return generated_prompts
\ No newline at end of file
+    for i in sorted(variants):
+        new_prompt_obj = variants[i]
+        save_path = os.path.join("prompts", "generated", f"{names[i]}.json")
+        write_json(save_path, new_prompt_obj)
+        generated_prompts.append({
+            "saved_path": save_path,
+            "prompt_content": new_prompt_obj
+        })
+        print(f"  - ✅ 已保存变体: {save_path}")
+    register_prompts([(g["prompt_content"], g["saved_path"]) for g in generated_prompts], status="ready")
+
+    return generated_prompts
@@ -0,0 +1,175 @@
+# agent/enhancers/video_fingerprint.py
+# -*- coding: utf-8 -*-
+"""
+agent/enhancers/video_fingerprint.py
+===========================================================
+作用：
+  视频感知指纹，用于识别“换了 BV 号的重新上传”，复用之前的 Gemini 分析结果。
+  - 指纹 = 时长 + 沿时间轴均匀抽取的 K 帧的 pHash（32x32 灰度 → DCT → 8x8 低频 → 与中位数比较得 64 位）
+  - 比较：时长在容差内，且逐帧（允许相邻一帧的错位）平均汉明距离不超过阈值
+  - 索引（SQLite）：按时长建索引，查询时先用时长区间筛出少量候选，再逐个比较帧哈希
+
+抽帧依赖 ffmpeg，DCT 依赖 numpy；任一缺失时指纹功能自动关闭。
+配置见 config/default.yaml 的 video.fingerprint 段。
+"""
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from agent.config import config_section
+
+FRAME_SIZE = 32
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    video_key TEXT,
+    source_url TEXT,
+    duration REAL NOT NULL,
+    hashes TEXT NOT NULL,
+    analysis TEXT NOT NULL,
+    created_at REAL NOT NULL
+)
+"""
+
+
+def _fp_cfg() -> Dict[str, Any]:
+    return config_section("video").get("fingerprint") or {}
+
+
+@dataclass
+class Fingerprint:
+    duration: float
+    hashes: List[int]
+
+    def distance(self, other: "Fingerprint") -> float:
+        """逐帧平均汉明距离；允许相邻一帧的错位（片头长度略有差异）"""
+        if not self.hashes or not other.hashes:
+            return 64.0
+        n = min(len(self.hashes), len(other.hashes))
+        total = 0
+        for i in range(n):
+            total += min(bin(self.hashes[i] ^ other.hashes[j]).count("1")
+                         for j in (i - 1, i, i + 1) if 0 <= j < n)
+        return total / n
+
+
+# ---------------- 计算 ----------------
+
+def _probe_duration(path: Path) -> Optional[float]:
+    try:
+        out = subprocess.run(["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0",
+                              str(path)], capture_output=True, text=True, timeout=30)
+        return float(out.stdout.strip())
+    except Exception:
+        return None
+
+
+def _dct_matrix(n: int):
+    import numpy as np
+    k = np.arange(n)[:, None]
+    x = np.arange(n)[None, :]
+    m = np.cos(np.pi * (2 * x + 1) * k / (2 * n))
+    m[0] *= 1 / np.sqrt(2)
+    return m * np.sqrt(2 / n)
+
+
+def phash(frame) -> int:
+    """32x32 灰度帧的 64 位 pHash"""
+    import numpy as np
+    d = _dct_matrix(FRAME_SIZE)
+    low = (d @ frame.astype(np.float64) @ d.T)[:8, :8].flatten()
+    median = np.median(low[1:])
+    bits = 0
+    for v in low:
+        bits = (bits << 1) | int(v > median)
+    return bits
+
+
+def compute_fingerprint(path: Path, duration: Optional[float] = None) -> Optional[Fingerprint]:
+    """抽取 K 帧计算指纹；ffmpeg / numpy 不可用或抽帧失败时返回 None"""
+    cfg = _fp_cfg()
+    if not cfg.get("enabled", True) or not shutil.which("ffmpeg"):
+        return None
+    try:
+        import numpy as np
+    except ImportError:
+        return None
+    clip_duration = _probe_duration(path)
+    if not clip_duration:
+        return None
+    k = int(cfg.get("frames", 16))
+    vf = f"fps={k / clip_duration:.6f},scale={FRAME_SIZE}:{FRAME_SIZE},format=gray"
+    try:
+        raw = subprocess.run(["ffmpeg", "-v", "error", "-i", str(path), "-vf", vf, "-frames:v", str(k),
+                              "-f", "rawvideo", "-"], capture_output=True, check=True, timeout=120).stdout
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+        return None
+    n = len(raw) // (FRAME_SIZE * FRAME_SIZE)
+    if n == 0:
+        return None
+    frames = np.frombuffer(raw[:n * FRAME_SIZE * FRAME_SIZE], dtype=np.uint8).reshape(n, FRAME_SIZE, FRAME_SIZE)
+    return Fingerprint(duration=float(duration or clip_duration), hashes=[phash(f) for f in frames])
+
+
+# ---------------- 索引 ----------------
+
+class FingerprintIndex:
+    def __init__(self, path: Optional[str] = None):
+        cfg = _fp_cfg()
+        self.path = path or cfg.get("index_path") or os.path.join("outputs", "cache", "video_fingerprints.sqlite3")
+        self.max_hamming = float(cfg.get("max_hamming", 10))
+        self.tol_seconds = float(cfg.get("duration_tolerance_seconds", 2.0))
+        self.tol_ratio = float(cfg.get("duration_tolerance_ratio", 0.03))
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            d = os.path.dirname(self.path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_fp_duration ON fingerprints(duration)")
+            self._conn = conn
+        return self._conn
+
+    def find(self, fp: Fingerprint) -> Optional[Dict[str, Any]]:
+        """返回最相近且在阈值内的已分析视频：{"video_key", "source_url", "distance", "analysis"}"""
+        tol = max(self.tol_seconds, fp.duration * self.tol_ratio)
+        with self._lock:
+            rows = self._db().execute(
+                "SELECT video_key, source_url, hashes, analysis, duration FROM fingerprints"
+                " WHERE duration BETWEEN ? AND ?", (fp.duration - tol, fp.duration + tol)).fetchall()
+        best: Optional[Tuple[float, Any]] = None
+        for video_key, source_url, hashes, analysis, duration in rows:
+            other = Fingerprint(duration=duration, hashes=[int(h, 16) for h in hashes.split(",") if h])
+            dist = fp.distance(other)
+            if dist <= self.max_hamming and (best is None or dist < best[0]):
+                best = (dist, (video_key, source_url, analysis))
+        if best is None:
+            return None
+        video_key, source_url, analysis = best[1]
+        return {"video_key": video_key, "source_url": source_url, "distance": round(best[0], 2),
+                "analysis": json.loads(analysis)}
+
+    def add(self, fp: Fingerprint, video_key: str, source_url: str, analysis: Dict[str, Any]) -> None:
+        with self._lock:
+            self._db().execute(
+                "INSERT INTO fingerprints (video_key, source_url, duration, hashes, analysis, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (video_key, source_url, fp.duration, ",".join(f"{h:016x}" for h in fp.hashes),
+                 json.dumps(analysis, ensure_ascii=False), time.time()))
+            self._db().commit()
+
+
+# 全局指纹索引实例
+fingerprint_index = FingerprintIndex()
@@ -0,0 +1,83 @@
+# agent/enhancers/video_pipeline.py
+# -*- coding: utf-8 -*-
+"""
+agent/enhancers/video_pipeline.py
+===========================================================
+作用：
+  多个热点的并行 Gemini 视频分析流水线。
+  每个热点依次经过：下载 → 上传 → 等待处理（异步退避轮询）→ Gemini 描述 → DeepSeek 组装 Prompt，
+  各阶段有独立的并发上限，不同热点的阶段互相重叠：
+  一个视频在下载的同时，另一个在上传，第三个在分析。
+  N 个热点的总耗时接近其中最慢的单个视频，而不是 N 倍。
+
+并发上限见 config/default.yaml 的 video.pipeline 段。
+"""
+import asyncio
+from typing import Any, Dict, List
+
+from agent.config import config_section
+from agent.enhancers.gemini_vision import (
+    prepare_analysis_video, upload_video, await_until_active, describe_video, compose_from_analysis,
+    find_prior_analysis, remember_analysis,
+)
+
+
+class VideoAnalysisPipeline:
+    def __init__(self, download: int = 3, upload: int = 3, generate: int = 4):
+        self._download = asyncio.Semaphore(download)
+        self._upload = asyncio.Semaphore(upload)
+        self._generate = asyncio.Semaphore(generate)
+
+    @classmethod
+    def from_config(cls) -> "VideoAnalysisPipeline":
+        cfg = config_section("video").get("pipeline") or {}
+        return cls(download=int(cfg.get("download_concurrency", 3)),
+                   upload=int(cfg.get("upload_concurrency", 3)),
+                   generate=int(cfg.get("generate_concurrency", 4)))
+
+    async def process(self, hotspot: Dict[str, Any], series: str) -> Dict[str, Any]:
+        video_url = hotspot.get("url")
+        if not video_url:
+            raise ValueError("热点数据缺少 'url' 字段")
+
+        # 下载阶段包含生成低分辨率分析代理与感知指纹查重
+        async with self._download:
+            video_path, extra_meta = await asyncio.to_thread(prepare_analysis_video, video_url,
+                                                             hotspot.get("duration"))
+            fp, prior = await asyncio.to_thread(find_prior_analysis, video_path, extra_meta)
+        if prior is not None:
+            # 重新上传的视频：跳过上传与 Gemini 分析
+            return await asyncio.to_thread(compose_from_analysis, prior["analysis"], series, extra_meta)
+
+        # 上传与生成必须使用同一个 key（文件归属于 key 所在的项目）；已上传过的同内容视频直接复用
+        async with self._upload:
+            api_key, video_file_obj = await asyncio.to_thread(upload_video, video_path)
+
+        # 等待处理不占用任何阶段名额
+        video_file_obj = await await_until_active(video_file_obj, api_key)
+        print(f"✅ Gemini 文件处理完成: {video_path.name}")
+
+        async with self._generate:
+            gemini_result = await asyncio.to_thread(describe_video, video_file_obj, hotspot, api_key)
+        await asyncio.to_thread(remember_analysis, fp, video_url, gemini_result)
+        return await asyncio.to_thread(compose_from_analysis, gemini_result, series, extra_meta)
+
+    async def run(self, hotspots: List[Dict[str, Any]], series: str) -> List[Dict[str, Any]]:
+        """按输入顺序返回每个热点的结果；单个热点失败时该位置为 {"error": ..., "hotspot": ...}"""
+        async def one(h: Dict[str, Any]) -> Dict[str, Any]:
+            try:
+                return await self.process(h, series)
+            except Exception as e:
+                print(f"❌ 处理热点 '{h.get('title')}' 时发生错误: {e}")
+                return {"error": str(e), "hotspot": h}
+
+        return list(await asyncio.gather(*(one(h) for h in hotspots)))
+
+
+async def analyze_hotspots_async(hotspots: List[Dict[str, Any]], series: str) -> List[Dict[str, Any]]:
+    return await VideoAnalysisPipeline.from_config().run(hotspots, series)
+
+
+def analyze_hotspots(hotspots: List[Dict[str, Any]], series: str) -> List[Dict[str, Any]]:
+    """同步入口（LangGraph 节点等非异步调用方使用）"""
+    return asyncio.run(analyze_hotspots_async(hotspots, series))
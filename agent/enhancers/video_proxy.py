@@ -0,0 +1,87 @@
+# agent/enhancers/video_proxy.py
+# -*- coding: utf-8 -*-
+"""
+agent/enhancers/video_proxy.py
+===========================================================
+作用：
+  为 Gemini 分析生成低分辨率“分析代理”视频。
+  Gemini 只需要看清画面内容并给出文字描述（且按约 1fps 抽帧），
+  因此用 ffmpeg 把分辨率 / 帧率 / 码率压到上限以内，保留音轨（ASMR 类内容依赖声音），
+  大幅减少上传与 PROCESSING 耗时。
+  - 找不到 ffmpeg、转码失败或代理反而更大时，直接使用原视频
+  - 返回的 info 记录原始与代理大小、节省比例，写入 Prompt 的 meta.analysis_proxy
+
+配置见 config/default.yaml 的 video.proxy 段。
+"""
+import shutil
+import subprocess
+from pathlib import Path
+from typing import Any, Dict, Tuple
+
+from agent.config import config_section
+from agent.enhancers.video_store import video_store
+
+
+def _proxy_cfg() -> Dict[str, Any]:
+    return config_section("video").get("proxy") or {}
+
+
+def _size_info(source: Path, proxy: Path, cfg: Dict[str, Any]) -> Dict[str, Any]:
+    src_bytes, proxy_bytes = source.stat().st_size, proxy.stat().st_size
+    return {
+        "source_bytes": src_bytes,
+        "proxy_bytes": proxy_bytes,
+        "savings_pct": round(100.0 * (1 - proxy_bytes / src_bytes), 1) if src_bytes else 0.0,
+        "max_height": int(cfg.get("max_height", 360)),
+        "max_fps": float(cfg.get("max_fps", 10)),
+        "transcoded": proxy != source,
+    }
+
+
+def ffmpeg_proxy_command(source: Path, target: Path, cfg: Dict[str, Any]) -> list:
+    max_h = int(cfg.get("max_height", 360))
+    max_fps = float(cfg.get("max_fps", 10))
+    # 只缩小不放大；宽度取偶数以满足 yuv420p
+    vf = f"scale=-2:'min({max_h},ih)':flags=fast_bilinear,fps={max_fps:g}"
+    cmd = ["ffmpeg", "-y", "-loglevel", "error", "-i", str(source), "-vf", vf,
+           "-c:v", "libx264", "-preset", str(cfg.get("preset", "veryfast")), "-crf", str(cfg.get("crf", 30)),
+           "-maxrate", str(cfg.get("video_bitrate", "400k")), "-bufsize", str(cfg.get("bufsize", "800k")),
+           "-pix_fmt", "yuv420p"]
+    if cfg.get("keep_audio", True):
+        # 保留声道布局（ASMR 依赖立体声）
+        cmd += ["-c:a", "aac", "-b:a", str(cfg.get("audio_bitrate", "96k"))]
+    else:
+        cmd += ["-an"]
+    return cmd + ["-movflags", "+faststart", str(target)]
+
+
+def make_analysis_proxy(source: Path) -> Tuple[Path, Dict[str, Any]]:
+    """返回 (用于上传的视频路径, 代理信息)；代理以源文件内容哈希为 key 存入视频存储"""
+    cfg = _proxy_cfg()
+    if not cfg.get("enabled", True) or not shutil.which("ffmpeg"):
+        return source, _size_info(source, source, cfg)
+
+    key = f"{video_store.sha_of(source) or source.stem}.proxy"
+    with video_store.key_lock(key):
+        cached = video_store.lookup(key)
+        if cached is not None:
+            return cached, _size_info(source, cached, cfg)
+
+        tmp = video_store.temp_path(key)
+        try:
+            subprocess.run(ffmpeg_proxy_command(source, tmp, cfg), check=True, capture_output=True, text=True,
+                           timeout=float(cfg.get("timeout_seconds", 600)))
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            print(f"⚠️ 生成分析代理失败，改用原视频: {getattr(e, 'stderr', '') or e}")
+            tmp.unlink(missing_ok=True)
+            return source, _size_info(source, source, cfg)
+
+        if tmp.stat().st_size >= source.stat().st_size:
+            # 原视频已经足够小
+            tmp.unlink(missing_ok=True)
+            return source, _size_info(source, source, cfg)
+        target = video_store.commit(key, tmp, kind="proxy")
+    info = _size_info(source, target, cfg)
+    print(f"🗜️ 分析代理: {source.stat().st_size / 1e6:.1f}MB → {target.stat().st_size / 1e6:.1f}MB "
+          f"(节省 {info['savings_pct']}%)")
+    return target, info
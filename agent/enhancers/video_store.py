@@ -0,0 +1,226 @@
+# agent/enhancers/video_store.py
+# -*- coding: utf-8 -*-
+"""
+agent/enhancers/video_store.py
+===========================================================
+作用：
+  受管的本地视频存储（取代不断增长的 outputs/videos/<bvid>.mp4）。
+  - 内容寻址：文件按 sha256 存放在 objects/<前两位>/<sha256>.mp4，相同内容只存一份
+  - 原子落盘：生产者先写 tmp/ 下的临时文件，校验通过后 rename 到最终位置，
+    半截文件永远不会被当成有效缓存
+  - 完整性检查：入库时校验 mp4 文件头并用 ffprobe 读取时长（可用时）；读取时校验大小
+  - 元数据索引（SQLite）：逻辑 key（如 BV 号、BV 号+分析窗口、代理）→ sha256、来源 URL、大小、最近访问；
+    另记各视频的源时长，规划分析窗口时不必再联网探测
+  - 磁盘配额：超过 max_bytes 时按最近访问时间淘汰（LRU），最近刚用过的不淘汰
+
+配置见 config/default.yaml 的 video.store 段。
+"""
+import hashlib
+import os
+import shutil
+import sqlite3
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from agent.config import config_section
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS videos (
+    key TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    source_url TEXT,
+    kind TEXT,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+)
+"""
+_DURATION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS durations (
+    video_id TEXT PRIMARY KEY,
+    seconds REAL NOT NULL,
+    checked_at REAL NOT NULL
+)
+"""
+_HASH_CHUNK = 1024 * 1024
+
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _looks_like_mp4(path: Path) -> bool:
+    with open(path, "rb") as f:
+        head = f.read(12)
+    return len(head) == 12 and head[4:8] == b"ftyp"
+
+
+def _probe_ok(path: Path) -> bool:
+    """ffprobe 能读出时长即认为文件完整；没有 ffprobe 时跳过"""
+    if not shutil.which("ffprobe"):
+        return True
+    try:
+        out = subprocess.run(["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0",
+                              str(path)], capture_output=True, text=True, timeout=30)
+        return out.returncode == 0 and float(out.stdout.strip() or 0) > 0
+    except Exception:
+        return False
+
+
+class VideoStore:
+    def __init__(self, root: Optional[str] = None, max_bytes: Optional[int] = None,
+                 min_age_seconds: Optional[float] = None, verify_on_read: Optional[bool] = None):
+        cfg = config_section("video").get("store") or {}
+        self.root = Path(root or cfg.get("root") or os.path.join("outputs", "videos"))
+        self.max_bytes = int(max_bytes if max_bytes is not None else cfg.get("max_bytes", 20 * 1024 ** 3))
+        # 最近访问距今不足该时长的视频不淘汰（可能正在上传/转码）
+        self.min_age_seconds = float(min_age_seconds if min_age_seconds is not None
+                                     else cfg.get("min_age_seconds", 3600))
+        self.verify_on_read = bool(verify_on_read if verify_on_read is not None
+                                   else cfg.get("verify_on_read", False))
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+
+    # ---------------- 基础设施 ----------------
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.root.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.root / "index.sqlite3"), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA)
+            conn.execute(_DURATION_SCHEMA)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_videos_sha ON videos(sha256)")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_videos_access ON videos(last_access)")
+            self._conn = conn
+        return self._conn
+
+    def object_path(self, sha256: str) -> Path:
+        return self.root / "objects" / sha256[:2] / f"{sha256}.mp4"
+
+    def temp_path(self, key: str) -> Path:
+        """
+        生产者写入用的临时路径：与最终位置在同一文件系统（rename 原子），
+        且对同一 key 固定，便于断点续传。并发写同一 key 需先持有 key_lock(key)。
+        """
+        tmp_dir = self.root / "tmp"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in key)
+        return tmp_dir / f"{safe}.mp4"
+
+    def key_lock(self, key: str) -> threading.Lock:
+        """同一 key 的下载/转码串行化，避免重复工作与临时文件互相覆盖"""
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    # ---------------- 读写 ----------------
+
+    def lookup(self, key: str) -> Optional[Path]:
+        """返回 key 对应的有效文件；索引存在但文件缺失/损坏时清掉条目并返回 None"""
+        with self._lock:
+            row = self._db().execute("SELECT sha256, size FROM videos WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        sha, size = row
+        path = self.object_path(sha)
+        ok = path.exists() and path.stat().st_size == size
+        if ok and self.verify_on_read:
+            ok = _sha256(path) == sha
+        with self._lock:
+            if not ok:
+                print(f"⚠️ 视频缓存损坏或缺失，已移出索引: {key}")
+                self._db().execute("DELETE FROM videos WHERE key = ?", (key,))
+            else:
+                self._db().execute("UPDATE videos SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._db().commit()
+        return path if ok else None
+
+    def commit(self, key: str, tmp_file: Path, source_url: str = "", kind: str = "source") -> Path:
+        """校验临时文件，按内容哈希原子落盘并登记 key；校验失败时删除临时文件并抛错"""
+        tmp_file = Path(tmp_file)
+        if not tmp_file.exists() or tmp_file.stat().st_size == 0 or not _looks_like_mp4(tmp_file) \
+                or not _probe_ok(tmp_file):
+            tmp_file.unlink(missing_ok=True)
+            raise RuntimeError(f"视频文件不完整或已损坏: {key}")
+        sha = _sha256(tmp_file)
+        size = tmp_file.stat().st_size
+        target = self.object_path(sha)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        if target.exists() and target.stat().st_size == size:
+            tmp_file.unlink(missing_ok=True)   # 相同内容已存在
+        else:
+            os.replace(tmp_file, target)
+        now = time.time()
+        with self._lock:
+            self._db().execute(
+                "INSERT OR REPLACE INTO videos (key, sha256, source_url, kind, size, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)", (key, sha, source_url, kind, size, now, now))
+            self._db().commit()
+        self.enforce_quota()
+        return target
+
+    def duration(self, video_id: str) -> Optional[float]:
+        """记下的源视频时长（秒）"""
+        with self._lock:
+            row = self._db().execute("SELECT seconds FROM durations WHERE video_id = ?", (video_id,)).fetchone()
+        return row[0] if row else None
+
+    def remember_duration(self, video_id: str, seconds: float) -> None:
+        with self._lock:
+            self._db().execute("INSERT OR REPLACE INTO durations (video_id, seconds, checked_at) VALUES (?, ?, ?)",
+                               (video_id, float(seconds), time.time()))
+            self._db().commit()
+
+    def sha_of(self, path: Path) -> Optional[str]:
+        """已入库文件的 sha256（由路径推出，避免重复计算）"""
+        path = Path(path)
+        if path.parent.parent == self.root / "objects":
+            return path.stem
+        return None
+
+    # ---------------- 配额 ----------------
+
+    def enforce_quota(self) -> int:
+        """超出 max_bytes 时按 LRU 淘汰，返回删除的文件数"""
+        now = time.time()
+        removed = 0
+        with self._lock:
+            db = self._db()
+            # 以对象（sha256）为单位统计：多个 key 可能指向同一文件
+            rows = db.execute("SELECT sha256, MAX(size), MAX(last_access) FROM videos GROUP BY sha256"
+                              " ORDER BY MAX(last_access) ASC").fetchall()
+            total = sum(r[1] for r in rows)
+            for sha, size, last_access in rows:
+                if total <= self.max_bytes:
+                    break
+                if now - last_access < self.min_age_seconds:
+                    continue
+                db.execute("DELETE FROM videos WHERE sha256 = ?", (sha,))
+                self.object_path(sha).unlink(missing_ok=True)
+                total -= size
+                removed += 1
+            db.commit()
+        if removed:
+            print(f"🧹 视频存储超出配额，已按 LRU 淘汰 {removed} 个文件")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            keys, = self._db().execute("SELECT COUNT(*) FROM videos").fetchone()
+            objects, total = self._db().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM (SELECT sha256, MAX(size) AS size FROM videos"
+                " GROUP BY sha256)").fetchone()
+        return {"root": str(self.root), "keys": keys, "objects": objects, "bytes": total,
+                "max_bytes": self.max_bytes}
+
+
+# 全局视频存储实例
+video_store = VideoStore()
@@ -0,0 +1,86 @@
+# agent/enhancers/video_window.py
+# -*- coding: utf-8 -*-
+"""
+agent/enhancers/video_window.py
+===========================================================
+作用：
+  长视频的“分析窗口”：Prompt 只需要有代表性的片段，不必下载整段 10–30 分钟的视频。
+  - head：只取开头 N 秒
+  - segments：在全片均匀取 K 段，每段 M 秒
+  片段由 yt-dlp --download-sections 分别下载，再用 ffmpeg concat（流拷贝）拼成一个片段，
+  窗口信息写入 Prompt 的 meta.analysis_window。
+  视频本身短于窗口总长、时长未知或找不到 ffmpeg 时下载全片。
+
+配置见 config/default.yaml 的 video.window 段。
+"""
+import shutil
+import subprocess
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from agent.config import config_section
+
+
+@dataclass
+class AnalysisWindow:
+    mode: str
+    ranges: List[Tuple[float, float]] = field(default_factory=list)
+    source_duration: Optional[float] = None
+
+    @property
+    def tag(self) -> str:
+        """用于缓存文件名，不同窗口的片段互不覆盖"""
+        return "_".join(f"{int(s)}-{int(e)}" for s, e in self.ranges)
+
+    def to_meta(self) -> Dict[str, Any]:
+        return {"mode": self.mode, "ranges": [[round(s, 1), round(e, 1)] for s, e in self.ranges],
+                "source_duration": self.source_duration}
+
+
+def plan_window(duration: Optional[float]) -> Optional[AnalysisWindow]:
+    """按配置为给定时长的视频规划分析窗口；返回 None 表示下载全片"""
+    cfg = config_section("video").get("window") or {}
+    mode = str(cfg.get("mode", "segments"))
+    if mode == "full" or not duration or duration <= 0 or not shutil.which("ffmpeg"):
+        return None
+    if duration <= float(cfg.get("min_duration_seconds", 120)):
+        return None
+
+    if mode == "head":
+        head = float(cfg.get("head_seconds", 90))
+        if duration <= head:
+            return None
+        return AnalysisWindow(mode="head", ranges=[(0.0, head)], source_duration=duration)
+
+    k = max(1, int(cfg.get("segments", 4)))
+    seg = float(cfg.get("segment_seconds", 20))
+    if duration <= k * seg:
+        return None
+    ranges = []
+    for i in range(k):
+        center = duration * (i + 0.5) / k
+        start = max(0.0, min(center - seg / 2, duration - seg))
+        ranges.append((start, start + seg))
+    return AnalysisWindow(mode="segments", ranges=ranges, source_duration=duration)
+
+
+def concat_segments(segments: List[Path], target: Path) -> Path:
+    """用 ffmpeg concat demuxer 无损拼接同编码的片段"""
+    if len(segments) == 1:
+        segments[0].replace(target)
+        return target
+    list_file = target.with_name(target.name + ".txt")
+    list_file.write_text("".join(f"file '{p.resolve().as_posix()}'\n" for p in segments), encoding="utf-8")
+    tmp = target.with_name(target.name + ".part.mp4")
+    try:
+        subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", str(list_file),
+                        "-c", "copy", "-movflags", "+faststart", str(tmp)],
+                       check=True, capture_output=True, text=True)
+        tmp.replace(target)
+    except subprocess.CalledProcessError as e:
+        tmp.unlink(missing_ok=True)
+        raise RuntimeError(f"拼接分析片段失败: {e.stderr}")
+    finally:
+        list_file.unlink(missing_ok=True)
+    return target
@@ -0,0 +1,229 @@
+# agent/generators/chrome_fleet.py
+# -*- coding: utf-8 -*-
+"""
+agent/generators/chrome_fleet.py
+===========================================================
+作用：
+  可选的受管 Chrome 实例组（fleet）。不再依赖操作员手动打开的单个 9222 浏览器：
+  - 启动 N 个 Chrome（headless 或有界面），各自使用独立的 user-data-dir 和调试端口（base_port 起递增）
+  - 每个实例的用户目录从已登录的模板 profile 克隆一份（跳过锁文件与缓存目录），首次启动时克隆，之后复用
+  - 后台线程定期巡检：进程退出或 /json/version 不通即视为崩溃，退出其会话并重启（超过 max_restarts 后停用）
+  - 健康实例的端口即任务管理器的工作容量：每个浏览器提供 flow.session.tabs_per_browser 个并发槽位，
+    吞吐随实例数（默认按 CPU 核数）扩展
+
+配置见 config/default.yaml 的 flow.fleet 段；enabled 为 false 时不启动任何进程，行为与手动浏览器一致。
+"""
+import os
+import shutil
+import subprocess
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from agent.config import config_section
+from agent.generators.devtools import port_discovery, probe_devtools_json
+from agent.generators.session_pool import flow_session_pool
+
+# 克隆模板 profile 时跳过：运行时锁文件与可再生的缓存
+PROFILE_SKIP = ("SingletonLock", "SingletonCookie", "SingletonSocket", "DevToolsActivePort", "lockfile",
+                "Cache", "Code Cache", "GPUCache", "ShaderCache", "GrShaderCache", "Crashpad", "Service Worker")
+
+CHROME_CANDIDATES = [
+    "google-chrome", "google-chrome-stable", "chromium", "chromium-browser", "chrome",
+    r"C:\Program Files\Google\Chrome\Application\chrome.exe",
+    r"C:\Program Files (x86)\Google\Chrome\Application\chrome.exe",
+    "/Applications/Google Chrome.app/Contents/MacOS/Google Chrome",
+]
+
+
+def _fleet_cfg() -> Dict[str, Any]:
+    return config_section("flow").get("fleet") or {}
+
+
+def find_chrome(configured: str = "") -> Optional[str]:
+    for candidate in [configured, os.getenv("CHROME_PATH", "")] + CHROME_CANDIDATES:
+        if not candidate:
+            continue
+        path = candidate if os.path.isfile(candidate) else shutil.which(candidate)
+        if path:
+            return path
+    return None
+
+
+def clone_profile(template: str, dest: str) -> bool:
+    """从模板 profile 克隆用户目录；目标已存在时不覆盖（保留实例自己的登录态与缓存），返回是否新克隆"""
+    if os.path.isdir(dest):
+        return False
+    if template and os.path.isdir(template):
+        shutil.copytree(template, dest, ignore=shutil.ignore_patterns(*PROFILE_SKIP))
+    else:
+        os.makedirs(dest, exist_ok=True)
+    return True
+
+
+@dataclass
+class ChromeInstance:
+    index: int
+    port: int
+    profile_dir: str
+    process: Optional[subprocess.Popen] = None
+    healthy: bool = False
+    restarts: int = 0
+    started_at: float = field(default_factory=time.time)
+    disabled: bool = False
+
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+
+class ChromeFleet:
+    def __init__(self, cfg: Optional[Dict[str, Any]] = None):
+        cfg = _fleet_cfg() if cfg is None else cfg
+        self.enabled = bool(cfg.get("enabled", False))
+        self.size = int(cfg.get("size") or max(1, (os.cpu_count() or 2) // 2))
+        self.base_port = int(cfg.get("base_port", 9300))
+        self.headless = bool(cfg.get("headless", True))
+        self.chrome_path = cfg.get("chrome_path") or ""
+        self.template_profile = cfg.get("template_profile") or ""
+        self.profiles_dir = cfg.get("profiles_dir") or os.path.join("outputs", "chrome_profiles")
+        self.start_url = cfg.get("start_url") or ""
+        self.extra_args: List[str] = list(cfg.get("extra_args") or [])
+        self.health_interval_seconds = float(cfg.get("health_interval_seconds", 10))
+        self.startup_timeout_seconds = float(cfg.get("startup_timeout_seconds", 20))
+        self.max_restarts = int(cfg.get("max_restarts", 5))
+        self.instances: List[ChromeInstance] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._supervisor: Optional[threading.Thread] = None
+
+    # ---------------- 启动 ----------------
+
+    def _command(self, chrome: str, inst: ChromeInstance) -> List[str]:
+        args = [
+            chrome,
+            f"--remote-debugging-port={inst.port}",
+            f"--user-data-dir={os.path.abspath(inst.profile_dir)}",
+            "--no-first-run",
+            "--no-default-browser-check",
+            # 多个 Flow 标签页在后台并行工作，不让后台标签页/被遮挡窗口降频
+            "--disable-background-timer-throttling",
+            "--disable-backgrounding-occluded-windows",
+            "--disable-renderer-backgrounding",
+        ]
+        if self.headless:
+            args += ["--headless=new", "--window-size=1920,1080"]
+        args += self.extra_args
+        if self.start_url:
+            args.append(self.start_url)
+        return args
+
+    def _wait_ready(self, inst: ChromeInstance) -> bool:
+        deadline = time.time() + self.startup_timeout_seconds
+        while time.time() < deadline:
+            if not inst.alive():
+                return False
+            if probe_devtools_json(inst.port):
+                return True
+            time.sleep(0.25)
+        return False
+
+    def _launch(self, inst: ChromeInstance) -> bool:
+        chrome = find_chrome(self.chrome_path)
+        if not chrome:
+            raise RuntimeError("未找到 Chrome 可执行文件，请配置 flow.fleet.chrome_path 或环境变量 CHROME_PATH")
+        if clone_profile(self.template_profile, inst.profile_dir):
+            print(f"📁 已从模板克隆用户目录: {inst.profile_dir}")
+        inst.process = subprocess.Popen(self._command(chrome, inst), stdout=subprocess.DEVNULL,
+                                        stderr=subprocess.DEVNULL)
+        inst.started_at = time.time()
+        inst.healthy = self._wait_ready(inst)
+        if inst.healthy:
+            print(f"✅ Chrome 实例 #{inst.index} 已就绪（port={inst.port}）")
+        else:
+            print(f"⚠️ Chrome 实例 #{inst.index} 启动后未响应（port={inst.port}）")
+        return inst.healthy
+
+    def start(self) -> List[int]:
+        """启动全部实例与巡检线程，返回健康实例的端口；未启用时什么都不做"""
+        if not self.enabled or self._supervisor is not None:
+            return self.healthy_ports()
+        os.makedirs(self.profiles_dir, exist_ok=True)
+        with self._lock:
+            self.instances = [ChromeInstance(index=i, port=self.base_port + i,
+                                             profile_dir=os.path.join(self.profiles_dir, f"instance-{i}"))
+                              for i in range(self.size)]
+        for inst in self.instances:
+            try:
+                self._launch(inst)
+            except Exception as e:
+                print(f"❌ 启动 Chrome 实例 #{inst.index} 失败: {e}")
+        self._stop.clear()
+        self._supervisor = threading.Thread(target=self._supervise, name="chrome-fleet", daemon=True)
+        self._supervisor.start()
+        return self.healthy_ports()
+
+    # ---------------- 巡检 / 重启 ----------------
+
+    def _terminate(self, inst: ChromeInstance) -> None:
+        inst.healthy = False
+        flow_session_pool.close_port(inst.port)
+        port_discovery.invalidate(inst.port)
+        if inst.alive():
+            inst.process.terminate()
+            try:
+                inst.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                inst.process.kill()
+
+    def check(self) -> None:
+        """巡检一次：崩溃或无响应的实例退出会话后重启"""
+        for inst in list(self.instances):
+            if inst.disabled:
+                continue
+            if inst.alive() and probe_devtools_json(inst.port):
+                inst.healthy = True
+                continue
+            if inst.restarts >= self.max_restarts:
+                print(f"🛑 Chrome 实例 #{inst.index} 重启次数已达上限，停用（port={inst.port}）")
+                self._terminate(inst)
+                inst.disabled = True
+                continue
+            inst.restarts += 1
+            print(f"♻️ Chrome 实例 #{inst.index} 异常，第 {inst.restarts} 次重启（port={inst.port}）")
+            self._terminate(inst)
+            try:
+                self._launch(inst)
+            except Exception as e:
+                print(f"❌ 重启 Chrome 实例 #{inst.index} 失败: {e}")
+
+    def _supervise(self) -> None:
+        while not self._stop.wait(self.health_interval_seconds):
+            try:
+                self.check()
+            except Exception as e:
+                print(f"⚠️ Chrome 巡检异常: {e}")
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._supervisor is not None:
+            self._supervisor.join(timeout=self.health_interval_seconds + 1)
+            self._supervisor = None
+        for inst in self.instances:
+            self._terminate(inst)
+
+    # ---------------- 容量 ----------------
+
+    def healthy_ports(self) -> List[int]:
+        return [inst.port for inst in self.instances if inst.healthy and not inst.disabled]
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        return {str(inst.port): {"index": inst.index, "healthy": inst.healthy, "disabled": inst.disabled,
+                                 "restarts": inst.restarts, "uptime_seconds": round(now - inst.started_at, 1),
+                                 "pid": inst.process.pid if inst.process else None}
+                for inst in self.instances}
+
+
+# 全局 Chrome 实例组
+chrome_fleet = ChromeFleet()
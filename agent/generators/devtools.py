@@ -0,0 +1,298 @@
+# agent/generators/devtools.py
+# -*- coding: utf-8 -*-
+"""
+agent/generators/devtools.py
+===========================================================
+作用：
+  Chrome 远程调试（DevTools）相关的底层工具，供 flow_automator 与 session_pool 共用：
+  - 端口发现：候选端口（指定端口、DevToolsActivePort 文件、常用端口）并发探测，先成功者胜出；
+    都不通时才遍历进程命令行。可用端口短期缓存，过期后只用一次探测复核
+  - 查询浏览器版本（/json/version）
+  - ChromeDriver 本地缓存：主版本号 → 驱动路径（持久化 + 校验），每个端口只在浏览器版本变化时重新解析；
+    可指定预置驱动目录离线使用
+  - 以 debuggerAddress 方式附着到已打开的 Chrome
+
+端口发现与 ChromeDriver 缓存的配置见 config/default.yaml 的 flow.devtools / flow.chromedriver 段。
+"""
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service as ChromeService
+from webdriver_manager.chrome import ChromeDriverManager
+
+from agent.config import config_section
+from agent.utils.io import write_json
+
+SCAN_PORTS = list(range(9222, 9233))
+
+
+def _http_get_json_no_proxy(url: str, timeout: float = 2.0) -> Dict[str, Any]:
+    r = requests.get(url, timeout=timeout, proxies={"http": None, "https": None})
+    r.raise_for_status()
+    return r.json()
+
+
+def _devtools_cfg() -> Dict[str, Any]:
+    return config_section("flow").get("devtools") or {}
+
+
+def probe_devtools_json(port: int, timeout: Optional[float] = None):
+    timeout = float(timeout if timeout is not None else _devtools_cfg().get("probe_timeout_seconds", 1.2))
+    for host in ("127.0.0.1", "localhost"):
+        try:
+            return _http_get_json_no_proxy(f"http://{host}:{port}/json/version", timeout)
+        except Exception:
+            pass
+    return None
+
+
+def parse_major(browser: str) -> Optional[str]:
+    m = re.search(r"/(\d+)\.", browser or "")
+    return m.group(1) if m else None
+
+
+def _read_devtools_active_port_candidates() -> List[int]:
+    paths = [
+        os.path.join(os.getenv("LOCALAPPDATA", ""), "Google", "Chrome", "User Data", "DevToolsActivePort"),
+        r"C:\Users\MSI\chrome-remote-profile\DevToolsActivePort",
+        r"C:\temp\chrome-debug-profile-final\DevToolsActivePort",
+    ]
+    out = []
+    for p in paths:
+        try:
+            if os.path.exists(p):
+                with open(p, "r", encoding="utf-8") as f:
+                    line = f.readline().strip()
+                    if line.isdigit():
+                        out.append(int(line))
+        except Exception:
+            pass
+    return out
+
+
+def _find_debug_ports_from_processes() -> List[int]:
+    ports = []
+    try:
+        import psutil
+        for proc in psutil.process_iter(attrs=["name", "cmdline"]):
+            try:
+                if not (proc.info.get("name") or "").lower().startswith("chrome"):
+                    continue
+                cmd = " ".join(proc.info.get("cmdline") or [])
+                m = re.search(r"--remote-debugging-port=(\d+)", cmd)
+                if m:
+                    ports.append(int(m.group(1)))
+            except Exception:
+                continue
+    except Exception:
+        pass
+    seen = set()
+    uniq = []
+    for p in ports:
+        if p not in seen:
+            uniq.append(p)
+            seen.add(p)
+    return uniq
+
+
+# ---------------- 端口发现 ----------------
+
+class PortDiscovery:
+    def __init__(self, ttl_seconds: Optional[float] = None, max_workers: Optional[int] = None):
+        cfg = _devtools_cfg()
+        self.ttl_seconds = float(ttl_seconds if ttl_seconds is not None else cfg.get("port_cache_ttl_seconds", 30))
+        self.max_workers = int(max_workers or cfg.get("probe_workers", 16))
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._cached: Optional[Tuple[int, Dict[str, Any], float]] = None   # (port, /json/version, 校验时间)
+        self._info: Dict[int, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="devtools-probe")
+            return self._pool
+
+    def _remember(self, port: int, info: Dict[str, Any]) -> int:
+        with self._lock:
+            self._cached = (port, info, time.time())
+            self._info[port] = info
+        return port
+
+    def _probe_first(self, candidates: List[int]) -> Optional[Tuple[int, Dict[str, Any]]]:
+        """并发探测，返回最先成功的 (port, info)；不等待其余探测结束"""
+        if not candidates:
+            return None
+        futures = {self._executor().submit(probe_devtools_json, p): p for p in candidates}
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                info = fut.result()
+                if info:
+                    for f in pending:
+                        f.cancel()
+                    return futures[fut], info
+        return None
+
+    def info(self, port: int) -> Optional[Dict[str, Any]]:
+        """最近一次探测到的 /json/version（含 Browser 版本串）"""
+        return self._info.get(port)
+
+    def invalidate(self, port: Optional[int] = None) -> None:
+        with self._lock:
+            if self._cached and (port is None or self._cached[0] == port):
+                self._cached = None
+            if port is not None:
+                self._info.pop(port, None)
+
+    def choose(self, preferred: Optional[int] = None, fallback: bool = True) -> Optional[int]:
+        """返回可用端口；fallback 为 False 时只认 preferred，探测不通返回 None，不改用其他浏览器"""
+        preferred = preferred if preferred and preferred > 0 else None
+        cached = self._cached
+        if cached and (preferred is None or cached[0] == preferred):
+            port, _, checked_at = cached
+            if time.time() - checked_at < self.ttl_seconds:
+                return port
+            info = probe_devtools_json(port)     # 过期：单次探测复核
+            if info:
+                return self._remember(port, info)
+            self.invalidate(port)
+
+        if preferred is not None:
+            info = probe_devtools_json(preferred)
+            if info:
+                return self._remember(preferred, info)
+            if not fallback:
+                return None
+
+        candidates = []
+        for p in _read_devtools_active_port_candidates() + SCAN_PORTS:
+            if p != preferred and p not in candidates:
+                candidates.append(p)
+        hit = self._probe_first(candidates)
+        if hit is None:
+            # 常用端口都不通时才遍历进程（较慢）
+            hit = self._probe_first([p for p in _find_debug_ports_from_processes()
+                                     if p != preferred and p not in candidates])
+        if hit is None:
+            return None
+        return self._remember(*hit)
+
+
+# 全局端口发现实例
+port_discovery = PortDiscovery()
+
+
+def choose_working_port(preferred: Optional[int], fallback: bool = True) -> Optional[int]:
+    return port_discovery.choose(preferred, fallback)
+
+
+# ---------------- ChromeDriver 缓存 ----------------
+
+def _driver_ok(path: Optional[str]) -> bool:
+    return bool(path) and os.path.isfile(path) and (os.name == "nt" or os.access(path, os.X_OK))
+
+
+def _download_chromedriver(browser: str, major: str) -> str:
+    """经 webdriver-manager 下载与浏览器匹配的驱动（优先完整版本号，其次最新版）"""
+    version = (browser or "").split("/", 1)[-1] or None
+    try:
+        return ChromeDriverManager(driver_version=version).install()
+    except Exception:
+        print(f"⚠️ 未能按版本 {version or major} 下载 ChromeDriver，改用最新版")
+        return ChromeDriverManager().install()
+
+
+class ChromeDriverCache:
+    def __init__(self, path: Optional[str] = None, driver_dir: Optional[str] = None, offline: Optional[bool] = None):
+        cfg = config_section("flow").get("chromedriver") or {}
+        self.path = path or cfg.get("cache_path") or os.path.join("outputs", "cache", "chromedriver.json")
+        self.driver_dir = driver_dir if driver_dir is not None else (cfg.get("driver_dir") or "")
+        self.offline = bool(offline if offline is not None else cfg.get("offline", False))
+        self._by_major: Optional[Dict[str, str]] = None
+        self._by_port: Dict[int, Tuple[str, str]] = {}   # port -> (浏览器版本串, 驱动路径)
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, str]:
+        if self._by_major is None:
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self._by_major = json.load(f) or {}
+            except (OSError, ValueError):
+                self._by_major = {}
+        return self._by_major
+
+    def _seeded(self, major: str) -> Optional[str]:
+        """预置目录：<driver_dir>/<major>/chromedriver[.exe] 或 <driver_dir>/chromedriver-<major>[.exe]"""
+        if not self.driver_dir:
+            return None
+        exe = "chromedriver.exe" if os.name == "nt" else "chromedriver"
+        for candidate in (os.path.join(self.driver_dir, major, exe),
+                          os.path.join(self.driver_dir, f"chromedriver-{major}" + (".exe" if os.name == "nt" else ""))):
+            if _driver_ok(candidate):
+                return candidate
+        return None
+
+    def for_browser(self, browser: str) -> str:
+        """按浏览器版本串（如 'Chrome/126.0.6478.127'）返回驱动路径；读不出主版本时每次重新解析，不写缓存"""
+        major = parse_major(browser)
+        if major is None:
+            if self.offline:
+                raise RuntimeError("离线模式下无法确定 Chrome 版本，找不到对应的 ChromeDriver")
+            print("⚠️ 无法读取 Chrome 主版本，本次下载最新版 ChromeDriver（不写入缓存）")
+            return _download_chromedriver(browser, "latest")
+        with self._lock:
+            by_major = self._load()
+            path = by_major.get(major)
+            if _driver_ok(path):
+                return path
+            path = self._seeded(major)
+            if path is None:
+                if self.offline:
+                    raise RuntimeError(f"离线模式下找不到 Chrome {major} 对应的 ChromeDriver（预置目录: {self.driver_dir or '未配置'}）")
+                path = _download_chromedriver(browser, major)
+            by_major[major] = path
+            write_json(self.path, by_major)
+            return path
+
+    def for_port(self, port: int, browser: Optional[str] = None) -> str:
+        """端口上浏览器版本不变时直接返回上次解析的驱动；browser 未给出时查询 /json/version"""
+        if browser is None:
+            info = port_discovery.info(port) or probe_devtools_json(port) or {}
+            browser = info.get("Browser", "")
+        cached = self._by_port.get(port)
+        if cached and cached[0] == browser and _driver_ok(cached[1]):
+            return cached[1]
+        path = self.for_browser(browser)
+        if parse_major(browser):
+            self._by_port[port] = (browser, path)
+        return path
+
+
+# 全局 ChromeDriver 缓存实例
+chromedriver_cache = ChromeDriverCache()
+
+
+def attach_driver(port: int, driver_path: str) -> webdriver.Chrome:
+    opts = webdriver.ChromeOptions()
+    opts.add_experimental_option("debuggerAddress", f"127.0.0.1:{port}")
+    service = ChromeService(executable_path=driver_path)
+    drv = webdriver.Chrome(service=service, options=opts)
+
+    # 不再 bringToFront / 最大化：同一浏览器的多个标签页会话并行工作，互不抢前台
+
+    # 移除 webdriver 标记
+    try:
+        drv.execute_script("Object.defineProperty(navigator,'webdriver',{get:()=>undefined});")
+    except Exception:
+        pass
+
+    return drv
@@ -3,29 +3,37 @@
 Flow(Veo3) —— 修复版本
 主要改进：
 1) 更灵活的页面检测
-2) 直接查找输入框元素
+2) 直接查找输入框元素（所有选择器在页面内一次 execute_script 评估，记住每个页面上成功的选择器）
 3) 增加调试信息输出
 4) 改进等待和重试机制
+5) 浏览器会话由 session_pool 按端口复用，不再每个任务重新附着
+6) 文本经 CDP Input.insertText 注入当前标签页（不经系统剪贴板），失败时用框架感知的 value setter，
+   注入后校验内容，多个任务可安全并行
+7) 提交后可在同一标签页等待渲染完成并自动下载结果（flow_results），任务状态为 rendered
+8) 回车/点击发出后不再重发：未能确认时报告 unconfirmed，由调用方决定，避免重复生成
 """
 
 from typing import Dict, Any, Optional, List, Tuple, Callable
-import re, time, requests, os, subprocess, base64
+import time, threading
 
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service as ChromeService
-from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.common.action_chains import ActionChains
-from selenium.common.exceptions import WebDriverException, TimeoutException
-from webdriver_manager.chrome import ChromeDriverManager
+from selenium.common.exceptions import StaleElementReferenceException, TimeoutException, WebDriverException
+
+from agent.generators.devtools import choose_working_port
+from agent.generators.flow_results import flow_results, media_urls
+from agent.generators.session_pool import flow_session_pool
 
 # ===== 可调参数 =====
 APP_READY_TOTAL_SECONDS = 60  # 增加等待时间
-RETRY_INTERVAL_SECONDS = 2.0  # 增加重试间隔
-SCAN_PORTS = list(range(9222, 9233))
-PASTE_STABILIZE_SECONDS = 1.5  # 增加粘贴后等待时间
+# 条件等待：轮询间隔与各步骤的超时（满足条件立即继续，不再固定 sleep）
+WAIT_POLL_SECONDS = 0.1
+PAGE_LOAD_TIMEOUT = 15.0       # document.readyState == complete
+INPUT_READY_TIMEOUT = 15.0     # 输入框出现且可编辑
+FOCUS_TIMEOUT = 2.0            # 点击后输入框获得焦点
+VALUE_TIMEOUT = 5.0            # 清空 / 粘贴后内容与预期一致
+SUBMIT_CONFIRM_TIMEOUT = 10.0  # 提交后页面响应（输入框被清空或发出请求）
+RETRY_BACKOFF_SECONDS = 0.5    # 仅在失败后重试前短暂退避，成功路径不等待
 
 # 更全面的输入框识别策略
 INPUT_SELECTORS = [
@@ -58,284 +66,324 @@ SEND_BUTTON_SELECTORS = [
 ]
 
 
-# 保留原有的端口检测和驱动管理函数
-def _http_get_json_no_proxy(url: str, timeout: float = 2.0) -> Dict[str, Any]:
-    r = requests.get(url, timeout=timeout, proxies={"http": None, "https": None})
-    r.raise_for_status()
-    return r.json()
-
+# ---------------- 元素查找（一次 execute_script 完成） ----------------
+
+SEND_BUTTON_KEYWORDS = ["send", "submit", "generate", "create", "生成", "发送", "提交"]
+
+# 在页面内依次尝试选择器并检查可见/可用/可编辑，返回首个合格元素与每个选择器的诊断信息。
+# 上次在同一页面（origin + pathname）成功的选择器排在最前。
+_JS_FIND_ELEMENT = r"""
+const [selectors, remembered, keywords, editable] = arguments;
+const page = location.origin + location.pathname;
+const ordered = remembered[page] ? [remembered[page], ...selectors.filter(s => s !== remembered[page])] : selectors;
+const diagnostics = [];
+const check = (e) => {
+  const r = e.getBoundingClientRect(), st = getComputedStyle(e);
+  const visible = r.width > 0 && r.height > 0 && st.visibility !== 'hidden' && st.display !== 'none';
+  const usable = !e.disabled && e.getAttribute('aria-disabled') !== 'true'
+    && (!editable || (!e.readOnly && !e.hasAttribute('readonly')));
+  return [visible, visible && usable];
+};
+for (const selector of ordered) {
+  let nodes;
+  try { nodes = document.querySelectorAll(selector); }
+  catch (err) { diagnostics.push({selector, error: String(err)}); continue; }
+  let visible = 0;
+  for (const e of nodes) {
+    const [vis, ok] = check(e);
+    if (vis) visible++;
+    if (ok) {
+      diagnostics.push({selector, matched: nodes.length, visible});
+      return {element: e, selector, page, diagnostics};
+    }
+  }
+  diagnostics.push({selector, matched: nodes.length, visible});
+}
+for (const b of (keywords.length ? document.querySelectorAll('button') : [])) {
+  const label = ((b.innerText || '') + ' ' + (b.getAttribute('aria-label') || '')).toLowerCase();
+  if (check(b)[1] && keywords.some(k => label.includes(k))) {
+    return {element: b, selector: null, label: label.trim(), page, diagnostics};
+  }
+}
+return {element: null, selector: null, page, diagnostics};
+"""
 
-def _probe_devtools_json(port: int):
-    for host in ("127.0.0.1", "localhost"):
-        try:
-            return _http_get_json_no_proxy(f"http://{host}:{port}/json/version", 1.2)
-        except Exception:
-            pass
-    return None
+# (kind, 页面) -> 上次成功的选择器
+_selector_memory: Dict[str, Dict[str, str]] = {"input": {}, "send": {}}
+_selector_lock = threading.Lock()
 
 
-def _parse_major(browser: str) -> Optional[str]:
-    m = re.search(r"/(\d+)\.", browser or "")
-    return m.group(1) if m else None
+def _find_element(driver, kind: str, selectors: List[str], keywords: List[str], editable: bool) -> Dict[str, Any]:
+    with _selector_lock:
+        remembered = dict(_selector_memory[kind])
+    result = driver.execute_script(_JS_FIND_ELEMENT, selectors, remembered, keywords, editable) or {}
+    if result.get("element") is not None and result.get("selector"):
+        with _selector_lock:
+            _selector_memory[kind][result["page"]] = result["selector"]
+    return result
 
 
-def _read_devtools_active_port_candidates() -> List[int]:
-    paths = [
-        os.path.join(os.getenv("LOCALAPPDATA", ""), "Google", "Chrome", "User Data", "DevToolsActivePort"),
-        r"C:\Users\MSI\chrome-remote-profile\DevToolsActivePort",
-        r"C:\temp\chrome-debug-profile-final\DevToolsActivePort",
-    ]
-    out = []
-    for p in paths:
-        try:
-            if os.path.exists(p):
-                with open(p, "r", encoding="utf-8") as f:
-                    line = f.readline().strip()
-                    if line.isdigit():
-                        out.append(int(line))
-        except Exception:
-            pass
-    return out
-
-
-def _find_debug_ports_from_processes() -> List[int]:
-    ports = []
-    try:
-        import psutil
-        for proc in psutil.process_iter(attrs=["name", "cmdline"]):
-            try:
-                if not (proc.info.get("name") or "").lower().startswith("chrome"):
-                    continue
-                cmd = " ".join(proc.info.get("cmdline") or [])
-                m = re.search(r"--remote-debugging-port=(\d+)", cmd)
-                if m:
-                    ports.append(int(m.group(1)))
-            except Exception:
-                continue
-    except Exception:
-        pass
-    seen = set()
-    uniq = []
-    for p in ports:
-        if p not in seen:
-            uniq.append(p)
-            seen.add(p)
-    return uniq
-
-
-def _install_matching_chromedriver(major: str) -> str:
-    try:
-        return ChromeDriverManager(version=major).install()
-    except Exception:
-        return ChromeDriverManager().install()
+def _print_diagnostics(result: Dict[str, Any]) -> None:
+    for d in result.get("diagnostics") or []:
+        if d.get("error"):
+            print(f"⚠️ 选择器 {d['selector']} 出错: {d['error']}")
+        elif d.get("matched"):
+            print(f"   · {d['selector']}: 匹配 {d['matched']} 个，可见 {d['visible']} 个")
 
 
-def _attach_driver(port: int, driver_path: str) -> webdriver.Chrome:
-    opts = webdriver.ChromeOptions()
-    opts.add_experimental_option("debuggerAddress", f"127.0.0.1:{port}")
-    service = ChromeService(executable_path=driver_path)
-    drv = webdriver.Chrome(service=service, options=opts)
+def _find_input_element(driver, verbose: bool = True) -> Optional[Any]:
+    """查找输入框元素"""
+    if verbose:
+        print("🔍 正在查找输入框...")
+    result = _find_element(driver, "input", INPUT_SELECTORS, [], editable=True)
+    if result.get("element") is not None:
+        if verbose:
+            print(f"✅ 找到输入框: {result['selector']}")
+        return result["element"]
+    if verbose:
+        _print_diagnostics(result)
+        print("❌ 未找到合适的输入框")
+    return None
 
-    # 确保窗口在前台
-    try:
-        drv.execute_cdp_cmd("Page.bringToFront", {})
-        drv.maximize_window()  # 最大化窗口
-    except Exception:
-        pass
 
-    # 移除 webdriver 标记
-    try:
-        drv.execute_script("Object.defineProperty(navigator,'webdriver',{get:()=>undefined});")
-    except Exception:
-        pass
+def _find_send_button(driver) -> Optional[Any]:
+    """查找发送按钮"""
+    print("🔍 正在查找发送按钮...")
+    result = _find_element(driver, "send", SEND_BUTTON_SELECTORS, SEND_BUTTON_KEYWORDS, editable=False)
+    if result.get("element") is not None:
+        if result.get("selector"):
+            print(f"✅ 找到发送按钮: {result['selector']}")
+        else:
+            print(f"✅ 找到通用发送按钮: {result.get('label')}")
+        return result["element"]
+    _print_diagnostics(result)
+    print("❌ 未找到合适的发送按钮")
+    return None
 
-    return drv
 
+# ---------------- 条件等待 ----------------
+
+_JS_ELEMENT_TEXT = "const e = arguments[0]; return (e.value !== undefined ? e.value : e.innerText) || '';"
+_JS_IS_FOCUSED = "const e = arguments[0]; return document.activeElement === e || e.contains(document.activeElement);"
+# 提交前安装 PerformanceObserver，只统计之后发出的 fetch/XHR；
+# 不依赖 performance.getEntriesByType 的条目数（资源缓冲区默认 250 条，写满后不再增长）
+_JS_WATCH_REQUESTS = r"""
+if (window.__flowReqObserver) window.__flowReqObserver.disconnect();
+window.__flowReqCount = 0;
+const obs = new PerformanceObserver(list => {
+  for (const e of list.getEntries()) {
+    if (e.initiatorType === 'fetch' || e.initiatorType === 'xmlhttprequest') window.__flowReqCount++;
+  }
+});
+obs.observe({type: 'resource'});
+window.__flowReqObserver = obs;
+"""
+_JS_REQUEST_COUNT = "return window.__flowReqCount || 0;"
 
-def _choose_working_port(preferred: Optional[int]) -> Optional[int]:
-    candidates = []
-    if preferred and preferred > 0:
-        candidates.append(preferred)
 
-    for p in _read_devtools_active_port_candidates():
-        if p not in candidates:
-            candidates.append(p)
+def _wait_until(driver, timeout: float, predicate: Callable[[Any], Any]) -> Any:
+    """满足条件即返回其结果；超时返回 None"""
+    try:
+        return WebDriverWait(driver, timeout, poll_frequency=WAIT_POLL_SECONDS).until(predicate)
+    except TimeoutException:
+        return None
 
-    for p in _find_debug_ports_from_processes():
-        if p not in candidates:
-            candidates.append(p)
 
-    for p in SCAN_PORTS:
-        if p not in candidates:
-            candidates.append(p)
+def _normalize_text(text: str) -> str:
+    return " ".join((text or "").split())
 
-    for p in candidates:
-        if _probe_devtools_json(p):
-            return p
 
-    return None
+def _element_text(driver, element) -> str:
+    try:
+        return driver.execute_script(_JS_ELEMENT_TEXT, element) or ""
+    except WebDriverException:
+        return ""
 
 
-def _set_clipboard(text: str) -> bool:
-    """设置系统剪贴板"""
+def _watch_requests(driver) -> None:
     try:
-        import pyperclip
-        pyperclip.copy(text)
-        return True
-    except Exception:
-        pass
+        driver.execute_script(_JS_WATCH_REQUESTS)
+    except WebDriverException as e:
+        print(f"⚠️ 无法监听页面请求，仅按输入框变化确认提交: {e}")
 
-    try:
-        b64 = base64.b64encode(text.encode("utf-16le")).decode("ascii")
-        ps = ("$b='{b64}';$t=[Text.Encoding]::Unicode.GetString([Convert]::FromBase64String($b));"
-              "Set-Clipboard -Value $t").format(b64=b64)
-        subprocess.run(["powershell", "-NoProfile", "-Command", ps], check=True)
-        return True
-    except Exception:
-        pass
 
+def _request_count(driver) -> int:
     try:
-        p = subprocess.Popen("clip", stdin=subprocess.PIPE, shell=True)
-        p.communicate((text or "").encode("utf-8", errors="ignore"))
-        return p.returncode == 0
-    except Exception:
-        return False
+        return int(driver.execute_script(_JS_REQUEST_COUNT) or 0)
+    except WebDriverException:
+        return 0
+
+
+# ---------------- 文本注入（不使用系统剪贴板） ----------------
+
+_JS_SELECT_CONTENTS = r"""
+const e = arguments[0];
+e.focus();
+if (typeof e.select === 'function') { e.select(); return; }
+const range = document.createRange();
+range.selectNodeContents(e);
+const sel = window.getSelection();
+sel.removeAllRanges();
+sel.addRange(range);
+"""
 
+# React 等框架会拦截 value 属性：用原型上的原生 setter 赋值并派发 input/change 事件
+_JS_SET_VALUE = r"""
+const [e, text] = arguments;
+e.focus();
+if (e.isContentEditable) {
+  const range = document.createRange();
+  range.selectNodeContents(e);
+  const sel = window.getSelection();
+  sel.removeAllRanges();
+  sel.addRange(range);
+  if (!document.execCommand('insertText', false, text)) {
+    e.textContent = text;
+    e.dispatchEvent(new InputEvent('input', {bubbles: true, inputType: 'insertText', data: text}));
+  }
+  return;
+}
+const proto = e instanceof HTMLTextAreaElement ? HTMLTextAreaElement.prototype : HTMLInputElement.prototype;
+Object.getOwnPropertyDescriptor(proto, 'value').set.call(e, text);
+e.dispatchEvent(new Event('input', {bubbles: true}));
+e.dispatchEvent(new Event('change', {bubbles: true}));
+"""
 
-def _find_input_element(driver) -> Optional[Any]:
-    """查找输入框元素"""
-    print("🔍 正在查找输入框...")
 
-    for selector in INPUT_SELECTORS:
-        try:
-            elements = driver.find_elements(By.CSS_SELECTOR, selector)
-            for element in elements:
-                # 检查元素是否可见和可编辑
-                if (element.is_displayed() and
-                        element.is_enabled() and
-                        not element.get_attribute("readonly")):
-                    print(f"✅ 找到输入框: {selector}")
-                    return element
-        except Exception as e:
-            print(f"⚠️ 选择器 {selector} 出错: {e}")
-            continue
-
-    print("❌ 未找到合适的输入框")
-    return None
+def _insert_text(driver, element, text: str) -> Tuple[bool, str]:
+    """
+    替换输入框内容为 text 并校验。先选中原有内容，再用 CDP Input.insertText
+    （作用于当前会话的标签页，等同输入法提交，会触发 beforeinput/input）；
+    内容不符时改用原生 value setter。返回 (是否成功, 使用的方法)。
+    """
+    expected = _normalize_text(text)
 
+    def matches(d):
+        return _normalize_text(_element_text(d, element)) == expected
 
-def _find_send_button(driver) -> Optional[Any]:
-    """查找发送按钮"""
-    print("🔍 正在查找发送按钮...")
+    try:
+        driver.execute_script(_JS_SELECT_CONTENTS, element)
+        driver.execute_cdp_cmd("Input.insertText", {"text": text})
+        if _wait_until(driver, VALUE_TIMEOUT, matches):
+            return True, "CDP Input.insertText"
+    except WebDriverException as e:
+        print(f"⚠️ CDP 注入失败: {e}")
 
-    for selector in SEND_BUTTON_SELECTORS:
+    driver.execute_script(_JS_SET_VALUE, element, text)
+    if _wait_until(driver, VALUE_TIMEOUT, matches):
+        return True, "value setter"
+    return False, "value setter"
+
+
+def _wait_for_submit(driver, element, prompt_text: str) -> bool:
+    """提交确认：输入框被清空/改写或从 DOM 移除，或 _watch_requests 之后页面发出了 fetch/XHR 请求"""
+    expected = _normalize_text(prompt_text)
+
+    def submitted(d):
         try:
-            elements = driver.find_elements(By.CSS_SELECTOR, selector)
-            for element in elements:
-                if element.is_displayed() and element.is_enabled():
-                    print(f"✅ 找到发送按钮: {selector}")
-                    return element
-        except Exception as e:
-            print(f"⚠️ 选择器 {selector} 出错: {e}")
-            continue
-
-    # 通用按钮查找
-    try:
-        buttons = driver.find_elements(By.TAG_NAME, "button")
-        for btn in buttons:
-            if (btn.is_displayed() and btn.is_enabled() and
-                    any(keyword in (btn.text or "").lower() + (btn.get_attribute("aria-label") or "").lower()
-                        for keyword in ["send", "submit", "generate", "create", "生成", "发送", "提交"])):
-                print(f"✅ 找到通用发送按钮: {btn.text}")
-                return btn
-    except Exception as e:
-        print(f"⚠️ 通用按钮查找出错: {e}")
+            if _normalize_text(d.execute_script(_JS_ELEMENT_TEXT, element)) != expected:
+                return True
+        except StaleElementReferenceException:
+            return True
+        return _request_count(d) > 0
+
+    return bool(_wait_until(driver, SUBMIT_CONFIRM_TIMEOUT, submitted))
 
-    print("❌ 未找到合适的发送按钮")
-    return None
 
+def _wait_for_input(driver, timeout: float) -> Optional[Any]:
+    return _wait_until(driver, timeout, lambda d: _find_input_element(d, verbose=False))
 
-def _input_and_submit(driver, prompt_text: str) -> Tuple[bool, str]:
-    """输入文本并提交"""
+
+def _input_and_submit(driver, prompt_text: str, timeout: float = INPUT_READY_TIMEOUT) -> Tuple[str, str]:
+    """
+    输入文本并提交，返回 (状态, 原因)：
+      submitted   —— 已确认提交
+      unconfirmed —— 回车/点击已发出但未检测到提交，可能已经提交，不可重发
+      failed      —— 尚未发出任何提交动作，可以安全重试
+    """
     print(f"📝 开始输入文本: {prompt_text[:50]}...")
 
-    # 查找输入框
-    input_element = _find_input_element(driver)
+    # 等待输入框就绪
+    input_element = _wait_for_input(driver, timeout)
     if not input_element:
-        return False, "未找到输入框"
+        return "failed", "未找到输入框"
 
+    sent = False
     try:
         # 聚焦到输入框
         print("🎯 聚焦输入框...")
         driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", input_element)
-        time.sleep(0.5)
         input_element.click()
-        time.sleep(0.5)
-
-        # 清空输入框
-        print("🧹 清空输入框...")
-        input_element.clear()
-        time.sleep(0.3)
-
-        # 方法1：直接输入
-        try:
-            # 方法2：使用剪贴板
-            print("📋 方法2：使用剪贴板粘贴...")
-            if _set_clipboard(prompt_text):
-                input_element.send_keys(Keys.CONTROL, "v")
-                time.sleep(PASTE_STABILIZE_SECONDS)
-            else:
-                return False, "设置剪贴板失败"
-        except Exception as e:
-            pass
-        # 验证输入
-        current_value = input_element.get_attribute("value") or input_element.text
-        print(f"📋 当前输入框内容: {current_value[:50]}...")
-
-        # 提交方法1：回车
+        if not _wait_until(driver, FOCUS_TIMEOUT, lambda d: d.execute_script(_JS_IS_FOCUSED, input_element)):
+            print("⚠️ 输入框未获得焦点，继续尝试...")
+
+        # 注入文本（替换原有内容）并校验：内容与 Prompt 一致后才提交
+        print("⌨️ 注入文本...")
+        ok, method = _insert_text(driver, input_element, prompt_text)
+        if not ok:
+            current_value = _element_text(driver, input_element)
+            return "failed", f"输入内容校验失败（当前: {current_value[:50]}...）"
+        print(f"📋 输入内容已校验（{method}）")
+
+        # 提交方法1：回车；按键一旦发出就不再尝试其他方法
         print("⏎ 尝试回车提交...")
+        _watch_requests(driver)
         try:
             input_element.send_keys(Keys.ENTER)
-            time.sleep(2.0)
-            return True, "回车提交成功"
-        except Exception as e:
+            sent = True
+        except WebDriverException as e:
             print(f"⚠️ 回车提交失败: {e}")
+        if sent:
+            if _wait_for_submit(driver, input_element, prompt_text):
+                return "submitted", "回车提交成功"
+            print("⚠️ 回车后未检测到提交，不再重发")
+            return "unconfirmed", "已按回车，但未检测到提交"
 
-        # 提交方法2：点击发送按钮
+        # 提交方法2：回车未能发出时点击发送按钮
         print("🖱️ 尝试点击发送按钮...")
         send_button = _find_send_button(driver)
-        if send_button:
-            try:
-                driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", send_button)
-                time.sleep(0.5)
-                send_button.click()
-                time.sleep(2.0)
-                return True, "按钮点击提交成功"
-            except Exception as e:
-                print(f"⚠️ 按钮点击失败: {e}")
-                # 使用JavaScript点击
-                try:
-                    driver.execute_script("arguments[0].click();", send_button)
-                    time.sleep(2.0)
-                    return True, "JavaScript点击提交成功"
-                except Exception as e2:
-                    print(f"⚠️ JavaScript点击也失败: {e2}")
-
-        return False, "所有提交方法都失败"
+        if not send_button:
+            return "failed", "所有提交方法都失败"
+        driver.execute_script("arguments[0].scrollIntoView({block: 'center'});", send_button)
+        try:
+            send_button.click()
+            method = "按钮点击提交成功"
+        except WebDriverException as e:
+            print(f"⚠️ 按钮点击失败: {e}")
+            # 原生点击未送达时改用JavaScript点击
+            driver.execute_script("arguments[0].click();", send_button)
+            method = "JavaScript点击提交成功"
+        sent = True
+        if _wait_for_submit(driver, input_element, prompt_text):
+            return "submitted", method
+        return "unconfirmed", "已点击发送按钮，但未检测到提交"
 
     except Exception as e:
         print(f"❌ 输入和提交过程出错: {e}")
-        return False, f"输入提交异常: {e}"
+        return ("unconfirmed" if sent else "failed"), f"输入提交异常: {e}"
 
 
 def generate_video_in_flow(prompt_text: str,
                            debugging_port: Optional[int] = None,
-                           flow_url: Optional[str] = None) -> Dict[str, Any]:
-    """主函数：生成视频"""
+                           flow_url: Optional[str] = None,
+                           task_id: Optional[str] = None,
+                           prompt_path: Optional[str] = None,
+                           wait_for_render: Optional[bool] = None,
+                           fallback_port: bool = True) -> Dict[str, Any]:
+    """
+    主函数：生成视频。
+    wait_for_render 为真（默认取 flow.results.track_completion）时，提交后等待渲染完成并下载结果，
+    结果与 task_id / prompt_path 关联，返回 status=rendered 与 output_path。
+    fallback_port 为假时（受管 Chrome 实例组）只使用 debugging_port，不通则失败，不回退到其他浏览器。
+    """
     print("🚀 开始Flow视频生成流程...")
+    if wait_for_render is None:
+        wait_for_render = flow_results.track_completion
 
     # 选择工作端口
-    port = _choose_working_port(debugging_port if debugging_port else None)
+    port = choose_working_port(debugging_port if debugging_port else None, fallback=fallback_port)
+    if not port and not fallback_port:
+        return {"success": False, "message": f"Chrome 端口 {debugging_port} 无响应（未回退到其他浏览器）"}
     if not port:
         return {"success": False, "message":
             "未检测到 DevTools 端口。请关闭所有 Chrome 后，用自定义目录启动："
@@ -344,93 +392,61 @@ def generate_video_in_flow(prompt_text: str,
 
     print(f"🔌 使用端口: {port}")
 
-    # 安装ChromeDriver
+    # 从会话池借用已附着的驱动（首次借用时安装 ChromeDriver 并附着，之后复用）
     try:
-        info = _probe_devtools_json(port)
-        major = _parse_major((info or {}).get("Browser", "")) or "latest"
-        driver_path = _install_matching_chromedriver(major)
-        print(f"🚗 ChromeDriver路径: {driver_path}")
-    except Exception as e:
-        return {"success": False, "message": f"安装匹配 ChromeDriver 失败：{e}"}
-
-    # 连接到Chrome
-    try:
-        driver = _attach_driver(port, driver_path)
-        print("✅ 成功连接到Chrome")
-    except Exception as e:
-        return {"success": False, "message": f"Selenium 附着失败（port={port}）：{e}"}
-
-    try:
-        # 查找或打开Flow页面
-        print("🔍 查找Flow页面...")
-        flow_handle = None
-
-        for handle in driver.window_handles:
-            driver.switch_to.window(handle)
-            current_url = (driver.current_url or "").lower()
-            print(f"📄 检查标签页: {current_url}")
-
-            # 更宽松的URL匹配
-            if any(keyword in current_url for keyword in ["flow", "veo", "labs.google", "ai.google"]):
-                flow_handle = handle
-                print(f"✅ 找到Flow页面: {current_url}")
-                break
-
-        # 如果没找到Flow页面，尝试打开
-        if not flow_handle and flow_url:
-            print(f"🌐 打开新的Flow页面: {flow_url}")
-            driver.switch_to.window(driver.window_handles[0])
-            driver.execute_script(f"window.open('{flow_url}','_blank');")
-            time.sleep(3.0)
-            flow_handle = driver.window_handles[-1]
-            driver.switch_to.window(flow_handle)
-
-        if not flow_handle:
-            return {"success": False, "message": "未找到 Flow 标签页，且未提供 flow_url。"}
-
-        driver.switch_to.window(flow_handle)
-        print(f"🎯 当前页面: {driver.current_url}")
-
-        # 等待页面加载完成
-        print("⏳ 等待页面加载...")
-        try:
-            WebDriverWait(driver, 15).until(
-                lambda d: d.execute_script("return document.readyState") == "complete"
-            )
-            print("✅ 页面加载完成")
-        except TimeoutException:
-            print("⚠️ 页面加载超时，但继续尝试...")
-
-        # 额外等待JavaScript渲染
-        time.sleep(3.0)
-
-        # 多次尝试输入和提交
-        print("🔄 开始尝试输入和提交...")
-        start_time = time.time()
-        attempt = 0
-
-        while time.time() - start_time < APP_READY_TOTAL_SECONDS:
-            attempt += 1
-            print(f"\n🎯 第 {attempt} 次尝试...")
-
-            success, reason = _input_and_submit(driver, prompt_text)
-            if success:
-                print(f"🎉 成功！原因: {reason}")
-                return {"success": True, "message": f"已提交生成请求（{reason}）"}
-
-            print(f"⚠️ 第 {attempt} 次尝试失败: {reason}")
-            time.sleep(RETRY_INTERVAL_SECONDS)
-
-        return {"success": False, "message": f"经过 {attempt} 次尝试后仍未成功。最后失败原因: {reason}"}
-
+        with flow_session_pool.session(port, flow_url) as session:
+            before: List[str] = []
+            result = _submit_on_session(session.driver, prompt_text, before if wait_for_render else None)
+            if result["success"] and wait_for_render:
+                try:
+                    result.update(flow_results.collect(session.driver, before, prompt_text,
+                                                       task_id=task_id, prompt_path=prompt_path))
+                except Exception as e:
+                    print(f"⚠️ 下载生成结果失败: {e}")
+                    result.update({"status": "submitted", "message": f"已提交，但下载结果失败：{e}"})
+            return result
     except Exception as e:
         print(f"❌ 自动化过程异常: {e}")
         return {"success": False, "message": f"自动化异常：{e}"}
 
-    finally:
-        # 可选：关闭driver（如果你不需要保持连接）
-        # driver.quit()
-        pass
+
+def _submit_on_session(driver, prompt_text: str, snapshot: Optional[List[str]] = None) -> Dict[str, Any]:
+    """在已切换到 Flow 标签页的驱动上输入并提交；snapshot 不为 None 时记下提交前页面上已有的视频地址"""
+    print(f"🎯 当前页面: {driver.current_url}")
+
+    # 等待页面加载完成（之后由输入框就绪条件等待 JavaScript 渲染）
+    print("⏳ 等待页面加载...")
+    if _wait_until(driver, PAGE_LOAD_TIMEOUT, lambda d: d.execute_script("return document.readyState") == "complete"):
+        print("✅ 页面加载完成")
+    else:
+        print("⚠️ 页面加载超时，但继续尝试...")
+
+    # 多次尝试输入和提交；每次尝试都先等待输入框就绪，不再固定间隔
+    print("🔄 开始尝试输入和提交...")
+    deadline = time.time() + APP_READY_TOTAL_SECONDS
+    attempt = 0
+    reason = ""
+
+    while time.time() < deadline:
+        attempt += 1
+        print(f"\n🎯 第 {attempt} 次尝试...")
+
+        if snapshot is not None:
+            snapshot[:] = media_urls(driver)
+        status, reason = _input_and_submit(driver, prompt_text,
+                                           timeout=min(INPUT_READY_TIMEOUT, max(0.0, deadline - time.time())))
+        if status == "submitted":
+            print(f"🎉 成功！原因: {reason}")
+            return {"success": True, "status": "submitted", "message": f"已提交生成请求（{reason}）"}
+        if status == "unconfirmed":
+            # 提交动作可能已生效，重试会重复生成
+            print(f"⚠️ 提交未确认，停止重试: {reason}")
+            return {"success": False, "status": "unconfirmed", "message": f"提交未确认，请在页面上核实（{reason}）"}
+
+        print(f"⚠️ 第 {attempt} 次尝试失败: {reason}")
+        time.sleep(RETRY_BACKOFF_SECONDS)
+
+    return {"success": False, "message": f"经过 {attempt} 次尝试后仍未成功。最后失败原因: {reason}"}
 
 
 # 使用示例
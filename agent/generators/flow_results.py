@@ -0,0 +1,265 @@
+# agent/generators/flow_results.py
+# -*- coding: utf-8 -*-
+"""
+agent/generators/flow_results.py
+===========================================================
+作用：
+  Flow 生成结果的完成跟踪与自动下载。提交成功只代表请求已发出，这里负责闭环：
+  - 提交前记下页面上已有的视频地址（<video>/<source> 的 src、指向 .mp4 / 带 download 属性的链接），
+    提交后在同一标签页轮询 DOM，出现新的视频地址、且其所在结果卡片的文字包含本次 Prompt 的开头时
+    才视为本任务渲染完成（同一项目的多个标签页并行时，别的标签页的结果也会出现在画廊里）
+  - 下载：http(s) 地址带上浏览器的 Cookie / User-Agent 分块流式写入；blob:/data: 地址在页面内读取后
+    按块（base64）取回，不把整个文件一次性传回
+  - 结果落到独立的受管视频存储（复用 VideoStore：临时文件 → 校验 → 原子 rename），
+    结果索引按任务 ID 记录（存储 key 为 flow:<task_id>），并关联 Prompt 路径；未带任务 ID 的单次提交生成一次性 ID
+  - 只有同一任务重试时，已有有效结果的才直接跳过；相同 Prompt 的新任务照常生成
+
+配置见 config/default.yaml 的 flow.results 段。
+"""
+import base64
+import json
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import requests
+from selenium.webdriver.support.ui import WebDriverWait
+from selenium.common.exceptions import TimeoutException
+
+from agent.config import config_section
+from agent.enhancers.video_store import VideoStore
+from agent.utils.io import write_json
+
+# 页面上当前所有候选视频地址
+# 每个候选视频地址及其结果卡片的文字：向上找最近一个有足够文字的祖先元素
+_JS_MEDIA_CARDS = r"""
+const minText = arguments[0];
+const out = [];
+const cardText = el => {
+  for (let e = el.parentElement, depth = 0; e && depth < 10; e = e.parentElement, depth++) {
+    const t = (e.innerText || '').trim();
+    if (t.length >= minText) return t;
+  }
+  return '';
+};
+document.querySelectorAll('video, video source, a[href]').forEach(e => {
+  let u;
+  if (e.tagName === 'A') {
+    const h = e.href || '';
+    if (!(e.hasAttribute('download') || /\.mp4(\?|$)/i.test(h))) return;
+    u = h;
+  } else {
+    u = e.currentSrc || e.src || e.getAttribute('src');
+  }
+  if (u) out.push({url: u, text: cardText(e.tagName === 'SOURCE' ? e.parentElement : e)});
+});
+return out;
+"""
+
+_JS_MEDIA_URLS = r"""
+const urls = new Set();
+document.querySelectorAll('video, video source').forEach(e => {
+  const u = e.currentSrc || e.src || e.getAttribute('src');
+  if (u) urls.add(u);
+});
+document.querySelectorAll('a[href]').forEach(a => {
+  const h = a.href || '';
+  if (a.hasAttribute('download') || /\.mp4(\?|$)/i.test(h)) urls.add(h);
+});
+return Array.from(urls);
+"""
+
+# 在页面内取回 blob:/data: 地址的内容并暂存，返回字节数
+_JS_STAGE_BLOB = r"""
+const [url, done] = [arguments[0], arguments[arguments.length - 1]];
+fetch(url).then(r => r.blob()).then(b => {
+  window.__flowResultBlobs = window.__flowResultBlobs || {};
+  window.__flowResultBlobs[url] = b;
+  done(b.size);
+}).catch(e => done(-1));
+"""
+
+# 按块读取暂存的 blob，返回 base64
+_JS_READ_BLOB_CHUNK = r"""
+const [url, start, end, done] = arguments;
+const b = (window.__flowResultBlobs || {})[url];
+if (!b) { done(null); return; }
+const reader = new FileReader();
+reader.onload = () => done(reader.result.split(',', 2)[1] || '');
+reader.onerror = () => done(null);
+reader.readAsDataURL(b.slice(start, end));
+"""
+
+_JS_DROP_BLOB = "if (window.__flowResultBlobs) delete window.__flowResultBlobs[arguments[0]];"
+
+
+def _results_cfg() -> Dict[str, Any]:
+    return config_section("flow").get("results") or {}
+
+
+def _normalize(text: str) -> str:
+    return " ".join((text or "").split()).lower()
+
+
+def media_cards(driver, min_text: int = 20) -> List[Dict[str, str]]:
+    try:
+        return list(driver.execute_script(_JS_MEDIA_CARDS, min_text) or [])
+    except Exception:
+        return []
+
+
+def media_urls(driver) -> List[str]:
+    try:
+        return list(driver.execute_script(_JS_MEDIA_URLS) or [])
+    except Exception:
+        return []
+
+
+class FlowResults:
+    def __init__(self, root: Optional[str] = None, index_path: Optional[str] = None,
+                 render_timeout_seconds: Optional[float] = None, poll_seconds: Optional[float] = None,
+                 chunk_bytes: Optional[int] = None, max_bytes: Optional[int] = None):
+        cfg = _results_cfg()
+        self.track_completion = bool(cfg.get("track_completion", True))
+        self.root = root or cfg.get("root") or os.path.join("outputs", "flow_results")
+        # 显式指定 root 时索引跟随 root，不再使用配置中的 index_path
+        self.index_path = index_path or (None if root else cfg.get("index_path")) or os.path.join(self.root, "results.json")
+        self.render_timeout_seconds = float(render_timeout_seconds if render_timeout_seconds is not None
+                                            else cfg.get("render_timeout_seconds", 900))
+        self.poll_seconds = float(poll_seconds if poll_seconds is not None else cfg.get("poll_seconds", 2))
+        self.chunk_bytes = int(chunk_bytes or cfg.get("chunk_bytes", 1024 * 1024))
+        self.match_prompt = bool(cfg.get("match_prompt", True))
+        self.match_chars = int(cfg.get("match_chars", 40))
+        # 生成结果不应被轻易淘汰：默认配额远大于素材缓存，且 30 天内访问过的不淘汰
+        self.store = VideoStore(root=self.root,
+                                max_bytes=int(max_bytes if max_bytes is not None
+                                              else cfg.get("max_bytes", 50 * 1024 ** 3)),
+                                min_age_seconds=30 * 24 * 3600)
+        self._index: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+
+    # ---------------- 结果索引 ----------------
+
+    def _load(self) -> Dict[str, Any]:
+        if self._index is None:
+            try:
+                with open(self.index_path, "r", encoding="utf-8") as f:
+                    self._index = json.load(f) or {}
+            except (OSError, ValueError):
+                self._index = {}
+            self._index.setdefault("tasks", {})
+        return self._index
+
+    @staticmethod
+    def key_for(task_id: str) -> str:
+        return f"flow:{task_id}"
+
+    def find(self, task_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """找到该任务已渲染且文件仍有效的结果"""
+        if not task_id:
+            return None
+        with self._lock:
+            rec = self._load()["tasks"].get(task_id)
+        if rec is None:
+            return None
+        path = self.store.lookup(rec["key"])
+        return dict(rec, output_path=str(path)) if path is not None else None
+
+    def record(self, task_id: str, prompt_path: Optional[str], video_url: str, output_path: Path) -> Dict[str, Any]:
+        rec = {"task_id": task_id, "prompt_path": prompt_path, "key": self.key_for(task_id),
+               "video_url": video_url, "output_path": str(output_path), "rendered_at": time.time()}
+        with self._lock:
+            self._load()["tasks"][task_id] = rec
+            write_json(self.index_path, self._index)
+        return rec
+
+    # ---------------- 完成跟踪 ----------------
+
+    def _matches(self, card_text: str, prompt_text: str) -> bool:
+        """结果卡片文字包含 Prompt 开头（空白归一、不区分大小写）"""
+        snippet = _normalize(prompt_text)[:self.match_chars]
+        return bool(snippet) and snippet in _normalize(card_text)
+
+    def wait_for_render(self, driver, before: List[str], prompt_text: str,
+                        timeout: Optional[float] = None) -> Optional[str]:
+        """轮询当前标签页，返回提交后新出现、且属于本次提交的视频地址；超时返回 None"""
+        known = set(before)
+
+        def new_url(d):
+            if not self.match_prompt:
+                fresh = [u for u in media_urls(d) if u not in known]
+            else:
+                fresh = [c["url"] for c in media_cards(d)
+                         if c.get("url") not in known and self._matches(c.get("text", ""), prompt_text)]
+            return fresh[-1] if fresh else False
+
+        try:
+            return WebDriverWait(driver, timeout if timeout is not None else self.render_timeout_seconds,
+                                 poll_frequency=self.poll_seconds).until(new_url)
+        except TimeoutException:
+            return None
+
+    # ---------------- 下载 ----------------
+
+    def _download_http(self, driver, url: str, tmp: Path) -> None:
+        cookies = {c["name"]: c["value"] for c in driver.get_cookies()}
+        headers = {"User-Agent": driver.execute_script("return navigator.userAgent"), "Referer": driver.current_url}
+        with requests.get(url, cookies=cookies, headers=headers, stream=True, timeout=(10, 120)) as r:
+            r.raise_for_status()
+            with open(tmp, "wb") as f:
+                for chunk in r.iter_content(chunk_size=self.chunk_bytes):
+                    if chunk:
+                        f.write(chunk)
+
+    def _download_blob(self, driver, url: str, tmp: Path) -> None:
+        size = driver.execute_async_script(_JS_STAGE_BLOB, url)
+        if size is None or size < 0:
+            raise RuntimeError(f"页面内读取视频失败: {url[:80]}")
+        try:
+            with open(tmp, "wb") as f:
+                for start in range(0, size, self.chunk_bytes):
+                    data = driver.execute_async_script(_JS_READ_BLOB_CHUNK, url, start,
+                                                       min(size, start + self.chunk_bytes))
+                    if data is None:
+                        raise RuntimeError(f"读取视频分块失败（offset={start}）")
+                    f.write(base64.b64decode(data))
+        finally:
+            driver.execute_script(_JS_DROP_BLOB, url)
+
+    def download(self, driver, url: str, key: str) -> Path:
+        """下载视频到结果存储的 key 下，返回入库后的路径"""
+        with self.store.key_lock(key):
+            tmp = self.store.temp_path(key)
+            if url.startswith(("http://", "https://")):
+                self._download_http(driver, url, tmp)
+            else:
+                self._download_blob(driver, url, tmp)
+            return self.store.commit(key, tmp, source_url=url if not url.startswith("data:") else "",
+                                     kind="flow_result")
+
+    def collect(self, driver, before: List[str], prompt_text: str, task_id: Optional[str] = None,
+                prompt_path: Optional[str] = None) -> Dict[str, Any]:
+        """等待渲染完成并下载，返回合入任务结果的字段；未给出 task_id 时按一次性 ID 记录"""
+        print("⏳ 等待Flow渲染完成...")
+        url = self.wait_for_render(driver, before, prompt_text)
+        if url is None:
+            print("⚠️ 等待渲染超时，未找到新的视频结果")
+            return {"status": "submitted", "message": "已提交，但在超时时间内未检测到渲染结果"}
+        print(f"🎬 检测到渲染结果，开始下载: {url[:80]}")
+        task_id = task_id or uuid.uuid4().hex
+        path = self.download(driver, url, self.key_for(task_id))
+        rec = self.record(task_id, prompt_path, url, path)
+        print(f"✅ 结果已保存: {path}")
+        return {"status": "rendered", "output_path": rec["output_path"], "video_url": url}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rendered = len(self._load()["tasks"])
+        return {"rendered": rendered, "store": self.store.stats()}
+
+
+# 全局结果跟踪实例
+flow_results = FlowResults()
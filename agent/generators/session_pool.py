@@ -0,0 +1,288 @@
+# agent/generators/session_pool.py
+# -*- coding: utf-8 -*-
+"""
+agent/generators/session_pool.py
+===========================================================
+作用：
+  Flow 浏览器会话池。每个 DevTools 端口（一个浏览器）划分为 tabs_per_browser 个“标签页槽位”，
+  每个槽位持有一个独立附着的 WebDriver 会话和一个专属的 Flow 标签页，多个任务可在同一浏览器里并行提交：
+  - 任务借用任一空闲槽位、用完归还；同一槽位同一时刻只借给一个任务（WebDriver 会话不是线程安全的）
+  - 各槽位的会话有自己的“当前窗口”，脚本与 CDP 命令只作用于本槽位的标签页；
+    新标签页在后台创建并开启焦点模拟，标签页之间不需要抢前台
+  - 借用时做健康检查（一次 execute_script），失效则退出旧驱动并重连
+  - 缓存各槽位的 Flow 标签页句柄，句柄失效、URL 不再匹配或被其他槽位占用时才重新查找；
+    同一浏览器的标签页查找按端口串行，读取已占用句柄到登记新句柄之间不会被其他槽位插入
+  - 空闲超过 idle_timeout_seconds 的会话在下次借用时被回收；
+    close_all() 在应用退出时调用，确保 chromedriver 进程不泄漏
+
+配置见 config/default.yaml 的 flow.session 段。
+"""
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+from selenium.common.exceptions import WebDriverException
+
+from agent.config import config_section
+from agent.generators.devtools import attach_driver, chromedriver_cache, port_discovery
+
+FLOW_URL_KEYWORDS = ["flow", "veo", "labs.google", "ai.google"]
+NEW_TAB_TIMEOUT_SECONDS = 10.0
+
+
+def _session_cfg() -> Dict[str, Any]:
+    return config_section("flow").get("session") or {}
+
+
+@dataclass
+class FlowSession:
+    port: int
+    driver: Any
+    slot: int = 0
+    driver_path: str = ""
+    flow_handle: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.time)
+
+    def quit(self) -> None:
+        try:
+            self.driver.quit()
+        except Exception:
+            pass
+
+
+def _is_flow_url(url: str) -> bool:
+    url = (url or "").lower()
+    return any(keyword in url for keyword in FLOW_URL_KEYWORDS)
+
+
+def _open_background_tab(driver: Any, url: str) -> str:
+    """用 CDP 在后台新建标签页（不切到前台）；chromedriver 的窗口句柄即 targetId"""
+    try:
+        target = driver.execute_cdp_cmd("Target.createTarget", {"url": url, "background": True})["targetId"]
+    except WebDriverException:
+        driver.switch_to.new_window("tab")
+        driver.get(url)
+        return driver.current_window_handle
+    deadline = time.time() + NEW_TAB_TIMEOUT_SECONDS
+    while target not in driver.window_handles:
+        if time.time() > deadline:
+            raise RuntimeError(f"新标签页未出现: {target}")
+        time.sleep(0.05)
+    return target
+
+
+def find_flow_tab(driver: Any, flow_url: Optional[str] = None, exclude: Optional[Set[str]] = None) -> Optional[str]:
+    """
+    找一个未被其他槽位占用（不在 exclude 中）的 Flow 标签页；找不到时在后台新开一个，
+    URL 取 flow_url，未提供时沿用其他槽位正在使用的 Flow 页面地址。
+    """
+    exclude = exclude or set()
+    claimed_url = None
+    for handle in driver.window_handles:
+        driver.switch_to.window(handle)
+        current_url = driver.current_url or ""
+        if handle in exclude:
+            claimed_url = claimed_url or current_url
+            continue
+        if _is_flow_url(current_url):
+            return handle
+
+    url = flow_url or claimed_url
+    if url:
+        print(f"🌐 在后台打开新的Flow页面: {url}")
+        return _open_background_tab(driver, url)
+    return None
+
+
+class FlowSessionPool:
+    def __init__(self, idle_timeout_seconds: Optional[float] = None, borrow_timeout_seconds: Optional[float] = None,
+                 tabs_per_browser: Optional[int] = None):
+        cfg = _session_cfg()
+        self.idle_timeout_seconds = float(idle_timeout_seconds if idle_timeout_seconds is not None
+                                          else cfg.get("idle_timeout_seconds", 900))
+        self.borrow_timeout_seconds = float(borrow_timeout_seconds if borrow_timeout_seconds is not None
+                                            else cfg.get("borrow_timeout_seconds", 300))
+        self.tabs_per_browser = max(1, int(tabs_per_browser or cfg.get("tabs_per_browser", 3)))
+        self._sessions: Dict[Tuple[int, int], FlowSession] = {}
+        self._busy: Dict[int, Set[int]] = {}
+        self._tab_locks: Dict[int, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+
+    # ---------------- 连接 ----------------
+
+    def _connect(self, port: int, slot: int) -> FlowSession:
+        try:
+            driver_path = chromedriver_cache.for_port(port)
+            print(f"🚗 ChromeDriver路径: {driver_path}")
+        except Exception as e:
+            raise RuntimeError(f"安装匹配 ChromeDriver 失败：{e}")
+        try:
+            driver = attach_driver(port, driver_path)
+        except Exception as e:
+            port_discovery.invalidate(port)
+            raise RuntimeError(f"Selenium 附着失败（port={port}）：{e}")
+        print(f"✅ 成功连接到Chrome（port={port}, 槽位 {slot}）")
+        return FlowSession(port=port, driver=driver, slot=slot, driver_path=driver_path)
+
+    @staticmethod
+    def _healthy(session: FlowSession) -> bool:
+        try:
+            return session.driver.execute_script("return 1") == 1
+        except Exception:
+            return False
+
+    def _discard(self, key: Tuple[int, int]) -> None:
+        with self._lock:
+            session = self._sessions.pop(key, None)
+        if session is not None:
+            session.quit()
+
+    def _claimed_handles(self, port: int, slot: int) -> Set[str]:
+        """同一浏览器中其他槽位正在使用的 Flow 标签页"""
+        with self._lock:
+            return {s.flow_handle for (p, k), s in self._sessions.items()
+                    if p == port and k != slot and s.flow_handle}
+
+    def _tab_lock(self, port: int) -> threading.Lock:
+        with self._lock:
+            return self._tab_locks.setdefault(port, threading.Lock())
+
+    def _ensure_flow_tab(self, session: FlowSession, flow_url: Optional[str]) -> str:
+        driver = session.driver
+        # 持锁直到登记句柄，避免两个槽位同时选中同一个未占用的标签页
+        with self._tab_lock(session.port):
+            claimed = self._claimed_handles(session.port, session.slot)
+            handle = session.flow_handle
+            if handle and handle not in claimed and handle in driver.window_handles:
+                driver.switch_to.window(handle)
+                if _is_flow_url(driver.current_url):
+                    return handle
+            print("🔍 查找Flow页面...")
+            handle = find_flow_tab(driver, flow_url, exclude=claimed)
+            if not handle:
+                raise RuntimeError("未找到 Flow 标签页，且未提供 flow_url。")
+            session.flow_handle = handle
+        print(f"✅ 使用Flow标签页: {handle}（port={session.port}, 槽位 {session.slot}）")
+        driver.switch_to.window(handle)
+        try:
+            # 后台标签页也按“已聚焦”处理焦点与输入事件
+            driver.execute_cdp_cmd("Emulation.setFocusEmulationEnabled", {"enabled": True})
+        except WebDriverException:
+            pass
+        return handle
+
+    # ---------------- 槽位 ----------------
+
+    def capacity(self, browsers: int = 1) -> int:
+        """browsers 个浏览器可同时进行的 Flow 任务数"""
+        return self.tabs_per_browser * max(1, browsers)
+
+    def _acquire_slot(self, port: int) -> int:
+        """占用一个空闲槽位（优先已有会话的槽位）；全部占用时等待归还"""
+        deadline = time.time() + self.borrow_timeout_seconds
+        with self._slot_freed:
+            while True:
+                busy = self._busy.setdefault(port, set())
+                free = [k for k in range(self.tabs_per_browser) if k not in busy]
+                if free:
+                    slot = min(free, key=lambda k: ((port, k) not in self._sessions, k))
+                    busy.add(slot)
+                    return slot
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise RuntimeError(f"等待端口 {port} 的空闲标签页超时")
+                self._slot_freed.wait(remaining)
+
+    def _release_slot(self, port: int, slot: int) -> None:
+        with self._slot_freed:
+            self._busy.get(port, set()).discard(slot)
+            self._slot_freed.notify()
+
+    # ---------------- 借用 / 归还 ----------------
+
+    @contextmanager
+    def session(self, port: int, flow_url: Optional[str] = None) -> Iterator[FlowSession]:
+        """借用端口上一个空闲槽位的会话（已切换到该槽位的 Flow 标签页）；WebDriver 异常时丢弃会话，下次借用重连"""
+        slot = self._acquire_slot(port)
+        try:
+            session = self._checkout(port, slot, flow_url)
+            try:
+                yield session
+            except WebDriverException:
+                self._discard((port, slot))
+                raise
+            finally:
+                session.last_used = time.time()
+        finally:
+            self._release_slot(port, slot)
+
+    def _register(self, port: int, slot: int) -> FlowSession:
+        session = self._connect(port, slot)
+        with self._lock:
+            self._sessions[(port, slot)] = session
+        return session
+
+    def _checkout(self, port: int, slot: int, flow_url: Optional[str]) -> FlowSession:
+        # 槽位已标记为占用，reap_idle 不会回收它
+        key = (port, slot)
+        self.reap_idle()
+        session = self._sessions.get(key)
+        if session is not None and not self._healthy(session):
+            print(f"♻️ 端口 {port} 槽位 {slot} 的会话已失效，重新连接")
+            self._discard(key)
+            session = None
+        if session is None:
+            session = self._register(port, slot)
+        try:
+            self._ensure_flow_tab(session, flow_url)
+        except WebDriverException:
+            # 标签页/会话在健康检查之后失效：重连一次
+            self._discard(key)
+            session = self._register(port, slot)
+            self._ensure_flow_tab(session, flow_url)
+        return session
+
+    # ---------------- 回收 ----------------
+
+    def reap_idle(self) -> int:
+        """退出空闲超时的会话（正在借用的槽位除外），返回回收数量"""
+        now = time.time()
+        with self._lock:
+            idle = [key for key, s in self._sessions.items()
+                    if key[1] not in self._busy.get(key[0], set()) and now - s.last_used > self.idle_timeout_seconds]
+            sessions = [self._sessions.pop(key) for key in idle]
+        for s in sessions:
+            print(f"🧹 回收空闲浏览器会话（port={s.port}, 槽位 {s.slot}）")
+            s.quit()
+        return len(sessions)
+
+    def close_port(self, port: int) -> None:
+        """退出某个浏览器的全部会话（浏览器崩溃/重启时调用）"""
+        with self._lock:
+            keys = [key for key in self._sessions if key[0] == port]
+            sessions = [self._sessions.pop(key) for key in keys]
+        for s in sessions:
+            s.quit()
+
+    def close_all(self) -> None:
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for s in sessions:
+            s.quit()
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            return {f"{p}/{k}": {"borrowed": k in self._busy.get(p, set()), "flow_handle": s.flow_handle,
+                                 "age_seconds": round(now - s.created_at, 1),
+                                 "idle_seconds": round(now - s.last_used, 1)}
+                    for (p, k), s in self._sessions.items()}
+
+
+# 全局会话池实例
+flow_session_pool = FlowSessionPool()
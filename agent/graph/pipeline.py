@@ -19,7 +19,7 @@ from agent.hotspot.finder import find_hotspots, manual_select
 from agent.interactive.refiner import refine_prompt_json, save_refined_version
 
 # --- 引入新的 Gemini 增强器 ---
-from agent.enhancers.gemini_vision import analyze_video_and_generate_prompt
+from agent.enhancers.video_pipeline import analyze_hotspots
 
 
 # ---------------- 节点实现 ----------------
@@ -67,7 +67,7 @@ def node_hotspot_select(state: GraphState) -> GraphState:
 # --- 新增节点：使用 Gemini 分析并生成 Prompt ---
 def node_analyze_and_generate(state: GraphState) -> GraphState:
     """
-    遍历已选择的热点，下载视频，用 Gemini 分析，并生成 v1 Prompt。
+    对已选择的热点并行下载视频、用 Gemini 分析，并生成 v1 Prompt。
     """
     series = state.get("series") or "Gemini Hotspot Series"
     selected_hotspots = state.get("hotspot_candidates") or []
@@ -77,13 +77,10 @@ def node_analyze_and_generate(state: GraphState) -> GraphState:
         print("⚠️ 没有选择任何热点，流程结束。")
         return state
 
-    for hotspot in selected_hotspots:
-        try:
-            path = analyze_video_and_generate_prompt(hotspot, series)
-            generated_paths.append(path)
-        except Exception as e:
-            print(f"❌ 处理热点 '{hotspot.get('title')}' 时发生错误: {e}")
-            continue
+    # 下载/上传/处理/分析分阶段并行，多个热点的耗时相互重叠
+    for result in analyze_hotspots(selected_hotspots, series):
+        if result.get("saved_path"):
+            generated_paths.append(result["saved_path"])
 
     state["generated_paths"] = generated_paths
     return state
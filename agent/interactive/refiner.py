@@ -4,21 +4,16 @@ import os, json, re, copy
 from datetime import datetime
 from typing import Tuple, Dict, Any, List
 from dotenv import load_dotenv
-from openai import OpenAI
 from pydantic import ValidationError
 from agent.prompt.schema_json import VideoPromptJSON
 from agent.utils.io import write_json, ensure_dir
 from agent.registry.store import register_prompt
+from agent.iterators.merge_policy import apply_deltas, validate_visual_deltas
+from agent.llm.gateway import chat_completion, PRIORITY_HIGH
 
 load_dotenv()
 
 
-def deepseek_client() -> OpenAI:
-    key = os.getenv("DEEPSEEK_API_KEY")
-    if not key: raise RuntimeError("缺少 DEEPSEEK_API_KEY")
-    return OpenAI(api_key=key, base_url="https://api.deepseek.com")
-
-
 def _now_iso() -> str:
     return datetime.now().astimezone().isoformat(timespec="seconds")
 
@@ -72,22 +67,62 @@ REFINE_SYSTEM = "你是严格的“视觉域 JSON 提示词改写器”。只允
 REFINE_USER_TMPL = '''CURRENT_PROMPT_JSON:\n{current_json}\n\nUSER_FEEDBACK (may be CN/EN; keep only VISUAL changes):\n{feedback}\n\nRULES:\n- Update ONLY visual fields listed in system instruction.\n- Ignore any packaging/thumbnail/title/engagement suggestions.\n- Keep schema valid; keep other fields identical.\n- Return JSON object ONLY (no explanation).'''
 
 
-def refine_prompt_json(base_json_path: str, user_feedback: str, model: str = "deepseek-chat") -> Tuple[
-    Dict[str, Any], Dict[str, Any], List[str]]:
-    old_obj = _read_json(base_json_path)
-    _ = VideoPromptJSON(**old_obj)
-    client = deepseek_client()
-    user_msg = REFINE_USER_TMPL.format(current_json=json.dumps(old_obj, ensure_ascii=False, indent=2),
-                                       feedback=user_feedback)
-    resp = client.chat.completions.create(model=model, messages=[{"role": "system", "content": REFINE_SYSTEM},
-                                                                 {"role": "user", "content": user_msg}],
-                                          temperature=0.2, response_format={"type": "json_object"})
-    content = resp.choices[0].message.content.strip()
+REFINE_PATCH_SYSTEM = "你是严格的“视觉域 JSON 提示词改写器”，只输出改动补丁而不是整份 JSON。只允许改动这些字段：veo_params.{aspect_ratio,person_generation,negative_prompt}；prompt.{concept,shots,actions,lighting,style,audio,timing,constraints}。禁止添加/修改与封面(thumbnail)、标题(title)、互动(engagement)、描述(description)有关的任何内容。最终必须输出严格 JSON（英文）。"
+REFINE_PATCH_USER_TMPL = '''CURRENT_PROMPT_JSON:\n{current_json}\n\nUSER_FEEDBACK (may be CN/EN; keep only VISUAL changes):\n{feedback}\n\nRULES:\n- Return ONLY the changes as {{"deltas": [{{"op": "set|append", "path": "...", "value": ...}}]}}.\n- "set" replaces a field, e.g. {{"op": "set", "path": "prompt.lighting", "value": "warm rim light"}}.\n- "append" adds list items, path ends with [], e.g. {{"op": "append", "path": "prompt.actions[]", "value": "slow down paw at 3s"}}.\n- Only touch the visual fields listed in the system instruction; values must keep the schema types.\n- Do NOT repeat unchanged fields. Return JSON object ONLY (no explanation).'''
+
+
+def _compact(obj: Dict[str, Any]) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def _refine_full(old_obj: Dict[str, Any], user_feedback: str, model: str) -> Dict[str, Any]:
+    """整份改写：模型返回完整 JSON，再按白名单叠加"""
+    user_msg = REFINE_USER_TMPL.format(current_json=_compact(old_obj), feedback=user_feedback)
+    content = chat_completion([{"role": "system", "content": REFINE_SYSTEM}, {"role": "user", "content": user_msg}],
+                              model=model, call_site="refine_prompt_json", temperature=0.2,
+                              response_format={"type": "json_object"}, priority=PRIORITY_HIGH)
     try:
         new_obj = json.loads(content)
     except json.JSONDecodeError as e:
         raise RuntimeError(f"返回不是合法 JSON：\\n{content}") from e
-    filtered_obj = _overlay_allowed(old_obj, new_obj)
+    return _overlay_allowed(old_obj, new_obj)
+
+
+def _refine_patch(old_obj: Dict[str, Any], user_feedback: str, model: str) -> Dict[str, Any]:
+    """补丁改写：模型只返回 op/path/value 列表，校验后用 apply_deltas 应用"""
+    user_msg = REFINE_PATCH_USER_TMPL.format(current_json=_compact(old_obj), feedback=user_feedback)
+    content = chat_completion([{"role": "system", "content": REFINE_PATCH_SYSTEM}, {"role": "user", "content": user_msg}],
+                              model=model, call_site="refine_prompt_json", temperature=0.2,
+                              response_format={"type": "json_object"}, priority=PRIORITY_HIGH)
+    try:
+        patch = json.loads(content)
+    except json.JSONDecodeError as e:
+        raise RuntimeError(f"返回不是合法 JSON：\\n{content}") from e
+    if isinstance(patch, list):
+        patch = {"deltas": patch}
+    if not isinstance(patch, dict):
+        raise RuntimeError(f"补丁格式不正确：\\n{content}")
+    if "deltas" not in patch and ("prompt" in patch or "veo_params" in patch):
+        # 模型没按补丁协议返回，而是给了整份 JSON：退回白名单叠加
+        return _overlay_allowed(old_obj, patch)
+    accepted, rejected = validate_visual_deltas(patch.get("deltas") or [], old_obj)
+    if rejected:
+        print(f"⚠️ 已丢弃 {len(rejected)} 条越界补丁: {rejected}")
+    return apply_deltas(old_obj, accepted)
+
+
+def refine_prompt_json(base_json_path: str, user_feedback: str, model: str = "deepseek-chat",
+                       mode: str = "patch") -> Tuple[Dict[str, Any], Dict[str, Any], List[str]]:
+    """
+    mode="patch"（默认）：只让模型输出改动补丁，输出 token 与延迟随改动大小而非 Prompt 大小增长；
+    mode="full"：旧协议，模型返回整份 JSON。
+    """
+    old_obj = _read_json(base_json_path)
+    _ = VideoPromptJSON(**old_obj)
+    if mode == "full":
+        filtered_obj = _refine_full(old_obj, user_feedback, model)
+    else:
+        filtered_obj = _refine_patch(old_obj, user_feedback, model)
     try:
         _ = VideoPromptJSON(**filtered_obj)
     except ValidationError as e:
@@ -12,12 +12,14 @@ agent/iterators/merge_policy.py
 """
 
 import copy
-from typing import Dict, Any, List
+import re
+from typing import Dict, Any, List, Optional, Tuple
 
 # delta 的最小格式约定（建议）：
 # {
 #   "op": "set|replace|append",
-#   "path": "veo_params.aspect_ratio" 或 "prompt.lighting" 或 "prompt.actions[]",
+#   "path": "veo_params.aspect_ratio" 或 "prompt.lighting" 或 "prompt.actions[]"
+#           或 "prompt.actions[0]" / "prompt.shots[1].camera"（列表下标：替换/插入已有列表中的元素）,
 #   "value": "9:16" 或 ["Add slow motion between 3.0-4.0s"] ...
 #   "reason": "why"（可选，用于日志/UI 展示）
 # }
@@ -56,11 +58,169 @@ def _ensure_field(obj: Dict[str, Any], path: str):
     for i, k in enumerate(keys):
         if i == len(keys) - 1:
             return cur, k
-        if keys not in cur or not isinstance(cur[keys], dict):
-            cur[keys] = {}
-        cur = cur[keys]
+        if k not in cur or not isinstance(cur[k], dict):
+            cur[k] = {}
+        cur = cur[k]
     return cur, keys[-1]
 
+_INDEX_RE = re.compile(r"\[(\d+)\]$")
+
+def _split_index(key: str) -> Tuple[str, Optional[int]]:
+    """"actions[2]" -> ("actions", 2)；不带下标时返回 (key, None)"""
+    m = _INDEX_RE.search(key)
+    if not m:
+        return key, None
+    return key[:m.start()], int(m.group(1))
+
+def _has_index(path: str) -> bool:
+    return any(_INDEX_RE.search(k) for k in path.split("."))
+
+def _step(cur: Any, key: str) -> Any:
+    """下标路径的中间一级：对象层级不存在则创建；列表元素必须已存在且是对象"""
+    name, idx = _split_index(key)
+    if idx is None:
+        if name not in cur or not isinstance(cur[name], dict):
+            cur[name] = {}
+        return cur[name]
+    lst = cur.get(name)
+    if not isinstance(lst, list) or idx >= len(lst) or not isinstance(lst[idx], dict):
+        raise ValueError(f"路径下标无效: {name}[{idx}]")
+    return lst[idx]
+
+def _set_or_append(parent: Any, key: Any, op: str, value: Any) -> None:
+    """对 parent[key] 执行 set/append（parent 可以是对象或列表）"""
+    if op in ("set", "replace"):
+        parent[key] = value
+        return
+    if op != "append":
+        return
+    # 如果字段本身是字符串，可以拼接；若是 list，则追加
+    current_val = parent[key] if isinstance(parent, list) else parent.get(key)
+    if isinstance(current_val, list):
+        if isinstance(value, list):
+            current_val.extend(value)
+        else:
+            current_val.append(value)
+    elif isinstance(current_val, str) and isinstance(value, str):
+        # 改进：避免在空字符串前加空格
+        if current_val:
+            parent[key] = current_val + ". " + value.strip(".")
+        else:
+            parent[key] = value
+    else:
+        # 类型不兼容，则直接覆盖
+        parent[key] = value
+
+def _apply_indexed(obj: Dict[str, Any], path: str, op: str, value: Any) -> None:
+    """带列表下标的路径：set 替换元素，insert 在下标处插入；下标越界或目标不是列表时抛 ValueError"""
+    keys = path.split(".")
+    cur = obj
+    for k in keys[:-1]:
+        cur = _step(cur, k)
+    if keys[-1].endswith("[]"):
+        name = keys[-1][:-2]
+        if not isinstance(cur.get(name), list):
+            cur[name] = []
+        _set_or_append(cur, name, "append", value)
+        return
+    name, idx = _split_index(keys[-1])
+    if idx is None:
+        _set_or_append(cur, name, op, value)
+        return
+    lst = cur.get(name)
+    if not isinstance(lst, list):
+        raise ValueError(f"路径 {path} 指向的字段不是列表")
+    if op == "insert":
+        if idx > len(lst):
+            raise ValueError(f"插入位置越界: {path}（长度 {len(lst)}）")
+        lst.insert(idx, value)
+        return
+    if idx >= len(lst):
+        raise ValueError(f"下标越界: {path}（长度 {len(lst)}）")
+    _set_or_append(lst, idx, op, value)
+
+# 允许被 delta 改写的视觉域字段（与 refiner._overlay_allowed 保持一致）
+VISUAL_FIELDS = {
+    "veo_params": ["aspect_ratio", "person_generation", "negative_prompt"],
+    "prompt": ["concept", "shots", "actions", "lighting", "style", "audio", "timing", "constraints"],
+}
+
+def _normalize_path(path: str) -> str:
+    """兼容 JSON Patch 风格路径：/prompt/actions/- -> prompt.actions[]，/prompt/shots/0/camera -> prompt.shots[0].camera"""
+    if not path.startswith("/"):
+        return path
+    parts: List[str] = []
+    for p in path.strip("/").split("/"):
+        if not p:
+            continue
+        if parts and (p == "-" or p.isdigit()):
+            parts[-1] += "[]" if p == "-" else f"[{int(p)}]"
+        else:
+            parts.append(p)
+    return ".".join(parts)
+
+def validate_visual_deltas(deltas: List[Dict[str, Any]],
+                           base_json: Optional[Dict[str, Any]] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    校验一组 delta 只作用于 VISUAL_FIELDS 内的字段。
+    返回 (accepted, rejected)；JSON Patch 的 add/replace 会被映射为 append/insert/set。
+    给出 base_json 时，按 apply_deltas 的顺序在同一份工作副本上逐个试应用（前面已接受的 delta 会生效），
+    下标越界等无法应用的直接拒绝。
+    """
+    accepted, rejected = [], []
+    work = copy.deepcopy(base_json) if base_json is not None else None
+    for d in deltas or []:
+        if not isinstance(d, dict) or not isinstance(d.get("path"), str):
+            rejected.append(d)
+            continue
+        path = _normalize_path(d["path"])
+        op = (d.get("op") or "set").lower()
+        indexed = _has_index(path)
+        if op == "add":
+            op = "append" if path.endswith("[]") else ("insert" if _INDEX_RE.search(path) else "set")
+        elif op == "replace":
+            op = "set"
+        keys = path.split(".")
+        root, field = keys[0], (keys[1] if len(keys) > 1 else "")
+        field = _split_index(field[:-2] if field.endswith("[]") else field)[0]
+        allowed_ops = ("set", "append", "insert") if indexed else ("set", "append")
+        if op not in allowed_ops or field not in VISUAL_FIELDS.get(root, []):
+            rejected.append(d)
+            continue
+        delta = dict(d, op=op, path=path)
+        if work is not None:
+            trial = copy.deepcopy(work)
+            try:
+                _apply_delta(trial, delta)
+            except ValueError:
+                rejected.append(d)
+                continue
+            work = trial
+        accepted.append(delta)
+    return accepted, rejected
+
+def _apply_delta(obj: Dict[str, Any], d: Dict[str, Any]) -> None:
+    """原地应用单个 delta"""
+    op = (d.get("op") or "set").lower()
+    path = d.get("path")
+    value = d.get("value")
+    if not path:
+        return
+
+    if _has_index(path):  # 列表下标：替换/插入元素
+        _apply_indexed(obj, path, op, value)
+    elif path.endswith("[]"):  # 追加到列表
+        parent, key, is_list = _ensure_list_field(obj, path)
+        if not isinstance(parent.get(key), list):
+            parent[key] = []
+        if isinstance(value, list):
+            parent[key].extend(value)
+        else:
+            parent[key].append(value)
+    else:
+        parent, key = _ensure_field(obj, path)
+        _set_or_append(parent, key, op, value)
+
 def apply_deltas(base_json: Dict[str, Any], deltas: List[Dict[str, Any]]) -> Dict[str, Any]:
     """
     应用一组 delta 到 base_json，返回新的 JSON（深拷贝）。
@@ -68,39 +228,5 @@ def apply_deltas(base_json: Dict[str, Any], deltas: List[Dict[str, Any]]) -> Dic
     """
     new_obj = copy.deepcopy(base_json)
     for d in deltas:
-        op = (d.get("op") or "set").lower()
-        path = d.get("path")
-        value = d.get("value")
-        if not path:
-            continue
-
-        if path.endswith("[]"):  # 追加到列表
-            parent, key, is_list = _ensure_list_field(new_obj, path)
-            if not isinstance(parent.get(key), list):
-                parent[key] = []
-            if isinstance(value, list):
-                parent[key].extend(value)
-            else:
-                parent[key].append(value)
-        else:
-            parent, key = _ensure_field(new_obj, path)
-            if op in ("set", "replace"):
-                parent[key] = value
-            elif op == "append":
-                # 如果字段本身是字符串，可以拼接；若是 list，则追加
-                current_val = parent.get(key)
-                if isinstance(current_val, list):
-                    if isinstance(value, list):
-                        current_val.extend(value)
-                    else:
-                        current_val.append(value)
-                elif isinstance(current_val, str) and isinstance(value, str):
-                    # 改进：避免在空字符串前加空格
-                    if current_val:
-                        parent[key] = current_val + ". " + value.strip(".")
-                    else:
-                        parent[key] = value
-                else:
-                    # 类型不兼容，则直接覆盖
-                    parent[key] = value
+        _apply_delta(new_obj, d)
     return new_obj
\ No newline at end of file
@@ -0,0 +1,43 @@
+# llm package: 统一的 LLM 客户端/调用层
+from agent.llm.clients import (
+    get_deepseek_client,
+    get_async_deepseek_client,
+    get_gemini_model,
+    upload_gemini_file,
+    get_gemini_file,
+    delete_gemini_file,
+    get_chat_model,
+)
+from agent.llm.gateway import (
+    llm_gateway,
+    chat_completion,
+    achat_completion,
+    gemini_generate,
+    PRIORITY_HIGH,
+    PRIORITY_NORMAL,
+    PRIORITY_LOW,
+)
+from agent.llm.cache import llm_cache
+from agent.llm.metrics import llm_metrics
+from agent.llm.router import llm_router, routed_chat
+
+__all__ = [
+    "get_deepseek_client",
+    "get_async_deepseek_client",
+    "get_gemini_model",
+    "upload_gemini_file",
+    "get_gemini_file",
+    "delete_gemini_file",
+    "get_chat_model",
+    "llm_gateway",
+    "chat_completion",
+    "achat_completion",
+    "gemini_generate",
+    "PRIORITY_HIGH",
+    "PRIORITY_NORMAL",
+    "PRIORITY_LOW",
+    "llm_cache",
+    "llm_metrics",
+    "llm_router",
+    "routed_chat",
+]
@@ -0,0 +1,147 @@
+# agent/llm/cache.py
+# -*- coding: utf-8 -*-
+"""
+agent/llm/cache.py
+===========================================================
+作用：
+  LLM 响应的持久化精确匹配缓存（SQLite 单文件，默认关闭）。
+  - key = (provider, model, messages/contents, 生成参数) 的归一化哈希
+  - 支持 TTL 过期与按条数/字节数的 LRU 淘汰
+  - 按调用点（call_site）单独开关，并统计命中/未命中
+  打开方式：config/default.yaml 中 llm.cache.enabled: true，或环境变量 LLM_CACHE=1。
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, Optional
+
+from agent.config import config_section
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_cache (
+    key TEXT PRIMARY KEY,
+    call_site TEXT,
+    provider TEXT,
+    model TEXT,
+    response TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+)
+"""
+
+
+class LLMResponseCache:
+    def __init__(self, path: Optional[str] = None, ttl_seconds: Optional[float] = None,
+                 max_entries: Optional[int] = None, max_bytes: Optional[int] = None,
+                 enabled: Optional[bool] = None, call_sites: Optional[Dict[str, bool]] = None):
+        cfg = config_section("llm").get("cache") or {}
+        self.path = path or cfg.get("path") or os.path.join("outputs", "cache", "llm_cache.sqlite3")
+        self.ttl_seconds = float(ttl_seconds if ttl_seconds is not None else cfg.get("ttl_seconds", 7 * 24 * 3600))
+        self.max_entries = int(max_entries if max_entries is not None else cfg.get("max_entries", 5000))
+        self.max_bytes = int(max_bytes if max_bytes is not None else cfg.get("max_bytes", 100 * 1024 * 1024))
+        if enabled is None:
+            enabled = bool(cfg.get("enabled", False)) or os.getenv("LLM_CACHE", "") == "1"
+        self.enabled = enabled
+        self.call_sites = dict(call_sites if call_sites is not None else (cfg.get("call_sites") or {}))
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits: Dict[str, int] = defaultdict(int)
+        self.misses: Dict[str, int] = defaultdict(int)
+
+    # ---------------- 基础设施 ----------------
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            d = os.path.dirname(self.path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(_SCHEMA)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_access ON llm_cache(last_access)")
+            self._conn = conn
+        return self._conn
+
+    def is_enabled(self, call_site: str) -> bool:
+        """全局开关打开且该调用点未被单独关闭"""
+        return self.enabled and bool(self.call_sites.get(call_site, True))
+
+    # ---------------- 读写 ----------------
+
+    def get(self, call_site: str, key: str) -> Optional[str]:
+        if not self.is_enabled(call_site):
+            return None
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT response, created_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    db.commit()
+                self.misses[call_site] += 1
+                return None
+            db.execute("UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key))
+            db.commit()
+            self.hits[call_site] += 1
+            return row[0]
+
+    def set(self, call_site: str, key: str, response: str, provider: str = "", model: str = "") -> None:
+        if not self.is_enabled(call_site):
+            return
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, call_site, provider, model, response, size, created_at, last_access)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, call_site, provider, model, response, size, now, now))
+            db.commit()
+            self._writes += 1
+            if self._writes % 50 == 1:
+                self._evict_locked(now)
+
+    def _evict_locked(self, now: float) -> None:
+        db = self._db()
+        db.execute("DELETE FROM llm_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        count, total = db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        # 按最近访问时间从旧到新淘汰，直到满足条数与字节上限
+        if count > self.max_entries or total > self.max_bytes:
+            rows = db.execute("SELECT key, size FROM llm_cache ORDER BY last_access ASC").fetchall()
+            doomed = []
+            for key, size in rows:
+                if count <= self.max_entries and total <= self.max_bytes:
+                    break
+                doomed.append((key,))
+                count -= 1
+                total -= size
+            db.executemany("DELETE FROM llm_cache WHERE key = ?", doomed)
+        db.commit()
+
+    def evict(self) -> None:
+        with self._lock:
+            self._evict_locked(time.time())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db().execute("DELETE FROM llm_cache")
+            self._db().commit()
+
+    def stats(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {"enabled": self.enabled, "path": self.path,
+                               "hits": dict(self.hits), "misses": dict(self.misses)}
+        if self.enabled:
+            with self._lock:
+                count, total = self._db().execute(
+                    "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+            out.update({"entries": count, "bytes": total})
+        return out
+
+
+# 全局缓存实例
+llm_cache = LLMResponseCache()
@@ -0,0 +1,224 @@
+# agent/llm/clients.py
+# -*- coding: utf-8 -*-
+"""
+agent/llm/clients.py
+===========================================================
+作用：
+  统一持有 DeepSeek / Gemini 的长生命周期客户端，按 (provider, key, model) 缓存。
+  - DeepSeek：共享 httpx 连接池的同步 OpenAI / 异步 AsyncOpenAI 客户端
+  - Gemini：按 key 绑定的 GenerativeService / FileService 客户端（不再依赖全局 genai.configure）
+  - LangChain 聊天模型（brain 使用）：按 provider/key/model 复用实例
+  超时与连接池大小读取 config/default.yaml 的 llm 段。
+"""
+import asyncio
+import mimetypes
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional, Sequence, Tuple, Union
+
+import httpx
+from openai import OpenAI, AsyncOpenAI
+from dotenv import load_dotenv
+
+from agent.config import config_section
+
+load_dotenv()
+
+DEFAULT_DEEPSEEK_BASE_URL = "https://api.deepseek.com"
+
+_lock = threading.Lock()
+_clients: Dict[Tuple[Any, ...], Any] = {}
+
+
+# SDK 内部不重试：429 必须立即交给 key 池（标记冷却、换 key）与网关（AIMD 退避），
+# 否则 SDK 会用同一个 key 先重试几次，两者都只能在重试耗尽后才看到限流
+SDK_MAX_RETRIES = 0
+
+
+def _cfg(key: str, default: Any) -> Any:
+    v = config_section("llm").get(key)
+    return default if v is None else v
+
+
+def _timeout() -> httpx.Timeout:
+    return httpx.Timeout(float(_cfg("timeout_seconds", 60)), connect=float(_cfg("connect_timeout_seconds", 10)))
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=int(_cfg("max_connections", 20)),
+        max_keepalive_connections=int(_cfg("max_keepalive_connections", 10)),
+        keepalive_expiry=float(_cfg("keepalive_expiry_seconds", 30)),
+    )
+
+
+def _get_or_create(cache_key: Tuple[Any, ...], factory):
+    client = _clients.get(cache_key)
+    if client is not None:
+        return client
+    with _lock:
+        client = _clients.get(cache_key)
+        if client is None:
+            client = factory()
+            _clients[cache_key] = client
+        return client
+
+
+# ---------------- Keys ----------------
+
+def deepseek_key(api_key: Optional[str] = None) -> str:
+    from agent.utils.key_rotator import get_next_deepseek_key
+    key = (api_key or get_next_deepseek_key() or "").strip()
+    if not key:
+        raise RuntimeError("缺少 DEEPSEEK_API_KEY")
+    return key
+
+
+def gemini_key(api_key: Optional[str] = None) -> str:
+    if api_key:
+        return api_key
+    from agent.utils.key_rotator import get_next_gemini_key
+    key = get_next_gemini_key()
+    if not key:
+        raise ValueError("GEMINI_API_KEYS not set in .env file")
+    return key
+
+
+# ---------------- DeepSeek (OpenAI 兼容) ----------------
+
+def get_deepseek_client(api_key: Optional[str] = None) -> OpenAI:
+    """进程内共享的同步 DeepSeek 客户端（按 key 缓存，复用连接池）"""
+    key = deepseek_key(api_key)
+    base_url = _cfg("deepseek_base_url", DEFAULT_DEEPSEEK_BASE_URL)
+
+    def factory() -> OpenAI:
+        http_client = httpx.Client(timeout=_timeout(), limits=_limits())
+        return OpenAI(api_key=key, base_url=base_url, http_client=http_client,
+                      max_retries=SDK_MAX_RETRIES)
+
+    return _get_or_create(("deepseek", "sync", key, base_url), factory)
+
+
+def get_async_deepseek_client(api_key: Optional[str] = None) -> AsyncOpenAI:
+    """
+    异步 DeepSeek 客户端。httpx.AsyncClient 的连接绑定事件循环，
+    因此按 (key, 当前事件循环) 缓存。
+    """
+    key = deepseek_key(api_key)
+    base_url = _cfg("deepseek_base_url", DEFAULT_DEEPSEEK_BASE_URL)
+    try:
+        loop_id = id(asyncio.get_running_loop())
+    except RuntimeError:
+        loop_id = 0
+
+    def factory() -> AsyncOpenAI:
+        http_client = httpx.AsyncClient(timeout=_timeout(), limits=_limits())
+        return AsyncOpenAI(api_key=key, base_url=base_url, http_client=http_client,
+                           max_retries=SDK_MAX_RETRIES)
+
+    return _get_or_create(("deepseek", "async", key, base_url, loop_id), factory)
+
+
+# ---------------- Gemini ----------------
+
+def _gemini_client_options(key: str) -> Dict[str, Any]:
+    return {"api_key": key}
+
+
+def get_gemini_service_client(api_key: Optional[str] = None):
+    """按 key 缓存的 GenerativeServiceClient（gRPC 通道长期复用）"""
+    import google.ai.generativelanguage as glm
+    key = gemini_key(api_key)
+    return _get_or_create(("gemini", "generative", key),
+                          lambda: glm.GenerativeServiceClient(client_options=_gemini_client_options(key)))
+
+
+def get_gemini_file_client(api_key: Optional[str] = None):
+    """按 key 缓存的 FileServiceClient（上传/查询/删除文件）"""
+    from google.generativeai import client as genai_client
+    key = gemini_key(api_key)
+    return _get_or_create(("gemini", "file", key),
+                          lambda: genai_client.FileServiceClient(client_options=_gemini_client_options(key)))
+
+
+def get_gemini_model(model_name: str, api_key: Optional[str] = None, **kwargs):
+    """
+    构造绑定到指定 key 的 GenerativeModel。模型对象本身很轻，
+    真正昂贵的 service client 来自缓存。
+    """
+    import google.generativeai as genai
+    model = genai.GenerativeModel(model_name, **kwargs)
+    model._client = get_gemini_service_client(api_key)
+    return model
+
+
+def upload_gemini_file(path: Union[str, Path], api_key: Optional[str] = None, mime_type: Optional[str] = None):
+    """等价于 genai.upload_file，但使用指定 key 的文件客户端"""
+    from google.generativeai.types import file_types
+    path = Path(path)
+    if mime_type is None:
+        mime_type, _ = mimetypes.guess_type(str(path))
+    response = get_gemini_file_client(api_key).create_file(
+        path=path, mime_type=mime_type, display_name=path.name, resumable=True)
+    return file_types.File(response)
+
+
+def get_gemini_file(name: str, api_key: Optional[str] = None):
+    from google.generativeai.types import file_types
+    return file_types.File(get_gemini_file_client(api_key).get_file(name=name))
+
+
+def delete_gemini_file(name: str, api_key: Optional[str] = None) -> None:
+    get_gemini_file_client(api_key).delete_file(name=name)
+
+
+# ---------------- LangChain 聊天模型（brain） ----------------
+
+def get_chat_model(provider: str, model_name: str, temperature: float = 0,
+                   tools: Optional[Sequence[Any]] = None, api_key: Optional[str] = None):
+    """
+    返回（可选绑定 tools 的）LangChain 聊天模型，按 provider/key/model/tools 复用。
+    provider 大小写不敏感（路由层使用小写名）。
+    """
+    provider = {"gemini": "Gemini", "deepseek": "DeepSeek"}.get(provider.lower(), provider)
+    if provider == "Gemini":
+        key = gemini_key(api_key)
+    elif provider == "DeepSeek":
+        try:
+            key = deepseek_key(api_key)
+        except RuntimeError:
+            raise ValueError("DEEPSEEK_API_KEY is not set")
+    else:
+        raise ValueError(f"Unsupported LLM provider: {provider}")
+
+    timeout = float(_cfg("timeout_seconds", 60))
+    def base_factory():
+        if provider == "Gemini":
+            from langchain_google_genai import ChatGoogleGenerativeAI
+            return ChatGoogleGenerativeAI(model=model_name, temperature=temperature, google_api_key=key,
+                                          timeout=timeout, max_retries=SDK_MAX_RETRIES)
+        from langchain_deepseek import ChatDeepSeek
+        return ChatDeepSeek(model=model_name, temperature=temperature, api_key=key,
+                            timeout=timeout, max_retries=SDK_MAX_RETRIES,
+                            http_client=httpx.Client(timeout=_timeout(), limits=_limits()))
+
+    base_key = ("chat", provider, key, model_name, temperature)
+    llm = _get_or_create(base_key, base_factory)
+    if tools is None:
+        return llm
+    tools_key = tuple(getattr(t, "name", repr(t)) for t in tools)
+    return _get_or_create(base_key + ("tools", tools_key), lambda: llm.bind_tools(list(tools)))
+
+
+def close_all() -> None:
+    """关闭所有缓存的同步客户端（进程退出时调用）"""
+    with _lock:
+        items = list(_clients.items())
+        _clients.clear()
+    for _, client in items:
+        close = getattr(client, "close", None)
+        if callable(close) and not asyncio.iscoroutinefunction(close):
+            try:
+                close()
+            except Exception:
+                pass
@@ -0,0 +1,552 @@
+# agent/llm/gateway.py
+# -*- coding: utf-8 -*-
+"""
+agent/llm/gateway.py
+===========================================================
+作用：
+  所有 LLM 调用的准入网关（asyncio 实现，运行在独立的后台事件循环线程上）。
+  - 按 provider 与 model 两级信号量限流，等待队列按 priority 排序（数值越小越优先）
+  - 相同归一化 payload 的并发请求 singleflight 合并，只打一次上游
+  - 上游 429 / 配额错误回馈到准入：并发上限减半 + 冷却，成功后逐步恢复（AIMD）
+
+设计要点：
+  - 网关只负责“准入”，真正的调用在调用方自己的线程/事件循环里执行，
+    这样 LangChain 回调、contextvars 等不会丢失。
+  - 同步调用点用 run()/chat_completion()/gemini_generate()；
+    异步调用点用 arun()/achat_completion()。
+"""
+import asyncio
+import hashlib
+import heapq
+import itertools
+import json
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from agent.config import config_section
+from agent.llm.metrics import llm_metrics, current_record
+
+PRIORITY_HIGH = 0    # 交互式：brain、refine
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 9     # 批量：扩展、回放
+
+
+def _gateway_cfg() -> Dict[str, Any]:
+    return config_section("llm").get("gateway") or {}
+
+
+def is_rate_limited(exc: BaseException) -> bool:
+    """识别 DeepSeek(OpenAI SDK) 与 Gemini(google-api-core) 的 429 / 配额错误"""
+    if getattr(exc, "status_code", None) == 429 or getattr(exc, "code", None) == 429:
+        return True
+    name = type(exc).__name__
+    if name in ("RateLimitError", "ResourceExhausted", "TooManyRequests"):
+        return True
+    text = str(exc)
+    return "429" in text or "RESOURCE_EXHAUSTED" in text or "quota" in text.lower()
+
+
+def _retry_after(exc: BaseException) -> Optional[float]:
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        v = headers.get("retry-after")
+        return float(v) if v is not None else None
+    except Exception:
+        return None
+
+
+def _normalize(obj: Any) -> Any:
+    """归一化 payload：字符串去首尾空白，非 JSON 对象（如 Gemini File）用其 name 表示"""
+    if isinstance(obj, str):
+        return obj.strip()
+    if isinstance(obj, dict):
+        return {str(k): _normalize(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_normalize(v) for v in obj]
+    if obj is None or isinstance(obj, (int, float, bool)):
+        return obj
+    return f"<{type(obj).__name__}:{getattr(obj, 'name', None) or repr(obj)}>"
+
+
+def payload_key(provider: str, model: str, payload: Any) -> str:
+    raw = json.dumps([provider, model, _normalize(payload)], ensure_ascii=False, sort_keys=True,
+                     separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _note_retry() -> None:
+    rec = current_record()
+    if rec is not None:
+        rec.retries += 1
+
+
+def _mark(outcome: str) -> None:
+    rec = current_record()
+    if rec is not None:
+        rec.mark(outcome)
+
+
+class _PriorityLimiter:
+    """带优先级等待队列、可动态收缩/恢复容量的异步信号量（仅在网关事件循环内使用）"""
+
+    def __init__(self, name: str, capacity: int):
+        self.name = name
+        self.max_capacity = max(1, int(capacity))
+        self.capacity = self.max_capacity
+        self.active = 0
+        self.cooldown_until = 0.0
+        self.rate_limited = 0
+        self._successes = 0
+        self._waiters: List[list] = []
+        self._seq = itertools.count()
+
+    async def acquire(self, priority: int) -> None:
+        if time.monotonic() >= self.cooldown_until and self.active < self.capacity and not self._waiters:
+            self.active += 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        entry = [priority, next(self._seq), fut]
+        heapq.heappush(self._waiters, entry)
+        try:
+            # 被唤醒即表示名额已移交（active 已由 _wake 计入）
+            await fut
+        except BaseException:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+            elif fut.done() and not fut.cancelled():
+                self.release(False)
+            raise
+
+    def release(self, ok: bool) -> None:
+        self.active = max(0, self.active - 1)
+        if ok and self.capacity < self.max_capacity:
+            # 加性恢复：每成功 capacity 次，容量 +1
+            self._successes += 1
+            if self._successes >= self.capacity:
+                self._successes = 0
+                self.capacity += 1
+        self._wake()
+
+    def penalize(self, cooldown: float) -> None:
+        # 乘性退避：容量减半并进入冷却期
+        self.rate_limited += 1
+        self.capacity = max(1, self.capacity // 2)
+        self._successes = 0
+        self.cooldown_until = max(self.cooldown_until, time.monotonic() + cooldown)
+        asyncio.get_running_loop().call_later(cooldown, self._wake)
+
+    def _wake(self) -> None:
+        if time.monotonic() < self.cooldown_until:
+            return
+        while self.active < self.capacity and self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                self.active += 1
+                fut.set_result(None)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"active": self.active, "capacity": self.capacity, "max_capacity": self.max_capacity,
+                "waiting": len(self._waiters), "rate_limited": self.rate_limited,
+                "cooling_down": time.monotonic() < self.cooldown_until}
+
+
+class LLMGateway:
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._limiters: Dict[Tuple[str, str], _PriorityLimiter] = {}
+        self._inflight: Dict[str, Future] = {}
+        self._sf_lock = threading.Lock()
+        self.coalesced = 0
+
+    # ---------------- 事件循环 ----------------
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is not None:
+            return self._loop
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=loop.run_forever, name="llm-gateway", daemon=True)
+                self._thread.start()
+                self._loop = loop
+        return self._loop
+
+    def _submit(self, coro) -> Future:
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    # ---------------- 准入 ----------------
+
+    def _limiter(self, kind: str, name: str) -> _PriorityLimiter:
+        lim = self._limiters.get((kind, name))
+        if lim is None:
+            cfg = _gateway_cfg()
+            table = cfg.get(f"{kind}_concurrency") or {}
+            capacity = table.get(name, cfg.get("default_concurrency", 4))
+            lim = self._limiters[(kind, name)] = _PriorityLimiter(f"{kind}:{name}", capacity)
+        return lim
+
+    async def _acquire(self, provider: str, model: str, priority: int) -> Tuple[_PriorityLimiter, ...]:
+        # 固定顺序（先 model 后 provider）获取，避免交叉等待
+        model_lim = self._limiter("model", model)
+        provider_lim = self._limiter("provider", provider)
+        await model_lim.acquire(priority)
+        try:
+            await provider_lim.acquire(priority)
+        except BaseException:
+            model_lim.release(False)
+            raise
+        return model_lim, provider_lim
+
+    def _release(self, ticket: Tuple[_PriorityLimiter, ...], ok: bool, exc: Optional[BaseException]) -> None:
+        if exc is not None and is_rate_limited(exc):
+            cooldown = _retry_after(exc) or float(_gateway_cfg().get("rate_limit_cooldown_seconds", 2.0))
+            for lim in ticket:
+                lim.penalize(cooldown)
+        for lim in ticket:
+            lim.release(ok)
+
+    def _release_threadsafe(self, ticket, ok: bool, exc: Optional[BaseException]) -> None:
+        self._ensure_loop().call_soon_threadsafe(self._release, ticket, ok, exc)
+
+    def _enabled(self) -> bool:
+        return bool(_gateway_cfg().get("enabled", True))
+
+    def _max_retries(self) -> int:
+        return int(_gateway_cfg().get("max_rate_limit_retries", 2))
+
+    # ---------------- 同步接口 ----------------
+
+    def run(self, provider: str, model: str, fn: Callable[[], Any], *, call_site: str = "",
+            payload: Any = None, priority: int = PRIORITY_NORMAL) -> Any:
+        """
+        在准入控制下同步执行 fn()。payload 不为 None 时对相同 payload 的并发请求做 singleflight。
+        """
+        if not self._enabled():
+            return fn()
+
+        def admitted() -> Any:
+            attempt = 0
+            while True:
+                ticket = self._submit(self._acquire(provider, model, priority)).result()
+                try:
+                    result = fn()
+                except BaseException as e:
+                    self._release_threadsafe(ticket, False, e)
+                    if is_rate_limited(e) and attempt < self._max_retries():
+                        attempt += 1
+                        _note_retry()
+                        print(f"⏳ [{call_site or provider}] 触发限流，冷却后重试 ({attempt}/{self._max_retries()})")
+                        continue
+                    raise
+                self._release_threadsafe(ticket, True, None)
+                return result
+
+        if payload is None:
+            return admitted()
+        return self._singleflight(payload_key(provider, model, payload), admitted)
+
+    def _singleflight(self, key: str, compute: Callable[[], Any]) -> Any:
+        with self._sf_lock:
+            fut = self._inflight.get(key)
+            leader = fut is None
+            if leader:
+                fut = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            _mark("coalesced")
+            return fut.result()
+        try:
+            result = compute()
+            fut.set_result(result)
+            return result
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            with self._sf_lock:
+                self._inflight.pop(key, None)
+
+    # ---------------- 异步接口 ----------------
+
+    async def _acquire_from(self, provider: str, model: str, priority: int):
+        coro = self._acquire(provider, model, priority)
+        if asyncio.get_running_loop() is self._ensure_loop():
+            return await coro
+        return await asyncio.wrap_future(self._submit(coro))
+
+    def _release_from_any(self, ticket, ok: bool, exc: Optional[BaseException]) -> None:
+        try:
+            same_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            same_loop = False
+        if same_loop:
+            self._release(ticket, ok, exc)
+        else:
+            self._release_threadsafe(ticket, ok, exc)
+
+    async def arun(self, provider: str, model: str, afn: Callable[[], Awaitable[Any]], *, call_site: str = "",
+                   payload: Any = None, priority: int = PRIORITY_NORMAL) -> Any:
+        """异步版 run()：afn 是协程函数，在调用方自己的事件循环中执行"""
+        if not self._enabled():
+            return await afn()
+
+        async def admitted() -> Any:
+            attempt = 0
+            while True:
+                ticket = await self._acquire_from(provider, model, priority)
+                try:
+                    result = await afn()
+                except BaseException as e:
+                    self._release_from_any(ticket, False, e)
+                    if is_rate_limited(e) and attempt < self._max_retries():
+                        attempt += 1
+                        _note_retry()
+                        continue
+                    raise
+                self._release_from_any(ticket, True, None)
+                return result
+
+        if payload is None:
+            return await admitted()
+
+        key = payload_key(provider, model, payload)
+        with self._sf_lock:
+            fut = self._inflight.get(key)
+            leader = fut is None
+            if leader:
+                fut = self._inflight[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            _mark("coalesced")
+            return await asyncio.wrap_future(fut)
+        try:
+            result = await admitted()
+            fut.set_result(result)
+            return result
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            with self._sf_lock:
+                self._inflight.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limiters": {lim.name: lim.snapshot() for lim in list(self._limiters.values())},
+            "inflight": len(self._inflight),
+            "coalesced": self.coalesced,
+        }
+
+
+# 全局网关实例，所有调用点共享同一份准入状态
+llm_gateway = LLMGateway()
+
+
+# ---------------- 调用点便捷函数 ----------------
+
+def _cacheable(text: str, json_expected: bool) -> bool:
+    """JSON 模式下只缓存可解析的响应，避免把坏结果固化进缓存"""
+    if not text:
+        return False
+    if not json_expected:
+        return True
+    try:
+        json.loads(text)
+        return True
+    except Exception:
+        return False
+
+
+def _stream_enabled() -> bool:
+    """流式读取响应以测量首 token 时间（llm.metrics.stream）"""
+    return bool((config_section("llm").get("metrics") or {}).get("stream", True))
+
+
+def _cached(provider: str, model: str, call_site: str, payload: Dict[str, Any], json_expected: bool,
+            compute: Callable[[str], Any]) -> Any:
+    from agent.llm.cache import llm_cache
+    key = payload_key(provider, model, payload)
+    hit = llm_cache.get(call_site, key)
+    if hit is not None:
+        _mark("cache_hit")
+        return hit
+    text = compute(key)
+    if _cacheable(text, json_expected):
+        llm_cache.set(call_site, key, text, provider=provider, model=model)
+    return text
+
+
+def _deepseek_call(client: Any, kwargs: Dict[str, Any]) -> str:
+    rec = current_record()
+    if not _stream_enabled():
+        resp = client.chat.completions.create(**kwargs)
+        if rec is not None and getattr(resp, "usage", None):
+            rec.set_usage(resp.usage.prompt_tokens, resp.usage.completion_tokens)
+        return (resp.choices[0].message.content or "").strip()
+    parts: List[str] = []
+    stream = client.chat.completions.create(**kwargs, stream=True, stream_options={"include_usage": True})
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+            if rec is not None:
+                rec.first_token()
+            parts.append(chunk.choices[0].delta.content)
+        if getattr(chunk, "usage", None) and rec is not None:
+            rec.set_usage(chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+    return "".join(parts).strip()
+
+
+def _gemini_call(model_obj: Any, contents: Any, generation_config: Optional[Dict[str, Any]]) -> str:
+    rec = current_record()
+    if _stream_enabled():
+        response = model_obj.generate_content(contents, generation_config=generation_config, stream=True)
+        for _ in response:
+            if rec is not None:
+                rec.first_token()
+        response.resolve()
+    else:
+        response = model_obj.generate_content(contents, generation_config=generation_config)
+    usage = getattr(response, "usage_metadata", None)
+    if rec is not None and usage is not None:
+        rec.set_usage(getattr(usage, "prompt_token_count", 0), getattr(usage, "candidates_token_count", 0))
+    return response.text
+
+
+def _estimate_tokens(payload: Any) -> int:
+    """粗略估计 prompt token 数（约 4 字符 / token），用于 key 池的 TPM 预算"""
+    return len(json.dumps(_normalize(payload), ensure_ascii=False)) // 4
+
+
+def _usage_tokens() -> Optional[int]:
+    rec = current_record()
+    if rec is None or not (rec.prompt_tokens or rec.completion_tokens):
+        return None
+    return rec.prompt_tokens + rec.completion_tokens
+
+
+def record_langchain_usage(message: Any) -> None:
+    """从 LangChain AIMessage.usage_metadata 回填 token 用量"""
+    rec = current_record()
+    usage = getattr(message, "usage_metadata", None) or {}
+    if rec is not None and usage:
+        rec.set_usage(usage.get("input_tokens"), usage.get("output_tokens"))
+
+
+def chat_completion(messages: List[Dict[str, str]], *, model: str = "deepseek-chat", call_site: str = "",
+                    temperature: float = 0.2, response_format: Optional[Dict[str, Any]] = None,
+                    priority: int = PRIORITY_NORMAL, client: Any = None, variant: Optional[int] = None,
+                    route: bool = True) -> str:
+    """
+    经网关执行一次 DeepSeek chat completion，返回文本内容。
+    variant 用于区分“同一请求的第 N 个采样”，避免被 singleflight/缓存合并。
+    llm.routing 对该调用点开启时，由路由层在满足能力的后端中选择最快且健康的一个。
+    """
+    from agent.llm.clients import get_deepseek_client
+    from agent.llm.router import llm_router, routed_chat
+    from agent.utils.key_rotator import deepseek_key_pool
+    if route and client is None and llm_router.enabled_for(call_site):
+        return routed_chat(messages, call_site=call_site, temperature=temperature,
+                           json_mode=bool(response_format), priority=priority, variant=variant,
+                           preferred=("deepseek", model))
+    kwargs: Dict[str, Any] = {"model": model, "messages": messages, "temperature": temperature}
+    if response_format:
+        kwargs["response_format"] = response_format
+    payload = dict(kwargs, variant=variant) if variant is not None else kwargs
+
+    def call() -> str:
+        if client is not None:
+            return _deepseek_call(client, kwargs)
+        # 每次尝试单独从 key 池取 key：429 的 key 进入冷却，网关重试时自然换到其它 key
+        with deepseek_key_pool.lease(_estimate_tokens(kwargs)) as lease:
+            text = _deepseek_call(get_deepseek_client(lease.key), kwargs)
+            lease.tokens = _usage_tokens() or lease.tokens
+            return text
+
+    with llm_metrics.track(call_site, "deepseek", model):
+        return _cached("deepseek", model, call_site, payload, bool(response_format),
+                       lambda _key: llm_gateway.run("deepseek", model, call, call_site=call_site,
+                                                    payload=payload, priority=priority))
+
+
+async def achat_completion(messages: List[Dict[str, str]], *, model: str = "deepseek-chat", call_site: str = "",
+                           temperature: float = 0.2, response_format: Optional[Dict[str, Any]] = None,
+                           priority: int = PRIORITY_NORMAL, variant: Optional[int] = None) -> str:
+    """chat_completion 的异步版本（使用当前事件循环上的 AsyncOpenAI 客户端）"""
+    from agent.llm.cache import llm_cache
+    from agent.llm.clients import get_async_deepseek_client
+    from agent.utils.key_rotator import deepseek_key_pool
+    kwargs: Dict[str, Any] = {"model": model, "messages": messages, "temperature": temperature}
+    if response_format:
+        kwargs["response_format"] = response_format
+    payload = dict(kwargs, variant=variant) if variant is not None else kwargs
+
+    with llm_metrics.track(call_site, "deepseek", model) as rec:
+        key = payload_key("deepseek", model, payload)
+        hit = llm_cache.get(call_site, key)
+        if hit is not None:
+            rec.mark("cache_hit")
+            return hit
+
+        async def call() -> str:
+            # 事件循环中不阻塞等待预算，直接取当前最空闲的 key
+            with deepseek_key_pool.lease(_estimate_tokens(kwargs), block=False) as lease:
+                resp = await get_async_deepseek_client(lease.key).chat.completions.create(**kwargs)
+                if getattr(resp, "usage", None):
+                    rec.set_usage(resp.usage.prompt_tokens, resp.usage.completion_tokens)
+                lease.tokens = _usage_tokens() or lease.tokens
+                return (resp.choices[0].message.content or "").strip()
+
+        text = await llm_gateway.arun("deepseek", model, call, call_site=call_site, payload=payload,
+                                      priority=priority)
+        if _cacheable(text, bool(response_format)):
+            llm_cache.set(call_site, key, text, provider="deepseek", model=model)
+        return text
+
+
+def gemini_generate(contents: Any, *, model: str = "models/gemini-2.5-flash", call_site: str = "",
+                    generation_config: Optional[Dict[str, Any]] = None, api_key: Optional[str] = None,
+                    priority: int = PRIORITY_NORMAL, variant: Optional[int] = None,
+                    system_instruction: Optional[str] = None, route: bool = True) -> str:
+    """
+    经网关执行一次 Gemini generate_content，返回 response.text。
+    纯文本请求在 llm.routing 对该调用点开启时交给路由层选择后端。
+    """
+    from agent.llm.clients import get_gemini_model
+    from agent.llm.router import llm_router, routed_chat
+    from agent.utils.key_rotator import gemini_key_pool
+    json_expected = (generation_config or {}).get("response_mime_type") == "application/json"
+    if route and api_key is None and isinstance(contents, str) and llm_router.enabled_for(call_site):
+        messages = [{"role": "user", "content": contents}]
+        if system_instruction:
+            messages.insert(0, {"role": "system", "content": system_instruction})
+        return routed_chat(messages, call_site=call_site,
+                           temperature=float((generation_config or {}).get("temperature", 0.2)),
+                           json_mode=json_expected, priority=priority, variant=variant,
+                           preferred=("gemini", model))
+    payload: Dict[str, Any] = {"contents": contents, "generation_config": generation_config}
+    if system_instruction:
+        payload["system_instruction"] = system_instruction
+    if variant is not None:
+        payload["variant"] = variant
+    model_kwargs = {"system_instruction": system_instruction} if system_instruction else {}
+
+    def attempt() -> str:
+        # api_key 指定时（如文件绑定在上传用的 key 上）只做记账，否则每次尝试取最空闲的健康 key
+        with gemini_key_pool.lease(_estimate_tokens(payload), pinned=api_key) as lease:
+            text = _gemini_call(get_gemini_model(model, api_key=lease.key, **model_kwargs),
+                                contents, generation_config)
+            lease.tokens = _usage_tokens() or lease.tokens
+            return text
+
+    def compute(_key: str) -> str:
+        return llm_gateway.run("gemini", model, attempt, call_site=call_site, payload=payload, priority=priority)
+
+    with llm_metrics.track(call_site, "gemini", model):
+        return _cached("gemini", model, call_site, payload, json_expected, compute)
@@ -0,0 +1,242 @@
+# agent/llm/metrics.py
+# -*- coding: utf-8 -*-
+"""
+agent/llm/metrics.py
+===========================================================
+作用：
+  LLM 调用埋点。每次调用记录：调用点、provider、模型、总耗时、首 token 时间（流式时）、
+  prompt/completion token 数、限流重试次数与结果（ok/error/rate_limited/cache_hit/coalesced），
+  按单价表估算费用。
+  - 进程内聚合为直方图/计数器，由 /api/metrics 以 Prometheus 文本格式导出
+  - 可选逐条追加到 JSONL 文件（llm.metrics.jsonl_path 或环境变量 LLM_METRICS_JSONL）
+
+用法：
+    with llm_metrics.track("compose_v1_json", "deepseek", "deepseek-chat") as rec:
+        ...
+        rec.set_usage(prompt_tokens, completion_tokens)
+  在 track 内部的任意层级可用 current_record() 拿到当前记录。
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from agent.config import config_section
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+TOKEN_BUCKETS = (64, 256, 1024, 2048, 4096, 8192, 16384, 32768)
+
+_current: contextvars.ContextVar[Optional["CallRecord"]] = contextvars.ContextVar("llm_call_record", default=None)
+
+
+@dataclass
+class CallRecord:
+    call_site: str
+    provider: str
+    model: str
+    started_at: float
+    latency_s: float = 0.0
+    ttft_s: Optional[float] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    retries: int = 0
+    outcome: str = ""
+    error: str = ""
+    cost_usd: float = 0.0
+
+    def set_usage(self, prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> None:
+        self.prompt_tokens = int(prompt_tokens or 0)
+        self.completion_tokens = int(completion_tokens or 0)
+
+    def first_token(self) -> None:
+        if self.ttft_s is None:
+            self.ttft_s = time.time() - self.started_at
+
+    def mark(self, outcome: str) -> None:
+        self.outcome = outcome
+
+
+def current_record() -> Optional[CallRecord]:
+    return _current.get()
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v: float) -> None:
+        for i, b in enumerate(self.buckets):
+            if v <= b:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.sum += v
+        self.count += 1
+
+
+def _labels(**kv: str) -> str:
+    parts = []
+    for k, v in kv.items():
+        v = str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{k}="{v}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class LLMMetrics:
+    def __init__(self):
+        cfg = config_section("llm").get("metrics") or {}
+        self.jsonl_path = os.getenv("LLM_METRICS_JSONL") or cfg.get("jsonl_path") or ""
+        self.pricing: Dict[str, Dict[str, float]] = config_section("llm").get("pricing") or {}
+        self._lock = threading.Lock()
+        self._latency: Dict[Tuple[str, str, str], _Histogram] = {}
+        self._ttft: Dict[Tuple[str, str, str], _Histogram] = {}
+        self._tokens: Dict[Tuple[str, str, str, str], _Histogram] = {}
+        self._calls: Dict[Tuple[str, str, str, str], int] = defaultdict(int)
+        self._token_totals: Dict[Tuple[str, str, str, str], int] = defaultdict(int)
+        self._cost: Dict[Tuple[str, str, str], float] = defaultdict(float)
+        self._retries: Dict[Tuple[str, str, str], int] = defaultdict(int)
+
+    # ---------------- 记录 ----------------
+
+    def _price(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        p = self.pricing.get(model) or {}
+        return (prompt_tokens * float(p.get("input", 0)) + completion_tokens * float(p.get("output", 0))) / 1e6
+
+    @contextmanager
+    def track(self, call_site: str, provider: str, model: str) -> Iterator[CallRecord]:
+        rec = CallRecord(call_site=call_site or "unknown", provider=provider, model=model, started_at=time.time())
+        token = _current.set(rec)
+        try:
+            yield rec
+            if not rec.outcome:
+                rec.outcome = "ok"
+        except BaseException as e:
+            from agent.llm.gateway import is_rate_limited
+            rec.outcome = "rate_limited" if is_rate_limited(e) else "error"
+            rec.error = f"{type(e).__name__}: {str(e)[:200]}"
+            raise
+        finally:
+            _current.reset(token)
+            rec.latency_s = time.time() - rec.started_at
+            self.observe(rec)
+
+    def observe(self, rec: CallRecord) -> None:
+        rec.cost_usd = self._price(rec.model, rec.prompt_tokens, rec.completion_tokens)
+        key = (rec.call_site, rec.provider, rec.model)
+        with self._lock:
+            self._calls[key + (rec.outcome,)] += 1
+            self._retries[key] += rec.retries
+            if rec.outcome in ("cache_hit", "coalesced"):
+                pass  # 未触达上游，不计入延迟与用量
+            else:
+                self._latency.setdefault(key, _Histogram(LATENCY_BUCKETS)).observe(rec.latency_s)
+                if rec.ttft_s is not None:
+                    self._ttft.setdefault(key, _Histogram(LATENCY_BUCKETS)).observe(rec.ttft_s)
+                for kind, n in (("prompt", rec.prompt_tokens), ("completion", rec.completion_tokens)):
+                    if n:
+                        self._tokens.setdefault(key + (kind,), _Histogram(TOKEN_BUCKETS)).observe(n)
+                        self._token_totals[key + (kind,)] += n
+                self._cost[key] += rec.cost_usd
+        if self.jsonl_path:
+            self._append_jsonl(rec)
+
+    def _append_jsonl(self, rec: CallRecord) -> None:
+        try:
+            d = os.path.dirname(self.jsonl_path)
+            if d:
+                os.makedirs(d, exist_ok=True)
+            line = json.dumps(asdict(rec), ensure_ascii=False)
+            with self._lock, open(self.jsonl_path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except Exception as e:
+            print(f"⚠️ LLM 埋点写入 JSONL 失败: {e}")
+
+    # ---------------- 导出 ----------------
+
+    def _render_histogram(self, out: List[str], name: str, help_text: str,
+                          data: Dict[Tuple[str, ...], _Histogram], label_names: Tuple[str, ...]) -> None:
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} histogram")
+        for key, h in sorted(data.items()):
+            base = dict(zip(label_names, key))
+            cumulative = 0
+            for b, c in zip(h.buckets, h.counts):
+                cumulative += c
+                out.append(f"{name}_bucket{_labels(**base, le=repr(float(b)))} {cumulative}")
+            out.append(f"{name}_bucket{_labels(**base, le='+Inf')} {h.count}")
+            out.append(f"{name}_sum{_labels(**base)} {h.sum:.6f}")
+            out.append(f"{name}_count{_labels(**base)} {h.count}")
+
+    def render_prometheus(self) -> str:
+        """Prometheus 文本格式（text/plain; version=0.0.4）"""
+        lbl = ("call_site", "provider", "model")
+        out: List[str] = []
+        with self._lock:
+            self._render_histogram(out, "llm_request_duration_seconds", "LLM call latency in seconds",
+                                   self._latency, lbl)
+            self._render_histogram(out, "llm_time_to_first_token_seconds", "Time to first streamed token",
+                                   self._ttft, lbl)
+            self._render_histogram(out, "llm_tokens_per_call", "Tokens per LLM call",
+                                   self._tokens, lbl + ("type",))
+            out.append("# HELP llm_requests_total LLM calls by outcome")
+            out.append("# TYPE llm_requests_total counter")
+            for key, n in sorted(self._calls.items()):
+                out.append(f"llm_requests_total{_labels(**dict(zip(lbl + ('outcome',), key)))} {n}")
+            out.append("# HELP llm_tokens_total Total tokens consumed")
+            out.append("# TYPE llm_tokens_total counter")
+            for key, n in sorted(self._token_totals.items()):
+                out.append(f"llm_tokens_total{_labels(**dict(zip(lbl + ('type',), key)))} {n}")
+            out.append("# HELP llm_cost_usd_total Estimated spend in USD")
+            out.append("# TYPE llm_cost_usd_total counter")
+            for key, v in sorted(self._cost.items()):
+                out.append(f"llm_cost_usd_total{_labels(**dict(zip(lbl, key)))} {v:.6f}")
+            out.append("# HELP llm_rate_limit_retries_total Retries after provider rate limiting")
+            out.append("# TYPE llm_rate_limit_retries_total counter")
+            for key, n in sorted(self._retries.items()):
+                out.append(f"llm_rate_limit_retries_total{_labels(**dict(zip(lbl, key)))} {n}")
+        self._render_runtime(out)
+        return "\n".join(out) + "\n"
+
+    def _render_runtime(self, out: List[str]) -> None:
+        """附带网关准入与响应缓存的实时状态"""
+        from agent.llm.cache import llm_cache
+        from agent.llm.gateway import llm_gateway
+        limiters = llm_gateway.stats()["limiters"]
+        for metric, field, help_text in (("llm_gateway_active", "active", "In-flight admitted calls"),
+                                         ("llm_gateway_capacity", "capacity", "Current admission capacity"),
+                                         ("llm_gateway_waiting", "waiting", "Calls waiting for admission")):
+            out.append(f"# HELP {metric} {help_text}")
+            out.append(f"# TYPE {metric} gauge")
+            for name, snap in sorted(limiters.items()):
+                out.append(f"{metric}{_labels(limiter=name)} {snap[field]}")
+        cache = llm_cache.stats()
+        for metric, field in (("llm_cache_hits_total", "hits"), ("llm_cache_misses_total", "misses")):
+            out.append(f"# TYPE {metric} counter")
+            for site, n in sorted(cache[field].items()):
+                out.append(f"{metric}{_labels(call_site=site)} {n}")
+
+    def summary(self) -> Dict[str, Any]:
+        """按调用点汇总（供 /api/llm/stats 展示）"""
+        out: Dict[str, Any] = {}
+        with self._lock:
+            for (site, provider, model), h in self._latency.items():
+                out.setdefault(site, {})[f"{provider}/{model}"] = {
+                    "calls": h.count, "avg_latency_s": round(h.sum / h.count, 3) if h.count else 0.0,
+                    "prompt_tokens": self._token_totals.get((site, provider, model, "prompt"), 0),
+                    "completion_tokens": self._token_totals.get((site, provider, model, "completion"), 0),
+                    "cost_usd": round(self._cost.get((site, provider, model), 0.0), 6),
+                }
+        return out
+
+
+# 全局埋点实例
+llm_metrics = LLMMetrics()
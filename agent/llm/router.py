@@ -0,0 +1,238 @@
+# agent/llm/router.py
+# -*- coding: utf-8 -*-
+"""
+agent/llm/router.py
+===========================================================
+作用：
+  按延迟与健康度在多个 provider/model 之间路由 LLM 调用（默认关闭）。
+  - 每个后端维护滚动窗口内的 p50/p95 延迟与错误率
+  - 每种调用类型（call_site）声明所需能力（json / tools / vision），
+    只在满足能力的后端中挑选“健康且最快”的那个；失败时按排名依次故障转移
+  - 可选对冲（hedge）：首选后端超过其 p95 仍未返回时，向第二个后端并发发出同一请求，先到先用
+
+配置见 config/default.yaml 的 llm.routing 段。
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from agent.config import config_section
+
+
+def _routing_cfg() -> Dict[str, Any]:
+    return config_section("llm").get("routing") or {}
+
+
+@dataclass(frozen=True)
+class Backend:
+    provider: str
+    model: str
+    capabilities: frozenset = field(default_factory=frozenset)
+
+    @property
+    def name(self) -> str:
+        return f"{self.provider}/{self.model}"
+
+
+class _BackendStats:
+    def __init__(self, window: int):
+        self.samples: Deque[Tuple[float, bool]] = deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+
+    def record(self, latency: float, ok: bool, cooldown: float, failure_threshold: int) -> None:
+        self.samples.append((latency, ok))
+        if ok:
+            self.consecutive_failures = 0
+        else:
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= failure_threshold:
+                self.unhealthy_until = time.monotonic() + cooldown
+
+    def percentile(self, q: float) -> Optional[float]:
+        lat = sorted(l for l, ok in self.samples if ok)
+        if not lat:
+            return None
+        return lat[min(len(lat) - 1, int(q * len(lat)))]
+
+    def error_rate(self) -> float:
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, ok in self.samples if not ok) / len(self.samples)
+
+
+class LLMRouter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, _BackendStats] = {}
+        self._pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="llm-hedge")
+
+    # ---------------- 配置 ----------------
+
+    def backends(self) -> List[Backend]:
+        out = []
+        for b in _routing_cfg().get("backends") or []:
+            out.append(Backend(provider=str(b["provider"]).lower(), model=str(b["model"]),
+                               capabilities=frozenset(b.get("capabilities") or [])))
+        return out
+
+    def required_capabilities(self, call_site: str) -> Optional[frozenset]:
+        table = _routing_cfg().get("call_types") or {}
+        if call_site not in table:
+            return None
+        return frozenset(table[call_site] or [])
+
+    def enabled_for(self, call_site: str) -> bool:
+        cfg = _routing_cfg()
+        return bool(cfg.get("enabled", False)) and self.required_capabilities(call_site) is not None
+
+    # ---------------- 统计 ----------------
+
+    def _stat(self, backend: Backend) -> _BackendStats:
+        with self._lock:
+            st = self._stats.get(backend.name)
+            if st is None:
+                st = self._stats[backend.name] = _BackendStats(int(_routing_cfg().get("window_size", 50)))
+            return st
+
+    def record(self, backend: Backend, latency: float, ok: bool) -> None:
+        cfg = _routing_cfg()
+        st = self._stat(backend)
+        with self._lock:
+            st.record(latency, ok, float(cfg.get("unhealthy_cooldown_seconds", 30)),
+                      int(cfg.get("failure_threshold", 3)))
+
+    def is_healthy(self, backend: Backend) -> bool:
+        cfg = _routing_cfg()
+        st = self._stat(backend)
+        if time.monotonic() < st.unhealthy_until:
+            return False
+        return not (len(st.samples) >= int(cfg.get("min_samples", 5))
+                    and st.error_rate() > float(cfg.get("max_error_rate", 0.5)))
+
+    # ---------------- 路由 ----------------
+
+    def candidates(self, call_site: str, preferred: Optional[Tuple[str, str]] = None) -> List[Backend]:
+        """满足能力要求的后端，按（健康优先、p50 升序、首选优先）排序"""
+        need = self.required_capabilities(call_site) or frozenset()
+        prior = float(_routing_cfg().get("default_latency_seconds", 10.0))
+        pref = (preferred[0].lower(), preferred[1]) if preferred else None
+        pool = [b for b in self.backends() if need <= b.capabilities]
+        if pref and not any((b.provider, b.model) == pref for b in pool):
+            pool.append(Backend(provider=pref[0], model=pref[1], capabilities=need))
+
+        def rank(b: Backend):
+            p50 = self._stat(b).percentile(0.5)
+            return (not self.is_healthy(b), p50 if p50 is not None else prior, (b.provider, b.model) != pref)
+
+        return sorted(pool, key=rank)
+
+    def _timed(self, backend: Backend, fn: Callable[[Backend], Any]) -> Any:
+        t0 = time.monotonic()
+        try:
+            result = fn(backend)
+        except BaseException:
+            self.record(backend, time.monotonic() - t0, False)
+            raise
+        self.record(backend, time.monotonic() - t0, True)
+        return result
+
+    def _hedge_delay(self, backend: Backend) -> float:
+        floor = float(_routing_cfg().get("hedge_min_delay_seconds", 2.0))
+        p95 = self._stat(backend).percentile(0.95)
+        return max(floor, p95) if p95 is not None else max(floor, float(_routing_cfg().get("default_latency_seconds", 10.0)))
+
+    def execute(self, call_site: str, fn: Callable[[Backend], Any],
+                preferred: Optional[Tuple[str, str]] = None) -> Any:
+        """
+        按排名调用 fn(backend)。失败即转移到下一个后端；开启 hedge 时首选超过 p95 未返回则并发第二个。
+        """
+        ranked = self.candidates(call_site, preferred)
+        if not ranked:
+            raise RuntimeError(f"没有满足 {call_site} 能力要求的 LLM 后端")
+        if _routing_cfg().get("hedge", False) and len(ranked) >= 2:
+            return self._execute_hedged(call_site, ranked, fn)
+        last_exc: Optional[BaseException] = None
+        for b in ranked:
+            try:
+                return self._timed(b, fn)
+            except Exception as e:
+                last_exc = e
+                print(f"⚠️ [{call_site}] 后端 {b.name} 调用失败，尝试下一个: {e}")
+        raise last_exc  # type: ignore[misc]
+
+    def _execute_hedged(self, call_site: str, ranked: Sequence[Backend], fn: Callable[[Backend], Any]) -> Any:
+        def submit(b: Backend):
+            # 每个线程使用独立的上下文副本，保留调用方的埋点记录
+            return self._pool.submit(contextvars.copy_context().run, self._timed, b, fn)
+
+        primary = submit(ranked[0])
+        done, _ = wait([primary], timeout=self._hedge_delay(ranked[0]))
+        if primary in done and primary.exception() is None:
+            return primary.result()
+        if primary not in done:
+            print(f"⏱️ [{call_site}] {ranked[0].name} 超过 p95 未返回，对冲到 {ranked[1].name}")
+        pending = {primary, submit(ranked[1])}
+        last_exc: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for f in done:
+                if f.exception() is None:
+                    return f.result()
+                last_exc = f.exception()
+        # 两路都失败：继续按排名故障转移剩余后端
+        for b in ranked[2:]:
+            try:
+                return self._timed(b, fn)
+            except Exception as e:
+                last_exc = e
+        raise last_exc  # type: ignore[misc]
+
+    def stats(self) -> Dict[str, Any]:
+        out = {}
+        for b in self.backends():
+            st = self._stat(b)
+            out[b.name] = {"p50": st.percentile(0.5), "p95": st.percentile(0.95),
+                           "error_rate": round(st.error_rate(), 3), "samples": len(st.samples),
+                           "healthy": self.is_healthy(b)}
+        return out
+
+
+# 全局路由实例
+llm_router = LLMRouter()
+
+
+# ---------------- 跨 provider 的 JSON 对话 ----------------
+
+def _split_messages(messages: List[Dict[str, str]]) -> Tuple[str, str]:
+    system = "\n\n".join(m["content"] for m in messages if m.get("role") == "system")
+    user = "\n\n".join(m["content"] for m in messages if m.get("role") != "system")
+    return system, user
+
+
+def routed_chat(messages: List[Dict[str, str]], *, call_site: str, temperature: float,
+                json_mode: bool, priority: int, variant: Optional[int],
+                preferred: Tuple[str, str]) -> str:
+    """把一次 chat 请求路由到最合适的后端（DeepSeek 或 Gemini）"""
+    from agent.llm.gateway import chat_completion, gemini_generate
+
+    def call(b: Backend) -> str:
+        if b.provider == "deepseek":
+            return chat_completion(messages, model=b.model, call_site=call_site, temperature=temperature,
+                                   response_format={"type": "json_object"} if json_mode else None,
+                                   priority=priority, variant=variant, route=False)
+        if b.provider == "gemini":
+            system, user = _split_messages(messages)
+            config: Dict[str, Any] = {"temperature": temperature}
+            if json_mode:
+                config["response_mime_type"] = "application/json"
+            return gemini_generate(user, model=b.model, call_site=call_site, generation_config=config,
+                                   system_instruction=system or None, priority=priority, variant=variant,
+                                   route=False)
+        raise ValueError(f"Unsupported LLM provider: {b.provider}")
+
+    return llm_router.execute(call_site, call, preferred=preferred)
@@ -1,10 +1,10 @@
 # agent/miners/comments.py (稳定版)
 # -*- coding: utf-8 -*-
 from __future__ import annotations
-import os, json, re
+import json, re
 from typing import List, Dict, Any, Optional, Union
 from dotenv import load_dotenv
-from openai import OpenAI
+from agent.llm.gateway import chat_completion
 from agent.miners.insight_schema import InsightDoc
 from agent.collectors.bilibili import Video
 
@@ -12,11 +12,6 @@ load_dotenv()
 
 DEEPSEEK_MODEL = "deepseek-chat"
 
-def _load_client() -> "OpenAI":
-    api_key = os.getenv("DEEPSEEK_API_KEY", "").strip()
-    if not api_key: raise RuntimeError("缺少 DEEPSEEK_API_KEY。")
-    return OpenAI(api_key=api_key, base_url="https://api.deepseek.com")
-
 def _safe_load_json(s: str) -> Dict[str, Any]:
     s = re.sub(r"^```json\s*|\s*```$", "", s.strip(), flags=re.I).strip()
     try:
@@ -50,7 +45,7 @@ def _build_messages(video: Video, sample_comments: List[str]) -> List[Dict[str,
     user_prompt = (f"VIDEO:\n- title: {video.title}\n- url: {video.url}\n\nCOMMENTS (raw):\n" + "\n".join(f"- {c}" for c in sample_comments) + f"\n\n{schema_hint}")
     return [{"role":"system","content":sys_prompt}, {"role":"user","content":user_prompt}]
 
-def analyze_comments_to_insight(video: Union[Video, Dict[str, Any]], comments: List[Dict[str, Any]], model: str = DEEPSEEK_MODEL, temperature: float = 0.2, client: Optional["OpenAI"] = None,) -> Dict[str, Any]:
+def analyze_comments_to_insight(video: Union[Video, Dict[str, Any]], comments: List[Dict[str, Any]], model: str = DEEPSEEK_MODEL, temperature: float = 0.2, client: Optional[Any] = None,) -> Dict[str, Any]:
     if not isinstance(video, Video):
         v = Video(bvid=video.get("bvid",""), title=video.get("title",""), url=video.get("url",""), pubdate=0, stats={})
     else:
@@ -70,10 +65,8 @@ def analyze_comments_to_insight(video: Union[Video, Dict[str, Any]], comments: L
         empty = {"topics": [], "global_recs": {"prompt_deltas": [], "thumbnails": [], "titles": []}}
         InsightDoc(**empty); return empty
 
-    if client is None: client = _load_client()
     messages = _build_messages(v, sample)
-    resp = client.chat.completions.create(model=model, messages=messages, temperature=temperature, response_format={"type":"json_object"})
-    content = (resp.choices[0].message.content or "").strip()
+    content = chat_completion(messages, model=model, call_site="analyze_comments_to_insight", temperature=temperature, response_format={"type":"json_object"}, client=client)
     if not content: raise RuntimeError("模型未返回内容")
 
     obj = _safe_load_json(content)
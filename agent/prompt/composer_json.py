@@ -4,10 +4,10 @@ import os, json, re
 from datetime import datetime
 from typing import Dict, Any, List, Optional
 from dotenv import load_dotenv
-from openai import OpenAI
 from pydantic import ValidationError
 from agent.prompt.schema_json import VideoPromptJSON
 from agent.utils.io import write_json, ensure_dir
+from agent.llm.gateway import chat_completion
 
 load_dotenv()
 
@@ -16,13 +16,6 @@ def _ts() -> str:
     return datetime.now().strftime("%Y%m%d_%H%M")
 
 
-def ds_client() -> OpenAI:
-    key = os.getenv("DEEPSEEK_API_KEY")
-    if not key:
-        raise RuntimeError("缺少 DEEPSEEK_API_KEY")
-    return OpenAI(api_key=key, base_url="https://api.deepseek.com")
-
-
 SYSTEM_MSG = '''你是一个严格的 JSON 提示词生成器。
 要求：
 - 输出必须是一个合法的 JSON 对象，且完全符合给定的 JSON schema。
@@ -70,16 +63,15 @@ def _normalize_all(obj: Dict[str, Any], topic: str, series: str, source: str, ch
 
 def compose_v1_json(topic: str, series: str, defaults: Dict[str, Any], source: str = "hotspot",
                     model: str = "deepseek-chat", chinese_name: Optional[str] = None) -> Dict[str, Any]:
-    client = ds_client()
     user_msg = USER_TMPL.format(topic=topic)
 
-    resp = client.chat.completions.create(
+    content = chat_completion(
+        [{"role": "system", "content": SYSTEM_MSG}, {"role": "user", "content": user_msg}],
         model=model,
-        messages=[{"role": "system", "content": SYSTEM_MSG}, {"role": "user", "content": user_msg}],
+        call_site="compose_v1_json",
         temperature=0.2,
         response_format={"type": "json_object"}
     )
-    content = (resp.choices[0].message.content or "").strip()
 
     try:
         obj = json.loads(content)
@@ -0,0 +1,120 @@
+# agent/prompt/similarity.py
+# -*- coding: utf-8 -*-
+"""
+agent/prompt/similarity.py
+===========================================================
+作用：
+  判断两个 JSON Prompt 是否“近重复”（例如只换了一个同义词），
+  避免为几乎相同的变体再跑一次 Flow/Veo 生成。
+  - 结构相似度：展开为叶子字段（忽略 name / meta），相同叶子数 / 全部叶子数，同时给出改动字段列表
+  - 文本相似度：对 prompt.concept / prompt.actions / prompt.shots 的文本按词切成 n-gram（shingle），
+    逐字段计算 Jaccard 后取平均（两边都为空的字段不参与）
+  - 综合得分 = structural_weight × 结构 + (1 - structural_weight) × 文本，达到阈值即视为重复
+
+配置见 config/default.yaml 的 prompt.dedup 段。
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from agent.config import config_section
+
+IGNORED_KEYS = ("name", "meta")
+TEXT_FIELDS = ("concept", "actions", "shots")
+
+
+def dedup_cfg() -> Dict[str, Any]:
+    return config_section("prompt").get("dedup") or {}
+
+
+@dataclass
+class Similarity:
+    score: float
+    structural: float
+    textual: float
+    changed_fields: List[str] = field(default_factory=list)
+
+
+# ---------------- 结构 ----------------
+
+def _flatten(obj: Any, path: str = "$") -> Dict[str, Any]:
+    if isinstance(obj, dict):
+        out: Dict[str, Any] = {}
+        for k, v in obj.items():
+            if path == "$" and k in IGNORED_KEYS:
+                continue
+            out.update(_flatten(v, f"{path}.{k}"))
+        return out
+    if isinstance(obj, list):
+        out = {}
+        for i, v in enumerate(obj):
+            out.update(_flatten(v, f"{path}[{i}]"))
+        return out
+    return {path: obj}
+
+
+def field_diffs(a: Dict[str, Any], b: Dict[str, Any]) -> Tuple[float, List[str]]:
+    """返回 (结构相似度, 改动的叶子字段路径)"""
+    fa, fb = _flatten(a), _flatten(b)
+    paths = set(fa) | set(fb)
+    if not paths:
+        return 1.0, []
+    changed = sorted(p for p in paths if fa.get(p, object()) != fb.get(p, object()))
+    return 1.0 - len(changed) / len(paths), changed
+
+
+# ---------------- 文本 ----------------
+
+def _text_of(value: Any) -> str:
+    if isinstance(value, dict):
+        return " ".join(_text_of(v) for v in value.values())
+    if isinstance(value, list):
+        return " ".join(_text_of(v) for v in value)
+    return "" if value is None else str(value)
+
+
+def shingles(text: str, size: int = 2) -> Set[Tuple[str, ...]]:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def jaccard(a: Set[Any], b: Set[Any]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+def text_similarity(a: Dict[str, Any], b: Dict[str, Any], size: int = 2) -> float:
+    pa, pb = a.get("prompt") or {}, b.get("prompt") or {}
+    scores = []
+    for f in TEXT_FIELDS:
+        sa, sb = shingles(_text_of(pa.get(f)), size), shingles(_text_of(pb.get(f)), size)
+        if sa or sb:
+            scores.append(jaccard(sa, sb))
+    return sum(scores) / len(scores) if scores else 1.0
+
+
+# ---------------- 综合 ----------------
+
+def compare_prompts(a: Dict[str, Any], b: Dict[str, Any], cfg: Optional[Dict[str, Any]] = None) -> Similarity:
+    cfg = dedup_cfg() if cfg is None else cfg
+    weight = float(cfg.get("structural_weight", 0.4))
+    structural, changed = field_diffs(a, b)
+    textual = text_similarity(a, b, int(cfg.get("shingle_size", 2)))
+    return Similarity(score=weight * structural + (1 - weight) * textual, structural=structural,
+                      textual=textual, changed_fields=changed)
+
+
+def find_near_duplicate(candidate: Dict[str, Any], references: Sequence[Tuple[str, Dict[str, Any]]],
+                        cfg: Optional[Dict[str, Any]] = None) -> Optional[Tuple[str, Similarity]]:
+    """在 references（(标签, Prompt) 列表）中找与 candidate 最相似且达到阈值的一个；没有则返回 None"""
+    cfg = dedup_cfg() if cfg is None else cfg
+    threshold = float(cfg.get("threshold", 0.97))
+    best: Optional[Tuple[str, Similarity]] = None
+    for label, ref in references:
+        sim = compare_prompts(candidate, ref, cfg)
+        if (not sim.changed_fields or sim.score >= threshold) and (best is None or sim.score > best[1].score):
+            best = (label, sim)
+    return best
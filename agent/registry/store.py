@@ -4,11 +4,12 @@
 - 记录 name/path/series/topic/source/parent/created_at/status
 - 便于 UI 列表、回滚
 """
-import os, json
-from typing import Dict, Any
+import os, json, threading
+from typing import Dict, Any, Iterable, Tuple
 from agent.utils.io import ensure_dir, write_json
 
 INDEX_PATH = os.path.join("prompts", "index.json")
+_INDEX_LOCK = threading.Lock()
 
 def _load_index() -> Dict[str, Any]:
     if not os.path.exists(INDEX_PATH):
@@ -23,11 +24,9 @@ def _save_index(idx: Dict[str, Any]):
     ensure_dir(os.path.dirname(INDEX_PATH))
     write_json(INDEX_PATH, idx)
 
-def register_prompt(obj: Dict[str, Any], file_path: str, status: str = "ready") -> None:
-    idx = _load_index()
-    pid = obj.get("name")
+def _index_entry(obj: Dict[str, Any], file_path: str, status: str) -> Dict[str, Any]:
     meta = obj.get("meta", {})
-    idx[pid] = {
+    return {
         "name": obj.get("name"),
         "path": file_path.replace("\\", "/"),
         "series": meta.get("series"),
@@ -37,7 +36,21 @@ def register_prompt(obj: Dict[str, Any], file_path: str, status: str = "ready")
         "created_at": meta.get("created_at"),
         "status": status,
     }
-    _save_index(idx)
+
+def register_prompt(obj: Dict[str, Any], file_path: str, status: str = "ready") -> None:
+    register_prompts([(obj, file_path)], status=status)
+
+def register_prompts(items: Iterable[Tuple[Dict[str, Any], str]], status: str = "ready") -> int:
+    """批量登记：整个索引只读写一次，返回登记条数"""
+    items = list(items)
+    if not items:
+        return 0
+    with _INDEX_LOCK:
+        idx = _load_index()
+        for obj, file_path in items:
+            idx[obj.get("name")] = _index_entry(obj, file_path, status)
+        _save_index(idx)
+    return len(items)
 
 def list_prompts() -> Dict[str, Any]:
     return _load_index()
@@ -10,10 +10,15 @@ from threading import Lock
 from typing import Optional, Dict, Any
 
 # 从 agent 模块导入依赖，而不是 main
+from agent.generators.chrome_fleet import chrome_fleet
 from agent.generators.flow_automator import generate_video_in_flow
+from agent.generators.flow_results import flow_results
+from agent.generators.session_pool import flow_session_pool
 
 log = logging.getLogger("videoagent")
 MAX_CONCURRENT_FLOW_TASKS = 5
+WORKER_POLL_SECONDS = 0.5
+SHUTDOWN_GRACE_SECONDS = 30   # 退出时等待进行中任务的时长，超时后取消
 
 class FlowTaskManager:
     def __init__(self):
@@ -23,12 +28,15 @@ class FlowTaskManager:
         self.failed_tasks = {}     # 记录失败的任务
         self.lock = Lock()
         self.worker_task = None
-        self.browser_locks = {}    # 浏览器端口锁，防止端口冲突
+        self.cleanup_task = None
+        # 事件循环只弱引用 Task：进行中的任务保存在这里，避免运行中途被回收，退出时统一等待/取消
+        self._inflight = set()
         self.task_history = deque(maxlen=100)  # 任务历史记录
         self.start_time = time.time()  # 记录启动时间
         log.info("✅ FlowTaskManager initialized with enhanced features.")
 
-    def add_task(self, prompt_content: str, debugging_port: Optional[int], flow_url: Optional[str]) -> str:
+    def add_task(self, prompt_content: str, debugging_port: Optional[int], flow_url: Optional[str],
+                 prompt_path: Optional[str] = None) -> str:
         # 检查是否已有相同内容的任务在队列中
         with self.lock:
             for existing_task in self.task_queue:
@@ -52,7 +60,8 @@ class FlowTaskManager:
             "details": {
                 "prompt_content": prompt_content,
                 "debugging_port": debugging_port,
-                "flow_url": flow_url
+                "flow_url": flow_url,
+                "prompt_path": prompt_path
             }
         }
         
@@ -68,104 +77,135 @@ class FlowTaskManager:
         log.info(f"📥 Task {task_id} added to Flow queue. Queue size: {len(self.task_queue)}")
         return task_id
 
+    def capacity(self) -> int:
+        """
+        可同时运行的 Flow 任务数：每个浏览器 tabs_per_browser 个标签页槽位。
+        启用受管 Chrome 实例组时按健康实例数扩展（没有健康实例时为 0，任务留在队列里）；
+        手动浏览器不超过 MAX_CONCURRENT_FLOW_TASKS。
+        """
+        ports = chrome_fleet.healthy_ports()
+        if ports:
+            return flow_session_pool.capacity(len(ports))
+        if chrome_fleet.enabled:
+            return 0
+        return min(MAX_CONCURRENT_FLOW_TASKS, flow_session_pool.capacity())
+
+    def _assign_port(self, task: Dict[str, Any]) -> Optional[int]:
+        """任务指定了端口就用它；否则分给运行任务最少的健康受管实例（调用方持有 self.lock）"""
+        if task["details"]["debugging_port"]:
+            return task["details"]["debugging_port"]
+        ports = chrome_fleet.healthy_ports()
+        if not ports:
+            return None
+        load = {p: 0 for p in ports}
+        for running in self.running_tasks.values():
+            if running.get("port") in load:
+                load[running["port"]] += 1
+        return min(ports, key=lambda p: load[p])
+
+    def _retry_or_fail(self, task: Dict[str, Any], result: Dict[str, Any]) -> None:
+        """失败的任务未超过重试次数时重新入队，否则记为失败"""
+        task["result"] = result
+        if task["retry_count"] < task["max_retries"]:
+            task["retry_count"] += 1
+            task["status"] = "queued"
+            log.warning(f"🔄 Task {task['task_id']} failed, retrying ({task['retry_count']}/{task['max_retries']})")
+            with self.lock:
+                self.task_queue.append(task)
+                self.task_history.append({
+                    "task_id": task["task_id"],
+                    "action": "retry",
+                    "timestamp": time.time(),
+                    "retry_count": task["retry_count"]
+                })
+        else:
+            log.error(f"❌ Task {task['task_id']} failed after {task['max_retries']} retries")
+            task["status"] = "failed"
+            with self.lock:
+                self.failed_tasks[task["task_id"]] = task
+
+    async def _run_task(self, task: Dict[str, Any]) -> None:
+        """在线程中执行一次 Flow 提交；同一浏览器的并发由会话池的标签页槽位控制"""
+        try:
+            # 同一任务重试时已有渲染结果则直接复用，不再重复生成
+            existing = flow_results.find(task["task_id"])
+            if existing:
+                log.info(f"⏭️ Task {task['task_id']} skipped, output already exists: {existing['output_path']}")
+                result = {"success": True, "status": "rendered", "skipped": True,
+                          "message": "结果已存在，跳过生成", "output_path": existing["output_path"]}
+            else:
+                result = await asyncio.to_thread(
+                    generate_video_in_flow,
+                    task["details"]["prompt_content"],
+                    task.get("port"),
+                    task["details"]["flow_url"] or chrome_fleet.start_url or None,
+                    task["task_id"],
+                    task["details"].get("prompt_path"),
+                    None,
+                    # 受管实例组：分配的端口不通时失败并按重试重新入队，不回退到手动浏览器
+                    not chrome_fleet.enabled
+                )
+            if result.get("success"):
+                log.info(f"✅ Task {task['task_id']} finished successfully: {result.get('message')}")
+                task["result"] = result
+                # rendered: 已等到渲染完成并下载；completed: 仅确认已提交
+                task["status"] = "rendered" if result.get("status") == "rendered" else "completed"
+                with self.lock:
+                    self.completed_tasks[task["task_id"]] = task
+            elif result.get("status") == "unconfirmed":
+                # 回车/点击已发出但未确认：可能已经提交，重试会重复生成，留待人工核实
+                log.warning(f"⚠️ Task {task['task_id']} submit unconfirmed, not retrying: {result.get('message')}")
+                task["result"] = result
+                task["status"] = "unconfirmed"
+                with self.lock:
+                    self.failed_tasks[task["task_id"]] = task
+            else:
+                self._retry_or_fail(task, result)
+        except Exception as e:
+            log.error(f"❌ Task {task['task_id']} failed with exception: {e}")
+            self._retry_or_fail(task, {"success": False, "message": str(e)})
+        finally:
+            with self.lock:
+                self.running_tasks.pop(task["task_id"], None)
+                log.info(f"⏹️ Task {task['task_id']} removed from active list. Active tasks: {len(self.running_tasks)}")
+
     async def worker(self):
         log.info("🧑‍🏭 Flow task worker started.")
         while True:
-            task_to_run = None
-            with self.lock:
-                if self.task_queue and len(self.running_tasks) < MAX_CONCURRENT_FLOW_TASKS:
+            # 有空闲槽位就立即派发，多个任务在不同标签页中并行提交
+            capacity = self.capacity()
+            while True:
+                with self.lock:
+                    if not self.task_queue or len(self.running_tasks) >= capacity:
+                        break
                     task_to_run = self.task_queue.popleft()
                     task_to_run["status"] = "running"
                     task_to_run["started_at"] = time.time()
+                    task_to_run["port"] = self._assign_port(task_to_run)
                     self.running_tasks[task_to_run["task_id"]] = task_to_run
                     log.info(f"▶️ Starting task {task_to_run['task_id']}. Active tasks: {len(self.running_tasks)}")
+                inflight = asyncio.create_task(self._run_task(task_to_run))
+                self._inflight.add(inflight)
+                inflight.add_done_callback(self._inflight.discard)
 
-            if task_to_run:
-                try:
-                    # 添加任务间延迟，避免浏览器冲突
-                    if len(self.running_tasks) > 1:
-                        delay = 3.0  # 多个任务运行时增加延迟
-                        log.info(f"⏳ Adding delay {delay}s to avoid browser conflicts...")
-                        await asyncio.sleep(delay)
-                    
-                    # 检查浏览器端口是否被占用
-                    debugging_port = task_to_run["details"]["debugging_port"]
-                    if debugging_port and debugging_port in self.browser_locks:
-                        log.warning(f"⚠️ Port {debugging_port} is locked, waiting...")
-                        await asyncio.sleep(2.0)
-                    
-                    # 锁定浏览器端口
-                    if debugging_port:
-                        self.browser_locks[debugging_port] = task_to_run["task_id"]
-                    
-                    try:
-                        result = await asyncio.to_thread(
-                            generate_video_in_flow,
-                            task_to_run["details"]["prompt_content"],
-                            debugging_port,
-                            task_to_run["details"]["flow_url"]
-                        )
-                        
-                        if result.get("success"):
-                            log.info(f"✅ Task {task_to_run['task_id']} finished successfully: {result.get('message')}")
-                            task_to_run["result"] = result
-                            task_to_run["status"] = "completed"
-                            
-                            with self.lock:
-                                self.completed_tasks[task_to_run["task_id"]] = task_to_run
-                        else:
-                            # 任务失败，检查是否需要重试
-                            if task_to_run["retry_count"] < task_to_run["max_retries"]:
-                                task_to_run["retry_count"] += 1
-                                log.warning(f"🔄 Task {task_to_run['task_id']} failed, retrying ({task_to_run['retry_count']}/{task_to_run['max_retries']})")
-                                
-                                # 重新加入队列
-                                with self.lock:
-                                    self.task_queue.append(task_to_run)
-                                    self.task_history.append({
-                                        "task_id": task_to_run["task_id"],
-                                        "action": "retry",
-                                        "timestamp": time.time(),
-                                        "retry_count": task_to_run["retry_count"]
-                                    })
-                                continue
-                            else:
-                                log.error(f"❌ Task {task_to_run['task_id']} failed after {task_to_run['max_retries']} retries")
-                                task_to_run["result"] = result
-                                task_to_run["status"] = "failed"
-                                
-                                with self.lock:
-                                    self.failed_tasks[task_to_run["task_id"]] = task_to_run
-                        
-                    finally:
-                        # 释放浏览器端口锁
-                        if debugging_port and debugging_port in self.browser_locks:
-                            del self.browser_locks[debugging_port]
-                            
-                except Exception as e:
-                    log.error(f"❌ Task {task_to_run['task_id']} failed with exception: {e}")
-                    task_to_run["result"] = {"success": False, "message": str(e)}
-                    task_to_run["status"] = "failed"
-                    
-                    # 检查是否需要重试
-                    if task_to_run["retry_count"] < task_to_run["max_retries"]:
-                        task_to_run["retry_count"] += 1
-                        log.warning(f"🔄 Task {task_to_run['task_id']} exception, retrying ({task_to_run['retry_count']}/{task_to_run['max_retries']})")
-                        
-                        with self.lock:
-                            self.task_queue.append(task_to_run)
-                        continue
-                    else:
-                        with self.lock:
-                            self.failed_tasks[task_to_run["task_id"]] = task_to_run
-                
-                finally:
-                    with self.lock:
-                        if task_to_run["task_id"] in self.running_tasks:
-                            del self.running_tasks[task_to_run['task_id']]
-                        log.info(f"⏹️ Task {task_to_run['task_id']} removed from active list. Active tasks: {len(self.running_tasks)}")
+            await asyncio.sleep(WORKER_POLL_SECONDS)
 
-            await asyncio.sleep(5)
+    async def shutdown(self, timeout: float = SHUTDOWN_GRACE_SECONDS) -> None:
+        """停止派发新任务，等待进行中的任务结束；超时仍未结束的取消"""
+        for background in (self.worker_task, self.cleanup_task):
+            if background is not None:
+                background.cancel()
+        self.worker_task = self.cleanup_task = None
+        inflight = list(self._inflight)
+        if not inflight:
+            return
+        log.info(f"⏳ Waiting for {len(inflight)} in-flight Flow task(s) before shutdown...")
+        done, pending = await asyncio.wait(inflight, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            log.warning(f"⚠️ Cancelled {len(pending)} Flow task(s) still running at shutdown")
+            await asyncio.gather(*pending, return_exceptions=True)
 
     def start_worker(self):
         if self.worker_task is None:
@@ -182,7 +222,7 @@ class FlowTaskManager:
                 self.worker_task = loop.create_task(self.worker())
                 
                 # 启动清理任务
-                cleanup_task = loop.create_task(self._cleanup_worker())
+                self.cleanup_task = loop.create_task(self._cleanup_worker())
                 
                 log.info("✅ Worker task and cleanup task created successfully.")
             except Exception as e:
@@ -235,9 +275,10 @@ class FlowTaskManager:
                 "queued": len(self.task_queue),
                 "running": len(self.running_tasks),
                 "completed": len(self.completed_tasks),
+                "rendered": sum(1 for t in self.completed_tasks.values() if t.get("status") == "rendered"),
                 "failed": len(self.failed_tasks),
                 "total": len(self.task_queue) + len(self.running_tasks) + len(self.completed_tasks) + len(self.failed_tasks),
-                "browser_locks": list(self.browser_locks.keys()),
+                "capacity": self.capacity(),
                 "recent_history": list(self.task_history)[-10:] if self.task_history else []
             }
     
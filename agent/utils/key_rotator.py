@@ -1,36 +1,209 @@
 # agent/utils/key_rotator.py
 # -*- coding: utf-8 -*-
+"""
+agent/utils/key_rotator.py
+===========================================================
+作用：
+  Gemini / DeepSeek 的 API Key 池，每次请求单独取 key（不再进程级固定一个 key）。
+  - 每个 key 记录最近 60 秒的请求数与 token 数，对照 RPM / TPM 预算
+  - 遇到 429 / 配额错误的 key 进入冷却（优先使用 Retry-After）
+  - 在健康且未超预算的 key 中选择负载最低的（在途数、窗口内请求数）
+  - 所有 key 都超预算时短暂等待，超过 max_wait_seconds 则退而使用最早可用的 key
+
+key 来源：GEMINI_API_KEYS / DEEPSEEK_API_KEYS（逗号分隔），兼容单个的 GEMINI_API_KEY / DEEPSEEK_API_KEY；
+环境变量变化（如通过 /api/keys/update 更新）后自动重新加载。
+预算配置见 config/default.yaml 的 llm.keys 段。
+"""
 import os
-from itertools import cycle
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from agent.config import config_section
+
+WINDOW_SECONDS = 60.0
+
+
+def _keys_cfg(provider: str) -> Dict[str, Any]:
+    cfg = config_section("llm").get("keys") or {}
+    out = {k: v for k, v in cfg.items() if not isinstance(v, dict)}
+    out.update(cfg.get(provider) or {})
+    return out
+
+
+class _KeyState:
+    def __init__(self, key: str):
+        self.key = key
+        self.in_flight = 0
+        self.window: Deque[List[float]] = deque()   # [时间, token 数]，token 数在请求结束后更新
+        self.cooldown_until = 0.0
+        self.rate_limited = 0
+
+    def trim(self, now: float) -> None:
+        while self.window and now - self.window[0][0] > WINDOW_SECONDS:
+            self.window.popleft()
+
+    def tokens(self) -> int:
+        return int(sum(t for _, t in self.window))
+
+    def available_at(self, now: float, rpm: int, tpm: int, need_tokens: int) -> float:
+        """该 key 能再接一个请求的最早时间（now 表示立即可用）"""
+        at = max(now, self.cooldown_until)
+        if rpm and len(self.window) >= rpm:
+            at = max(at, self.window[len(self.window) - rpm][0] + WINDOW_SECONDS)
+        if tpm and self.window and self.tokens() + need_tokens > tpm:
+            at = max(at, self.window[0][0] + WINDOW_SECONDS)
+        return at
+
+
+class KeyLease:
+    """一次请求占用的 key；调用方在拿到实际用量后可写入 tokens"""
+
+    def __init__(self, key: str, estimated_tokens: int):
+        self.key = key
+        self.tokens = estimated_tokens
+
+
+class ApiKeyPool:
+    def __init__(self, provider: str, env_multi: str, env_single: str):
+        self.provider = provider
+        self.env_multi = env_multi
+        self.env_single = env_single
+        self._lock = threading.Lock()
+        self._source = None
+        self._states: Dict[str, _KeyState] = {}
+        self._reload_locked()
 
-class ApiKeyManager:
-    def __init__(self):
-        self._keys = self._load_keys()
-        if not self._keys:
-            self._key_cycler = None
-        else:
-            self._key_cycler = cycle(self._keys)
+    # ---------------- 加载 ----------------
 
-    def _load_keys(self):
+    def _load_keys(self) -> List[str]:
         """从环境变量加载以逗号分隔的API密钥"""
-        keys_str = os.getenv("GEMINI_API_KEYS", "")
+        keys_str = os.getenv(self.env_multi, "")
         if not keys_str:
             # 兼容旧的单个key
-            single_key = os.getenv("GEMINI_API_KEY")
-            return [single_key] if single_key else []
-
+            single_key = os.getenv(self.env_single)
+            return [single_key.strip()] if single_key and single_key.strip() else []
         # 去除空格和空字符串
         return [key.strip() for key in keys_str.split(',') if key.strip()]
 
-    def get_next_key(self):
-        """获取下一个可用的API Key"""
-        if not self._key_cycler:
-            return None
-        return next(self._key_cycler)
+    def _reload_locked(self) -> None:
+        source = (os.getenv(self.env_multi, ""), os.getenv(self.env_single, ""))
+        if source == self._source:
+            return
+        self._source = source
+        keys = self._load_keys()
+        # 保留仍在使用的 key 的统计与冷却状态
+        self._states = {k: self._states.get(k) or _KeyState(k) for k in keys}
+
+    @property
+    def keys(self) -> List[str]:
+        with self._lock:
+            self._reload_locked()
+            return list(self._states)
+
+    # ---------------- 取 key ----------------
+
+    def acquire(self, estimated_tokens: int = 0, pinned: Optional[str] = None, block: bool = True) -> Optional[str]:
+        """
+        选出一个 key 并登记一次请求（在途 +1）。必须与 release() 成对使用，
+        推荐直接用 lease()。pinned 指定 key 时只做记账（如 Gemini 文件绑定了上传时的 key）。
+        """
+        got = self._acquire(estimated_tokens, pinned, block)
+        return got[0] if got else None
+
+    def _acquire(self, estimated_tokens: int, pinned: Optional[str], block: bool) -> Optional[Tuple[str, List[float]]]:
+        cfg = _keys_cfg(self.provider)
+        rpm, tpm = int(cfg.get("rpm", 0) or 0), int(cfg.get("tpm", 0) or 0)
+        deadline = time.monotonic() + float(cfg.get("max_wait_seconds", 30))
+        while True:
+            with self._lock:
+                self._reload_locked()
+                if pinned is not None and pinned not in self._states:
+                    self._states[pinned] = _KeyState(pinned)
+                states = [self._states[pinned]] if pinned is not None else list(self._states.values())
+                if not states:
+                    return None
+                now = time.time()
+                for st in states:
+                    st.trim(now)
+                ready = [(st.available_at(now, rpm, tpm, estimated_tokens), st) for st in states]
+                earliest = min(at for at, _ in ready)
+                if earliest <= now or not block or pinned is not None or time.monotonic() >= deadline:
+                    candidates = [st for at, st in ready if at <= now] or \
+                                 [st for at, st in ready if at == earliest]
+                    best = min(candidates, key=lambda s: (s.in_flight, len(s.window)))
+                    best.in_flight += 1
+                    entry = [now, estimated_tokens]
+                    best.window.append(entry)
+                    return best.key, entry
+            time.sleep(min(max(earliest - now, 0.05), max(deadline - time.monotonic(), 0.05), 1.0))
+
+    def release(self, key: str, tokens_used: Optional[int] = None, error: Optional[BaseException] = None,
+                _entry: Optional[List[float]] = None) -> None:
+        """归还 key；tokens_used 为实际用量，error 为 429/配额错误时让该 key 冷却"""
+        with self._lock:
+            st = self._states.get(key)
+            if st is None:
+                return
+            st.in_flight = max(0, st.in_flight - 1)
+            if tokens_used is not None and _entry is not None:
+                # 用实际用量替换本次请求登记时的估计值
+                _entry[1] = int(tokens_used)
+            if error is not None:
+                from agent.llm.gateway import is_rate_limited, _retry_after
+                if is_rate_limited(error):
+                    cooldown = _retry_after(error) or float(_keys_cfg(self.provider).get("cooldown_seconds", 60))
+                    st.cooldown_until = time.time() + cooldown
+                    st.rate_limited += 1
+                    print(f"🧊 {self.provider} key ...{key[-4:]} 触发限流，冷却 {cooldown:.0f}s")
+
+    @contextmanager
+    def lease(self, estimated_tokens: int = 0, pinned: Optional[str] = None, block: bool = True) -> Iterator[KeyLease]:
+        got = self._acquire(estimated_tokens, pinned, block)
+        if got is None:
+            raise ValueError(f"{self.env_multi} not set in .env file")
+        key, entry = got
+        lease = KeyLease(key, estimated_tokens)
+        try:
+            yield lease
+        except BaseException as e:
+            self.release(key, error=e, _entry=entry)
+            raise
+        self.release(key, tokens_used=lease.tokens, _entry=entry)
+
+    def get_next_key(self) -> Optional[str]:
+        """不跟踪在途的一次性取 key（兼容旧接口）：选最空闲的 key 并计入 RPM"""
+        key = self.acquire(block=False)
+        if key is not None:
+            self.release(key)
+        return key
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.time()
+        out = {}
+        with self._lock:
+            for k, st in self._states.items():
+                st.trim(now)
+                out[f"...{k[-4:]}"] = {"in_flight": st.in_flight, "requests_1m": len(st.window),
+                                       "tokens_1m": st.tokens(), "rate_limited": st.rate_limited,
+                                       "cooldown_s": round(max(0.0, st.cooldown_until - now), 1)}
+        return out
+
+
+# 创建全局实例，以便所有模块共享同一个 key 池状态
+gemini_key_pool = ApiKeyPool("gemini", "GEMINI_API_KEYS", "GEMINI_API_KEY")
+deepseek_key_pool = ApiKeyPool("deepseek", "DEEPSEEK_API_KEYS", "DEEPSEEK_API_KEY")
+
+# 兼容旧名称
+gemini_key_rotator = gemini_key_pool
 
-# 创建一个全局实例，以便所有模块共享同一个轮询状态
-gemini_key_rotator = ApiKeyManager()
 
 def get_next_gemini_key():
     """方便调用的函数"""
-    return gemini_key_rotator.get_next_key()
+    return gemini_key_pool.get_next_key()
+
+
+def get_next_deepseek_key():
+    return deepseek_key_pool.get_next_key()
@@ -339,15 +339,18 @@ with left_col:
                         with st.spinner("正在下载视频并进行Gemini分析..."):
                             selected_urls = selected_rows['🔗 链接'].tolist()
                             hotspots_to_process = [h for h in st.session_state['hotspot_results'] if h['url'] in selected_urls]
-                            for hotspot in hotspots_to_process:
-                                try:
-                                    res = requests.post(f"{API_BASE_URL}/api/hotspot/generate-from-link", json={"video_url": hotspot['url']}, proxies=get_proxy_settings()).json()
-                                    for r in res.get("results", []):
-                                        st.subheader(f"生成结果: `{r.get('saved_path')}`")
-                                        st.info(f"🤖 **Gemini 视频摘要**: {r.get('video_summary')}")
-                                        display_prompt(r.get("prompt_content"))
-                                except Exception as e:
-                                    st.error(f"分析 {hotspot['title']} 失败: {e}")
+                            try:
+                                # 一次提交所有选中项，由后端流水线并行下载/上传/分析
+                                payload = {"hotspots": [{"url": h['url'], "title": h.get('title', '')} for h in hotspots_to_process]}
+                                res = requests.post(f"{API_BASE_URL}/api/hotspot/analyze-batch", json=payload, proxies=get_proxy_settings()).json()
+                                for r in res.get("results", []):
+                                    st.subheader(f"生成结果: `{r.get('saved_path')}`")
+                                    st.info(f"🤖 **Gemini 视频摘要**: {r.get('video_summary')}")
+                                    display_prompt(r.get("prompt_content"))
+                                for err in res.get("errors", []):
+                                    st.error(f"分析 {(err.get('hotspot') or {}).get('title', '')} 失败: {err.get('error') or err.get('raw_response')}")
+                            except Exception as e:
+                                st.error(f"批量分析失败: {e}")
 
     # 其他标签页（简化版）
     # 获取可用的Prompt选项
@@ -425,12 +428,15 @@ with left_col:
         
         with col2:
             user_hint = st.text_input("创意提示（可选）", placeholder="例如：更梦幻的风格", key="expand_hint")
+            expand_mode = st.selectbox("扩展模式", ["concurrent", "batched"], key="expand_mode",
+                                       help="concurrent: 并行逐个生成；batched: 一次调用生成全部变体")
         
         if st.button("✨ 开始扩展", key="expand_btn"):
             if expand_prompt:
                 try:
                     with st.spinner("正在扩展中..."):
-                        payload = {"prompt_path": expand_prompt, "num_expansions": num_expansions}
+                        payload = {"prompt_path": expand_prompt, "num_expansions": num_expansions,
+                                   "mode": expand_mode}
                         if user_hint:
                             payload["user_hint"] = user_hint
                         
@@ -439,8 +445,8 @@ with left_col:
                                               proxies=get_proxy_settings())
                         if response.status_code == 200:
                             result = response.json()
-                            st.success(f"扩展完成！生成了 {len(result.get('generated_prompts', []))} 个变体")
-                            for i, prompt in enumerate(result.get('generated_prompts', [])):
+                            st.success(f"扩展完成！生成了 {len(result.get('results', []))} 个变体")
+                            for i, prompt in enumerate(result.get('results', [])):
                                 st.info(f"变体 {i+1}: {prompt.get('saved_path', 'N/A')}")
                         else:
                             st.error(f"扩展失败: {response.text}")
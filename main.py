@@ -11,16 +11,20 @@ import logging
 from typing import List, Dict, Any, Optional, Union
 
 from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field
-from dotenv import find_dotenv, set_key
+from dotenv import find_dotenv, load_dotenv, set_key
 
 # --- Project imports ---
 from agent.generators.flow_automator import generate_video_in_flow
+from agent.generators.session_pool import flow_session_pool
+from agent.generators.chrome_fleet import chrome_fleet
+from agent.generators.flow_results import flow_results
 from agent.utils.cookie_loader import generate_qr_code_data, poll_qr_code_status
 from agent.hotspot.finder import find_hotspots as find_hotspots_logic
 from agent.enhancers.gemini_vision import analyze_video_and_generate_prompt
+from agent.enhancers.video_pipeline import analyze_hotspots_async
 from agent.iterators.series_trace import iterate_series_with_trace
 from agent.interactive.refiner import refine_prompt_json, save_refined_version, _json_diff
 from agent.registry.store import register_prompt
@@ -30,6 +34,12 @@ from agent.generators.veo_api import submit_veo_generation_task
 from agent.brain.core import agent_brain
 from langchain_core.messages import HumanMessage, SystemMessage, AIMessage, BaseMessage
 from agent.tasks import flow_task_manager
+from agent.llm.clients import close_all as close_llm_clients
+from agent.llm.gateway import llm_gateway
+from agent.llm.cache import llm_cache
+from agent.llm.metrics import llm_metrics
+from agent.llm.router import llm_router
+from agent.utils.key_rotator import gemini_key_pool, deepseek_key_pool
 
 # --- Logging & App Setup ---
 logging.basicConfig(level=logging.INFO)
@@ -70,6 +80,7 @@ class GenerateVideoRequest(BaseModel):
     prompt_paths: List[str]  # 改为支持多个prompt路径
     flow_url: Optional[str] = None
     debugging_port: Optional[int] = None
+    wait_for_render: bool = False  # 为真时等待渲染完成并下载结果后再返回
 
 class HotspotRequest(BaseModel):
     keywords: List[str]
@@ -82,6 +93,10 @@ class ManualLinkRequest(BaseModel):
     video_url: str
     series: str = "Manual Input Series"
 
+class AnalyzeBatchRequest(BaseModel):
+    hotspots: List[Dict[str, Any]]
+    series: str = "Manual Input Series"
+
 class IterateRequest(BaseModel):
     base_prompt_path: str
     video_url: str
@@ -89,11 +104,13 @@ class IterateRequest(BaseModel):
 class RefineRequest(BaseModel):
     prompt_path: str
     feedback: str
+    mode: str = "patch"  # patch: 仅返回改动补丁；full: 返回整份 JSON
 
 class ExpandRequest(BaseModel):
     prompt_path: str
     num_expansions: int = 3
     user_hint: Optional[str] = None
+    mode: str = "concurrent"  # concurrent: 并行逐个生成；batched: 一次调用生成全部变体
 
 # -------------------- Helpers --------------------
 def mask_key(key: Optional[str]) -> Optional[str]:
@@ -134,6 +151,18 @@ def convert_messages_to_langchain_format(messages: List[Message]) -> List[BaseMe
 async def health():
     return {"ok": True, "ts": time.time()}
 
+@app.get("/api/llm/stats", tags=["LLM"])
+async def llm_stats():
+    """LLM 网关准入状态、响应缓存命中与各调用点耗时/用量汇总"""
+    return {"gateway": llm_gateway.stats(), "cache": llm_cache.stats(), "routing": llm_router.stats(),
+            "keys": {"gemini": gemini_key_pool.stats(), "deepseek": deepseek_key_pool.stats()},
+            "calls": llm_metrics.summary()}
+
+@app.get("/api/metrics", tags=["LLM"], response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus 文本格式的 LLM 调用指标"""
+    return PlainTextResponse(llm_metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
 @app.get("/api/auth/get-qr-code", tags=["Authentication"])
 async def get_qr_code():
     try:
@@ -202,6 +231,8 @@ async def update_api_keys(keys: UpdateApiKeysRequest):
             # 如果没有提供，清空密钥
             set_key(dotenv_path, "GEMINI_API_KEYS", "")
             set_key(dotenv_path, "GEMINI_API_KEY", "")
+        # 同步到当前进程环境，key 池在下次取 key 时自动重新加载
+        load_dotenv(dotenv_path, override=True)
         return {"success": True, "message": "API密钥已成功更新！"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"更新 .env 文件时出错: {e}")
@@ -286,6 +317,16 @@ async def generate_from_link(request: ManualLinkRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"处理链接时发生错误: {e}")
 
+@app.post("/api/hotspot/analyze-batch", tags=["Hotspot"])
+async def analyze_batch(request: AnalyzeBatchRequest):
+    """多个热点一次提交，走分阶段并行的分析流水线"""
+    try:
+        results = await analyze_hotspots_async(request.hotspots, request.series)
+        return JSONResponse(content={"results": [r for r in results if "saved_path" in r],
+                                     "errors": [r for r in results if "saved_path" not in r]})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"批量分析热点时发生错误: {e}")
+
 @app.post("/api/iterate/from-video", tags=["Iteration"])
 async def iterate_from_video(request: IterateRequest):
     try:
@@ -306,7 +347,8 @@ async def iterate_from_video(request: IterateRequest):
 @app.post("/api/prompt/refine", tags=["Prompt Management"])
 async def refine_prompt_endpoint(request: RefineRequest):
     try:
-        old, new, diffs = refine_prompt_json(base_json_path=request.prompt_path, user_feedback=request.feedback)
+        old, new, diffs = refine_prompt_json(base_json_path=request.prompt_path, user_feedback=request.feedback,
+                                              mode=request.mode)
         new_path = save_refined_version(new, base_json_path=request.prompt_path)
         register_prompt(new, new_path, status="ready")
         return JSONResponse(content={"new_prompt_path": new_path, "new_content": new, "diffs": diffs})
@@ -318,46 +360,50 @@ async def expand_prompt_api(request: ExpandRequest):
     try:
         results = expand_prompt(prompt_path=request.prompt_path,
                                 num_expansions=request.num_expansions,
-                                user_hint=request.user_hint)
+                                user_hint=request.user_hint,
+                                mode=request.mode)
         return JSONResponse(content={"results": results})
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"创意扩展失败: {e}")
 
 @app.post("/api/generate/video", tags=["Video Generation"])
 async def generate_video(request: GenerateVideoRequest):
     try:
-        results = []
-        
-        for prompt_path in request.prompt_paths:
+        async def submit(prompt_path: str) -> Dict[str, Any]:
             # 从文件路径读取prompt内容
             if not os.path.exists(prompt_path):
-                results.append({
+                return {
                     "success": False,
                     "error": f"Prompt文件不存在: {prompt_path}",
                     "prompt_path": prompt_path
-                })
-                continue
-            
+                }
             try:
                 with open(prompt_path, 'r', encoding='utf-8') as f:
                     prompt_content = f.read()
-                
-                # 调用Flow自动化，只传递必要的参数
+
+                # 各 prompt 并行提交，由会话池分配到同一浏览器的不同标签页
                 result = await asyncio.to_thread(
                     generate_video_in_flow,
-                    prompt_content
+                    prompt_content,
+                    request.debugging_port,
+                    request.flow_url,
+                    None,
+                    prompt_path,
+                    request.wait_for_render
                 )
-                
                 result["prompt_path"] = prompt_path
-                results.append(result)
-                
+                return result
             except Exception as e:
-                results.append({
+                return {
                     "success": False,
                     "error": f"处理prompt文件失败: {str(e)}",
                     "prompt_path": prompt_path
-                })
-        
+                }
+
+        results = list(await asyncio.gather(*(submit(p) for p in request.prompt_paths)))
+
         # 返回所有结果
         return JSONResponse(content={
             "results": results,
@@ -398,6 +444,14 @@ async def startup_event():
         os.environ["API_PORT"] = "8001"
         log.info("Set default API_PORT to 8001")
     
+    # 启动受管 Chrome 实例组（flow.fleet.enabled 为 false 时跳过）
+    if chrome_fleet.enabled:
+        try:
+            ports = await asyncio.to_thread(chrome_fleet.start)
+            log.info(f"✅ Chrome fleet started, healthy ports: {ports}")
+        except Exception as e:
+            log.error(f"❌ Failed to start Chrome fleet: {e}")
+
     # 启动Flow任务管理器
     try:
         flow_task_manager.start_worker()
@@ -406,6 +460,16 @@ async def startup_event():
         log.error(f"❌ Failed to start FlowTaskManager worker: {e}")
         # 即使启动失败，应用仍然可以运行
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    # 先等待/取消进行中的 Flow 任务，再关闭它们使用的浏览器会话
+    await flow_task_manager.shutdown()
+    # 释放 LLM 客户端持有的连接池
+    close_llm_clients()
+    # 退出复用的浏览器会话，避免 chromedriver 进程泄漏
+    flow_session_pool.close_all()
+    chrome_fleet.stop()
+
 @app.get("/api/flow/queue_status", tags=["Video Generation"])
 async def get_flow_queue_status():
     """获取当前Flow任务队列的状态"""
@@ -416,6 +480,9 @@ async def get_flow_queue_status():
         # 添加一些有用的统计信息
         summary["timestamp"] = time.time()
         summary["uptime"] = time.time() - flow_task_manager.start_time if hasattr(flow_task_manager, 'start_time') else 0
+        summary["sessions"] = flow_session_pool.stats()
+        summary["fleet"] = chrome_fleet.stats()
+        summary["results"] = flow_results.stats()
         
         return summary
     except Exception as e:
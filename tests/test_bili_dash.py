@@ -0,0 +1,116 @@
+import pytest
+
+from agent.collectors import bili_dash
+from agent.collectors.bili_dash import pick_representations
+
+
+def test_picks_smallest_fitting_avc_stream_and_smallest_audio():
+    dash = {
+        "video": [
+            {"id": 80, "height": 1080, "codecid": 7, "bandwidth": 3000000},
+            {"id": 32, "height": 480, "codecid": 12, "bandwidth": 500000},
+            {"id": 32, "height": 480, "codecid": 7, "bandwidth": 700000},
+            {"id": 16, "height": 360, "codecid": 7, "bandwidth": 400000},
+            {"id": 6, "height": 240, "codecid": 7, "bandwidth": 150000},
+        ],
+        "audio": [{"id": 30280, "bandwidth": 320000}, {"id": 30216, "bandwidth": 64000}],
+    }
+    video, audio = pick_representations(dash, 360, 480)
+    assert video["height"] == 360 and video["codecid"] == 7
+    assert audio["id"] == 30216
+
+
+def test_falls_back_to_lowest_stream_above_minimum():
+    dash = {"video": [{"height": 1080, "codecid": 7, "bandwidth": 3}, {"height": 720, "codecid": 7, "bandwidth": 2}]}
+    video, audio = pick_representations(dash, 360, 480)
+    assert video["height"] == 720 and audio is None
+
+
+class FakeResponse:
+    def __init__(self, status_code, content=b"", headers=None):
+        self.status_code, self.content, self.headers = status_code, content, headers or {}
+
+    def close(self):
+        pass
+
+
+class FakeStream:
+    """按 Range 返回 data 的切片；fail_chunks 中的块起点返回 503"""
+
+    def __init__(self, data, chunk_size):
+        self.data, self.chunk_size = data, chunk_size
+        self.fail_chunks = set()
+        self.fetched = []
+
+    def get(self, url, headers=None, timeout=None, stream=False):
+        start, end = (int(x) for x in headers["Range"][len("bytes="):].split("-"))
+        if (start, end) == (0, 0) and stream:
+            return FakeResponse(206, headers={"Content-Range": f"bytes 0-0/{len(self.data)}"})
+        chunk = start // self.chunk_size
+        if chunk in self.fail_chunks:
+            return FakeResponse(503)
+        self.fetched.append(chunk)
+        return FakeResponse(206, self.data[start:end + 1])
+
+
+@pytest.fixture
+def stream(monkeypatch):
+    fake = FakeStream(bytes(range(256)) * 4, chunk_size=100)
+    monkeypatch.setattr(bili_dash, "_session", lambda: fake)
+    return fake
+
+
+def test_failed_download_resumes_missing_chunks_only(tmp_path, stream):
+    target = tmp_path / "BV1.video.m4s"
+    stream.fail_chunks = {3}
+    with pytest.raises(RuntimeError):
+        bili_dash.download_ranged(["https://cdn/v"], target, workers=1, chunk_size=100)
+    assert target.with_name(target.name + ".part").exists()
+
+    stream.fail_chunks, stream.fetched = set(), []
+    bili_dash.download_ranged(["https://cdn/v"], target, workers=1, chunk_size=100)
+    assert stream.fetched == [3]                                 # 只补失败的块
+    assert target.read_bytes() == stream.data
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["BV1.video.m4s"]
+
+
+def test_stale_partial_is_downloaded_again(tmp_path, stream):
+    target = tmp_path / "BV1.video.m4s"
+    stream.fail_chunks = {3}
+    with pytest.raises(RuntimeError):
+        bili_dash.download_ranged(["https://cdn/v"], target, workers=1, chunk_size=100)
+
+    stream.fail_chunks, stream.fetched = set(), []
+    bili_dash.download_ranged(["https://cdn/v"], target, workers=1, chunk_size=100, max_age_seconds=-1)
+    assert len(stream.fetched) == 11 and target.read_bytes() == stream.data
+
+
+def test_native_failure_keeps_partials_until_fallback_succeeds(tmp_path, monkeypatch):
+    pytest.importorskip("google.generativeai")
+    from agent.enhancers import gemini_vision
+    from agent.enhancers.video_store import VideoStore
+
+    store = VideoStore(root=str(tmp_path / "store"))
+    monkeypatch.setattr(gemini_vision, "video_store", store)
+    partials = []
+
+    def failing_download(bvid, out):
+        partials.extend(bili_dash.dash_artifacts(out)[1:])
+        for f in partials:
+            f.write_bytes(b"partial")
+        raise RuntimeError("403")
+
+    monkeypatch.setattr(bili_dash, "download_bilibili_dash", failing_download)
+    assert gemini_vision._download_native("BV1", tmp_path / "BV1.mp4") is False
+    assert all(f.exists() for f in partials)                     # 下次可续传
+
+    partials.clear()
+
+    def fallback(url, output, extra=()):
+        assert all(f.exists() for f in partials)
+        output.write_bytes(b"mp4")
+
+    monkeypatch.setattr(gemini_vision, "_run_yt_dlp", fallback)
+    monkeypatch.setattr(store, "commit", lambda key, tmp, **kw: tmp)
+    gemini_vision.download_video("https://www.bilibili.com/video/BV1xx")
+    assert partials and not any(f.exists() for f in partials)  # 兜底成功后清理
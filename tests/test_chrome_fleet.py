@@ -0,0 +1,102 @@
+import pytest
+
+pytest.importorskip("selenium")
+
+from agent.generators import chrome_fleet as fleet_mod
+from agent.generators.chrome_fleet import ChromeFleet, ChromeInstance, clone_profile
+
+
+class FakeProcess:
+    def __init__(self):
+        self.pid = 1234
+        self.returncode = None
+
+    def poll(self):
+        return self.returncode
+
+    def terminate(self):
+        self.returncode = 0
+
+    def wait(self, timeout=None):
+        return self.returncode
+
+
+def test_clone_profile_skips_locks_and_caches(tmp_path):
+    template = tmp_path / "template"
+    (template / "Default" / "Cache").mkdir(parents=True)
+    (template / "Default" / "Cookies").write_text("c")
+    (template / "SingletonLock").write_text("")
+    dest = tmp_path / "instance-0"
+
+    assert clone_profile(str(template), str(dest)) is True
+    assert (dest / "Default" / "Cookies").exists()
+    assert not (dest / "SingletonLock").exists() and not (dest / "Default" / "Cache").exists()
+    assert clone_profile(str(template), str(dest)) is False        # 已存在则不覆盖
+
+
+def test_check_restarts_crashed_instances_until_limit(monkeypatch, tmp_path):
+    fleet = ChromeFleet({"enabled": True, "size": 2, "max_restarts": 1, "profiles_dir": str(tmp_path)})
+    up = {9300: True, 9301: True}
+    launches = []
+
+    def fake_launch(inst):
+        launches.append(inst.port)
+        inst.process = FakeProcess()
+        inst.healthy = up[inst.port]
+        return inst.healthy
+
+    monkeypatch.setattr(fleet, "_launch", fake_launch)
+    monkeypatch.setattr(fleet_mod, "probe_devtools_json", lambda port, timeout=None: {"Browser": "x"} if up[port] else None)
+    closed = []
+    monkeypatch.setattr(fleet_mod.flow_session_pool, "close_port", closed.append)
+    fleet.instances = [ChromeInstance(index=i, port=9300 + i, profile_dir=str(tmp_path / str(i))) for i in range(2)]
+    for inst in fleet.instances:
+        fake_launch(inst)
+    launches.clear()
+
+    fleet.instances[1].process.returncode = -9                       # 进程崩溃
+    fleet.check()
+    assert launches == [9301] and closed == [9301]
+    assert fleet.healthy_ports() == [9300, 9301]
+
+    up[9301] = False                                                # 重启后仍无响应 → 超过上限停用
+    fleet.check()
+    assert fleet.instances[1].disabled and fleet.healthy_ports() == [9300]
+
+
+def test_task_manager_scales_with_fleet(monkeypatch):
+    from agent import tasks
+
+    monkeypatch.setattr(tasks.chrome_fleet, "healthy_ports", lambda: [9300, 9301, 9302])
+    monkeypatch.setattr(tasks.flow_session_pool, "tabs_per_browser", 3)
+    manager = tasks.FlowTaskManager()
+    assert manager.capacity() == 9
+
+    manager.running_tasks = {"a": {"port": 9300}, "b": {"port": 9302}}
+    task = {"details": {"debugging_port": None}}
+    assert manager._assign_port(task) == 9301
+    task["details"]["debugging_port"] = 9222
+    assert manager._assign_port(task) == 9222
+
+
+def test_fleet_tasks_never_fall_back_to_other_browsers(monkeypatch):
+    import asyncio
+
+    from agent import tasks
+
+    monkeypatch.setattr(tasks.chrome_fleet, "enabled", True)
+    monkeypatch.setattr(tasks.chrome_fleet, "healthy_ports", lambda: [])
+    manager = tasks.FlowTaskManager()
+    assert manager.capacity() == 0                                  # 没有健康实例时任务留在队列
+
+    calls = []
+    monkeypatch.setattr(tasks.flow_results, "find", lambda task_id: None)
+    monkeypatch.setattr(tasks, "generate_video_in_flow",
+                        lambda *args: calls.append(args) or {"success": False, "message": "端口无响应"})
+    task_id = manager.add_task("p", 9300, None)
+    task = manager.task_queue.popleft()
+    task["port"] = 9300
+    manager.running_tasks[task_id] = task
+    asyncio.run(manager._run_task(task))
+    assert calls[0][1] == 9300 and calls[0][-1] is False            # fallback_port=False
+    assert task["status"] == "queued" and manager.task_queue[0] is task
@@ -0,0 +1,68 @@
+import json
+import os
+import stat
+
+import pytest
+
+pytest.importorskip("selenium")
+pytest.importorskip("webdriver_manager")
+
+from agent.generators import devtools
+from agent.generators.devtools import ChromeDriverCache
+
+
+def _exe(path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text("#!/bin/sh\n")
+    path.chmod(path.stat().st_mode | stat.S_IXUSR)
+    return str(path)
+
+
+def test_downloads_once_per_major_and_persists(tmp_path, monkeypatch):
+    downloads = []
+
+    def fake_download(browser, major):
+        downloads.append(browser)
+        return _exe(tmp_path / "wdm" / major / "chromedriver")
+
+    monkeypatch.setattr(devtools, "_download_chromedriver", fake_download)
+    cache = ChromeDriverCache(path=str(tmp_path / "map.json"), driver_dir="", offline=False)
+    p1 = cache.for_port(9222, "Chrome/126.0.6478.127")
+    assert cache.for_port(9222, "Chrome/126.0.6478.127") == p1
+    assert cache.for_port(9223, "Chrome/126.0.6478.182") == p1     # 同主版本直接复用
+    assert downloads == ["Chrome/126.0.6478.127"]
+    assert json.loads((tmp_path / "map.json").read_text()) == {"126": p1}
+
+    # 新实例从持久化映射恢复；浏览器升级后才重新解析
+    cache2 = ChromeDriverCache(path=str(tmp_path / "map.json"), driver_dir="", offline=False)
+    assert cache2.for_port(9222, "Chrome/126.0.6478.127") == p1
+    cache2.for_port(9222, "Chrome/127.0.1.2")
+    assert downloads[-1] == "Chrome/127.0.1.2"
+
+    os.remove(p1)       # 驱动文件丢失时重新下载
+    cache2.for_port(9222, "Chrome/126.0.6478.127")
+    assert len(downloads) == 3
+
+
+def test_offline_uses_seeded_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(devtools, "_download_chromedriver", lambda *a: pytest.fail("不应联网"))
+    seeded = _exe(tmp_path / "drivers" / "126" / ("chromedriver.exe" if os.name == "nt" else "chromedriver"))
+    cache = ChromeDriverCache(path=str(tmp_path / "map.json"), driver_dir=str(tmp_path / "drivers"), offline=True)
+    assert cache.for_browser("Chrome/126.0.1.1") == seeded
+    with pytest.raises(RuntimeError):
+        cache.for_browser("Chrome/127.0.1.1")
+
+
+def test_unknown_browser_version_is_not_cached(tmp_path, monkeypatch):
+    downloads = []
+    monkeypatch.setattr(devtools, "_download_chromedriver",
+                        lambda browser, major: downloads.append(major) or _exe(tmp_path / "wdm" / "chromedriver"))
+    cache = ChromeDriverCache(path=str(tmp_path / "map.json"), driver_dir="", offline=False)
+    cache.for_port(9222, "")
+    cache.for_port(9222, "")
+    assert downloads == ["latest", "latest"]                     # 每次重新解析
+    assert not (tmp_path / "map.json").exists()
+
+    cache.offline = True
+    with pytest.raises(RuntimeError):
+        cache.for_browser("")
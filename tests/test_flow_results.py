@@ -0,0 +1,138 @@
+import asyncio
+import base64
+import gc
+import time
+
+import pytest
+
+pytest.importorskip("selenium")
+
+from agent.enhancers import video_store
+from agent.generators.flow_results import FlowResults
+
+MP4 = b"\x00\x00\x00\x18ftypmp42" + b"\x00" * 50
+
+
+class FakeDriver:
+    current_url = "https://labs.google/fx/tools/flow"
+
+    def __init__(self, blob=MP4, prompt="prompt A"):
+        self.blob = blob
+        self.prompt = prompt
+        self.polls = 0
+        self.staged = {}
+        # 同一项目的其他标签页先渲染完成，结果也出现在本页画廊
+        self.cards = [{"url": "https://old/1.mp4", "text": "an earlier prompt that was rendered before"},
+                      {"url": "blob:https://labs.google/other", "text": "prompt B from another tab\nDownload"}]
+
+    def execute_script(self, script, *args):
+        if "cardText" in script:
+            self.polls += 1
+            mine = [{"url": "blob:https://labs.google/new", "text": f"  {self.prompt.upper()} \n Download"}]
+            return self.cards + (mine if self.polls >= 3 else [])
+        if "querySelectorAll" in script:
+            return [c["url"] for c in self.cards]
+        if "delete" in script:
+            self.staged.pop(args[0], None)
+
+    def execute_async_script(self, script, *args):
+        if "fetch(url)" in script:
+            self.staged[args[0]] = self.blob
+            return len(self.blob)
+        url, start, end = args[:3]
+        return base64.b64encode(self.staged[url][start:end]).decode()
+
+
+@pytest.fixture
+def results(tmp_path, monkeypatch):
+    monkeypatch.setattr(video_store, "_probe_ok", lambda path: True)
+    return FlowResults(root=str(tmp_path / "results"), render_timeout_seconds=2, poll_seconds=0.01, chunk_bytes=16)
+
+
+def test_collect_waits_for_new_video_and_downloads_in_chunks(results):
+    driver = FakeDriver()
+    out = results.collect(driver, ["https://old/1.mp4"], "prompt A", task_id="t1",
+                          prompt_path="prompts/a.json")
+    assert out["status"] == "rendered" and out["video_url"] == "blob:https://labs.google/new"
+    with open(out["output_path"], "rb") as f:
+        assert f.read() == MP4
+    assert driver.staged == {}                                   # 页面内暂存的 blob 已释放
+
+    again = FlowResults(root=results.root)                       # 重新加载索引
+    rec = again.find("t1")
+    assert rec["prompt_path"] == "prompts/a.json" and rec["output_path"] == out["output_path"]
+    assert rec["key"] == "flow:t1"
+    assert again.find("t2") is None and again.find(None) is None
+
+
+def test_results_are_per_task_even_for_identical_prompts(results):
+    first = results.collect(FakeDriver(), ["https://old/1.mp4"], "prompt A", task_id="t1")
+    second = results.collect(FakeDriver(MP4 + b"\x01"), ["https://old/1.mp4"], "prompt A", task_id="t2")
+    assert results.find("t1")["output_path"] == first["output_path"]
+    assert results.find("t2")["output_path"] == second["output_path"] != first["output_path"]
+
+
+def test_collect_without_task_id_records_one_off_result(results):
+    out = results.collect(FakeDriver(), ["https://old/1.mp4"], "prompt A")
+    assert out["status"] == "rendered" and results.stats()["rendered"] == 1
+
+
+def test_render_from_another_tab_is_not_taken(results):
+    driver = FakeDriver(prompt="prompt C")
+    results.render_timeout_seconds = 0.05
+    assert results.wait_for_render(driver, ["https://old/1.mp4"], "prompt A") is None
+
+    results.match_prompt = False                                 # 关闭匹配时任何新视频都算
+    assert results.wait_for_render(driver, ["https://old/1.mp4"], "prompt A") == "blob:https://labs.google/other"
+
+
+def test_render_timeout_reports_submitted(results):
+    driver = FakeDriver()
+    driver.polls = -10**9
+    results.render_timeout_seconds = 0.05
+    out = results.collect(driver, ["https://old/1.mp4"], "prompt A", task_id="t1")
+    assert out["status"] == "submitted" and results.find("t1") is None
+
+
+def test_task_manager_skips_retried_task_with_existing_output(monkeypatch):
+    from agent import tasks
+
+    manager = tasks.FlowTaskManager()
+    task_id = manager.add_task("done", None, None, prompt_path="prompts/a.json")
+    monkeypatch.setattr(tasks.flow_results, "find",
+                        lambda tid: {"output_path": "/r/x.mp4"} if tid == task_id else None)
+    monkeypatch.setattr(tasks, "generate_video_in_flow", lambda *a: pytest.fail("should not resubmit"))
+    task = manager.task_queue.popleft()
+    manager.running_tasks[task_id] = task
+    asyncio.run(manager._run_task(task))
+    assert task["status"] == "rendered" and task["result"]["skipped"] is True
+    assert manager.get_queue_summary()["rendered"] == 1
+
+
+def test_worker_holds_inflight_tasks_and_shutdown_waits_for_them(monkeypatch):
+    from agent import tasks
+
+    finished = []
+
+    def slow_generate(prompt, *args):
+        time.sleep(0.2)
+        finished.append(prompt)
+        return {"success": True, "status": "submitted", "message": "ok"}
+
+    monkeypatch.setattr(tasks, "generate_video_in_flow", slow_generate)
+    monkeypatch.setattr(tasks.flow_results, "find", lambda task_id: None)
+    manager = tasks.FlowTaskManager()
+    manager.add_task("p1", 9222, None)
+
+    async def run():
+        manager.worker_task = asyncio.create_task(manager.worker())
+        while not manager._inflight:
+            await asyncio.sleep(0.01)
+        gc.collect()
+        assert len(manager._inflight) == 1                  # 运行中的任务有强引用
+        await manager.shutdown(timeout=5)
+        assert manager.worker_task is None
+
+    asyncio.run(run())
+    assert finished == ["p1"] and not manager._inflight
+    assert manager.get_queue_summary()["completed"] == 1
@@ -0,0 +1,138 @@
+import pytest
+
+pytest.importorskip("selenium")
+pytest.importorskip("webdriver_manager")
+
+from agent.generators import flow_automator as fa
+
+
+class FakeElement:
+    def __init__(self, page):
+        self.page = page
+        self.value = "old text"
+
+    def click(self):
+        self.page.active = self
+
+    def send_keys(self, *keys):
+        if keys == (fa.Keys.ENTER,) and self.page.enter_error:
+            raise fa.WebDriverException("element not interactable")
+        if keys == (fa.Keys.ENTER,) and self.page.submit_on_enter:
+            self.value = ""            # 页面提交后清空输入框
+            self.page.requests += 1
+
+
+class FakeDriver:
+    def __init__(self, submit_on_enter=True):
+        self.active = None
+        self.selected = False
+        self.cdp_works = True
+        self.requests = 250            # 资源缓冲区已满时的历史条目数
+        self.submit_on_enter = submit_on_enter
+        self.enter_error = False
+        self.element = FakeElement(self)
+
+    def execute_cdp_cmd(self, cmd, params):
+        assert cmd == "Input.insertText"
+        if self.cdp_works and self.selected:
+            self.active.value = params["text"]
+        return {}
+
+    def execute_script(self, script, *args):
+        if script == fa._JS_ELEMENT_TEXT:
+            return args[0].value
+        if script == fa._JS_IS_FOCUSED:
+            return self.active is args[0]
+        if script == fa._JS_WATCH_REQUESTS:
+            self.requests = 0
+        if script == fa._JS_REQUEST_COUNT:
+            return self.requests
+        if script == fa._JS_SELECT_CONTENTS:
+            self.active, self.selected = args[0], True
+        if script == fa._JS_SET_VALUE:
+            args[0].value = args[1]
+        return None
+
+
+@pytest.fixture
+def driver(monkeypatch):
+    d = FakeDriver()
+    monkeypatch.setattr(fa, "_find_input_element", lambda drv, verbose=True: drv.element)
+    monkeypatch.setattr(fa, "_find_send_button", lambda drv: None)
+    return d
+
+
+def test_submit_confirmed_without_fixed_sleeps(driver, monkeypatch):
+    monkeypatch.setattr(fa.time, "sleep", lambda s: pytest.fail("不应固定等待"))
+    status, reason = fa._input_and_submit(driver, "a cat\nin a diner")
+    assert status == "submitted" and reason == "回车提交成功"
+
+
+def test_falls_back_to_value_setter_when_cdp_insert_does_nothing(driver, monkeypatch):
+    monkeypatch.setattr(fa, "VALUE_TIMEOUT", 0.2)
+    driver.cdp_works = False
+    status, reason = fa._input_and_submit(driver, "a cat")
+    assert status == "submitted" and driver.requests == 1
+
+
+class FakeButton:
+    def __init__(self):
+        self.clicks = 0
+
+    def click(self):
+        self.clicks += 1
+
+
+def test_enter_without_confirmation_is_not_resent(driver, monkeypatch):
+    monkeypatch.setattr(fa, "SUBMIT_CONFIRM_TIMEOUT", 0.2)
+    button = FakeButton()
+    monkeypatch.setattr(fa, "_find_send_button", lambda drv: button)
+    driver.submit_on_enter = False
+    status, reason = fa._input_and_submit(driver, "a cat")
+    assert status == "unconfirmed" and button.clicks == 0
+
+
+def test_button_used_only_when_enter_was_not_sent(driver, monkeypatch):
+    monkeypatch.setattr(fa, "SUBMIT_CONFIRM_TIMEOUT", 0.2)
+    button = FakeButton()
+    monkeypatch.setattr(fa, "_find_send_button", lambda drv: button)
+    driver.enter_error = True
+    status, reason = fa._input_and_submit(driver, "a cat")
+    assert status == "unconfirmed" and button.clicks == 1
+
+
+def test_unconfirmed_submit_stops_retries(monkeypatch):
+    calls = []
+
+    def fake_submit(drv, prompt_text, timeout):
+        calls.append(prompt_text)
+        return "unconfirmed", "已按回车，但未检测到提交"
+
+    monkeypatch.setattr(fa, "_input_and_submit", fake_submit)
+    monkeypatch.setattr(fa.time, "sleep", lambda s: pytest.fail("不应重试"))
+
+    class Driver:
+        current_url = "https://labs.google/fx/flow"
+
+        def execute_script(self, script, *args):
+            return "complete"
+
+    result = fa._submit_on_session(Driver(), "a cat")
+    assert calls == ["a cat"]
+    assert not result["success"] and result["status"] == "unconfirmed"
+
+
+def test_element_discovery_is_one_call_and_remembers_selector(monkeypatch):
+    monkeypatch.setattr(fa, "_selector_memory", {"input": {}, "send": {}})
+    calls = []
+
+    class Driver:
+        def execute_script(self, script, selectors, remembered, keywords, editable):
+            calls.append(dict(remembered))
+            return {"element": "EL", "selector": "div[role='textbox']", "page": "https://labs.google/fx/flow",
+                    "diagnostics": []}
+
+    d = Driver()
+    assert fa._find_input_element(d) == "EL"
+    assert fa._find_input_element(d) == "EL"
+    assert calls == [{}, {"https://labs.google/fx/flow": "div[role='textbox']"}]
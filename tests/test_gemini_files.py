@@ -0,0 +1,37 @@
+import time
+from types import SimpleNamespace
+
+from agent.enhancers import gemini_files
+from agent.enhancers.gemini_files import GeminiFileRegistry
+
+
+def _file(name, state="ACTIVE"):
+    return SimpleNamespace(name=name, uri=f"uri/{name}", state=SimpleNamespace(name=state))
+
+
+def test_reuses_active_upload_and_purges_expired(tmp_path, monkeypatch):
+    monkeypatch.setenv("GEMINI_API_KEYS", "key-a")
+    uploads, deleted = [], []
+    monkeypatch.setattr(gemini_files, "gemini_key", lambda k=None: k or "key-a")
+    monkeypatch.setattr(gemini_files, "upload_gemini_file",
+                        lambda p, api_key: uploads.append(p) or _file(f"files/{len(uploads)}"))
+    monkeypatch.setattr(gemini_files, "get_gemini_file", lambda name, api_key: _file(name))
+    monkeypatch.setattr(gemini_files, "delete_gemini_file", lambda name, api_key: deleted.append(name))
+
+    video = tmp_path / "v.mp4"
+    video.write_bytes(b"x" * 2048)
+    reg = GeminiFileRegistry(path=str(tmp_path / "reg.json"), reuse_margin_seconds=60)
+
+    key, f1 = reg.acquire(video)
+    key2, f2 = reg.acquire(video)
+    assert key == key2 == "key-a"
+    assert f1.name == f2.name and len(uploads) == 1
+
+    data = reg._load()
+    entry = next(iter(next(iter(data.values())).values()))
+    entry["expires_at"] = time.time() + 10
+    reg._save(data)
+    assert reg.purge_expired() == 1
+    assert deleted == [f1.name]
+    reg.acquire(video)
+    assert len(uploads) == 2
@@ -0,0 +1,49 @@
+import pytest
+
+from agent.utils import key_rotator
+from agent.utils.key_rotator import ApiKeyPool
+
+
+class RateLimitError(Exception):
+    pass
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setenv("TEST_KEYS", "k1,k2")
+    monkeypatch.setattr(key_rotator, "_keys_cfg",
+                        lambda provider: {"rpm": 2, "tpm": 0, "cooldown_seconds": 60, "max_wait_seconds": 0})
+    return ApiKeyPool("test", "TEST_KEYS", "TEST_KEY")
+
+
+def test_least_loaded_key(pool):
+    a = pool.acquire()
+    b = pool.acquire()
+    assert {a, b} == {"k1", "k2"}
+    pool.release(a)
+    assert pool.acquire(block=False) == a
+
+
+def test_rate_limited_key_cools_down(pool):
+    with pytest.raises(RateLimitError):
+        with pool.lease() as lease:
+            bad = lease.key
+            raise RateLimitError("429")
+    for _ in range(2):
+        with pool.lease() as lease:
+            assert lease.key != bad
+    assert pool.stats()[f"...{bad[-4:]}"]["cooldown_s"] > 0
+
+
+def test_reloads_when_env_changes(pool, monkeypatch):
+    assert pool.keys == ["k1", "k2"]
+    monkeypatch.setenv("TEST_KEYS", "k3")
+    assert pool.keys == ["k3"]
+
+
+def test_pooled_clients_do_not_retry_inside_sdk():
+    pytest.importorskip("openai")
+    from agent.llm import clients
+
+    # 429 必须立即回到 key 池与网关，而不是被 SDK 用同一个 key 重试
+    assert clients.get_deepseek_client("sk-test").max_retries == 0
@@ -0,0 +1,37 @@
+import time
+
+from agent.llm.cache import LLMResponseCache
+
+
+def _cache(tmp_path, **kw):
+    return LLMResponseCache(path=str(tmp_path / "c.sqlite3"), enabled=True, **kw)
+
+
+def test_hit_miss_and_call_site_flag(tmp_path):
+    c = _cache(tmp_path, call_sites={"expand_prompt": False})
+    assert c.get("compose_v1_json", "k1") is None
+    c.set("compose_v1_json", "k1", '{"a": 1}')
+    assert c.get("compose_v1_json", "k1") == '{"a": 1}'
+    c.set("expand_prompt", "k2", "x")
+    assert c.get("expand_prompt", "k2") is None
+    stats = c.stats()
+    assert stats["hits"]["compose_v1_json"] == 1
+    assert stats["misses"]["compose_v1_json"] == 1
+    assert stats["entries"] == 1
+
+
+def test_ttl_and_lru_eviction(tmp_path):
+    c = _cache(tmp_path, ttl_seconds=0.05, max_entries=2)
+    c.set("s", "old", "v")
+    time.sleep(0.1)
+    assert c.get("s", "old") is None
+
+    c = _cache(tmp_path, max_entries=2)
+    c.set("s", "a", "1")
+    c.set("s", "b", "2")
+    c.get("s", "a")  # a 变为最近访问
+    c.set("s", "c", "3")
+    c.evict()
+    assert c.get("s", "b") is None
+    assert c.get("s", "a") == "1"
+    assert c.get("s", "c") == "3"
@@ -0,0 +1,98 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from agent.llm import gateway
+from agent.llm.gateway import LLMGateway, _PriorityLimiter
+
+
+class RateLimitError(Exception):
+    pass
+
+
+@pytest.fixture
+def gw(monkeypatch):
+    monkeypatch.setattr(gateway, "_gateway_cfg", lambda: {"enabled": True, "default_concurrency": 4,
+                                                         "rate_limit_cooldown_seconds": 0.3,
+                                                         "max_rate_limit_retries": 1})
+    return LLMGateway()
+
+
+def _flush(gw):
+    # 释放通过 call_soon_threadsafe 投递，排一个空协程等它们执行完
+    gw._submit(asyncio.sleep(0)).result()
+
+
+def test_singleflight_coalesces_identical_calls(gw):
+    calls = []
+
+    def fn():
+        calls.append(1)
+        deadline = time.time() + 2
+        while gw.coalesced < 4 and time.time() < deadline:     # 等其余 4 个请求挂到同一个 Future 上
+            time.sleep(0.01)
+        return "ok"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(
+        gw.run("deepseek", "m", fn, payload={"messages": [" hi "]}))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == ["ok"] * 5 and len(calls) == 1 and gw.coalesced == 4
+
+
+def test_rate_limit_halves_capacity_and_honours_cooldown(gw):
+    attempts = []
+
+    def fn():
+        attempts.append(time.monotonic())
+        if len(attempts) == 1:
+            raise RateLimitError("429")
+        return "ok"
+
+    assert gw.run("deepseek", "m", fn) == "ok"
+    _flush(gw)
+    assert attempts[1] - attempts[0] >= 0.3                      # 冷却期内不放行重试
+    snap = gw.stats()["limiters"]["model:m"]
+    assert snap["capacity"] == 2 and snap["rate_limited"] == 1 and snap["active"] == 0
+    lim = gw._limiter("model", "m")
+    assert gw._limiter("provider", "deepseek").capacity == 2
+
+    # 加性恢复：每成功 capacity 次容量 +1
+    for _ in range(2):
+        gw.run("deepseek", "m", lambda: "ok")
+    _flush(gw)
+    assert lim.capacity == 3
+
+
+def test_rate_limit_retries_are_bounded(gw):
+    def fn():
+        raise RateLimitError("429")
+
+    with pytest.raises(RateLimitError):
+        gw.run("deepseek", "m2", fn)
+
+
+def test_waiters_are_admitted_by_priority():
+    async def scenario():
+        lim = _PriorityLimiter("t", 1)
+        await lim.acquire(5)
+        order = []
+
+        async def waiter(priority):
+            await lim.acquire(priority)
+            order.append(priority)
+            lim.release(True)
+
+        tasks = [asyncio.create_task(waiter(p)) for p in (9, 5, 0)]
+        await asyncio.sleep(0)
+        assert lim.snapshot()["waiting"] == 3
+        lim.release(True)
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(scenario()) == [0, 5, 9]
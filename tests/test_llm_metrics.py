@@ -0,0 +1,47 @@
+import importlib
+
+import pytest
+
+from agent.llm.metrics import LLMMetrics
+
+LABELS = 'call_site="compose_v1_json",provider="deepseek",model="deepseek-chat"'
+
+
+@pytest.fixture
+def recorded(monkeypatch):
+    monkeypatch.delenv("LLM_METRICS_JSONL", raising=False)
+    m = LLMMetrics()
+    m.jsonl_path = ""
+    m.pricing = {"deepseek-chat": {"input": 0.27, "output": 1.10}}
+    with m.track("compose_v1_json", "deepseek", "deepseek-chat") as rec:
+        rec.first_token()
+        rec.set_usage(1000, 500)
+    with m.track("compose_v1_json", "deepseek", "deepseek-chat") as rec:
+        rec.mark("cache_hit")
+    return m
+
+
+def test_prometheus_text_has_latency_ttft_token_and_cost_series(recorded):
+    text = recorded.render_prometheus()
+    assert "# TYPE llm_request_duration_seconds histogram" in text
+    assert f"llm_request_duration_seconds_count{{{LABELS}}} 1" in text
+    assert f'llm_request_duration_seconds_bucket{{{LABELS},le="+Inf"}} 1' in text
+    assert f"llm_time_to_first_token_seconds_count{{{LABELS}}} 1" in text
+    assert f'llm_tokens_per_call_count{{{LABELS},type="prompt"}} 1' in text
+    assert f'llm_tokens_total{{{LABELS},type="prompt"}} 1000' in text
+    assert f'llm_tokens_total{{{LABELS},type="completion"}} 500' in text
+    assert f"llm_cost_usd_total{{{LABELS}}} 0.000820" in text
+    # 缓存命中只计次数，不计入延迟与用量
+    assert f'llm_requests_total{{{LABELS},outcome="ok"}} 1' in text
+    assert f'llm_requests_total{{{LABELS},outcome="cache_hit"}} 1' in text
+
+
+def test_metrics_endpoint_serves_prometheus_text(recorded, monkeypatch):
+    main = importlib.import_module("main")
+    monkeypatch.setattr(main, "llm_metrics", recorded)
+    from fastapi.testclient import TestClient
+
+    resp = TestClient(main.app).get("/api/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    assert f"llm_tokens_total{{{LABELS},type=\"prompt\"}} 1000" in resp.text
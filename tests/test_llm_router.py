@@ -0,0 +1,66 @@
+import time
+
+import pytest
+
+from agent.llm import router as router_mod
+from agent.llm.router import LLMRouter
+
+CFG = {
+    "enabled": True,
+    "min_samples": 2,
+    "failure_threshold": 2,
+    "unhealthy_cooldown_seconds": 60,
+    "hedge_min_delay_seconds": 0.05,
+    "default_latency_seconds": 0.1,
+    "backends": [
+        {"provider": "deepseek", "model": "deepseek-chat", "capabilities": ["json", "tools"]},
+        {"provider": "gemini", "model": "g", "capabilities": ["json"]},
+    ],
+    "call_types": {"compose_v1_json": ["json"], "call_model": ["tools"]},
+}
+
+
+@pytest.fixture
+def router(monkeypatch):
+    cfg = dict(CFG)
+    monkeypatch.setattr(router_mod, "_routing_cfg", lambda: cfg)
+    r = LLMRouter()
+    r.cfg = cfg
+    return r
+
+
+def test_capability_filter_and_latency_ranking(router):
+    assert [b.name for b in router.candidates("call_model")] == ["deepseek/deepseek-chat"]
+    assert router.candidates("compose_v1_json", ("deepseek", "deepseek-chat"))[0].provider == "deepseek"
+    ds, gm = router.backends()
+    for _ in range(3):
+        router.record(ds, 3.0, True)
+        router.record(gm, 0.5, True)
+    assert router.candidates("compose_v1_json", ("deepseek", "deepseek-chat"))[0].provider == "gemini"
+    assert not router.enabled_for("analyze_video")
+
+
+def test_failover_marks_backend_unhealthy(router):
+    def fn(b):
+        if b.provider == "deepseek":
+            raise RuntimeError("down")
+        return "ok"
+
+    assert router.execute("compose_v1_json", fn, preferred=("deepseek", "deepseek-chat")) == "ok"
+    ds = router.backends()[0]
+    assert router.is_healthy(ds)
+    router.record(ds, 1.0, False)
+    assert not router.is_healthy(ds)
+    assert router.candidates("compose_v1_json", ("deepseek", "deepseek-chat"))[0].provider == "gemini"
+
+
+def test_hedge_returns_faster_backend(router):
+    router.cfg["hedge"] = True
+
+    def fn(b):
+        time.sleep(1.0 if b.provider == "deepseek" else 0.01)
+        return b.provider
+
+    t0 = time.monotonic()
+    assert router.execute("compose_v1_json", fn, preferred=("deepseek", "deepseek-chat")) == "gemini"
+    assert time.monotonic() - t0 < 0.8
@@ -0,0 +1,76 @@
+import pytest
+
+from agent.iterators.merge_policy import apply_deltas, validate_visual_deltas
+
+
+BASE = {
+    "name": "demo_v1",
+    "veo_params": {"aspect_ratio": "16:9"},
+    "prompt": {"concept": "cat", "lighting": "soft", "actions": ["press"]},
+}
+
+
+def test_apply_set_and_append():
+    new = apply_deltas(BASE, [
+        {"op": "set", "path": "prompt.lighting", "value": "warm rim light"},
+        {"op": "append", "path": "prompt.actions[]", "value": "slow down"},
+        {"op": "set", "path": "veo_params.aspect_ratio", "value": "9:16"},
+    ])
+    assert new["prompt"]["lighting"] == "warm rim light"
+    assert new["prompt"]["actions"] == ["press", "slow down"]
+    assert new["veo_params"]["aspect_ratio"] == "9:16"
+    assert BASE["prompt"]["lighting"] == "soft"
+
+
+def test_validate_visual_deltas():
+    accepted, rejected = validate_visual_deltas([
+        {"op": "replace", "path": "/prompt/style", "value": "film grain"},
+        {"op": "add", "path": "/prompt/constraints/-", "value": "No text"},
+        {"op": "set", "path": "name", "value": "hijack"},
+        {"op": "set", "path": "meta.title", "value": "clickbait"},
+        {"op": "remove", "path": "prompt.audio"},
+    ])
+    assert [(d["op"], d["path"]) for d in accepted] == [("set", "prompt.style"), ("append", "prompt.constraints[]")]
+    assert len(rejected) == 3
+
+
+def test_list_index_replace_and_insert():
+    base = dict(BASE, prompt=dict(BASE["prompt"], actions=["press", "wave"],
+                                  shots=[{"camera": "wide"}, {"camera": "close"}]))
+    accepted, rejected = validate_visual_deltas([
+        {"op": "replace", "path": "/prompt/actions/0", "value": "jump"},
+        {"op": "add", "path": "/prompt/actions/1", "value": "spin"},
+        {"op": "replace", "path": "/prompt/shots/1/camera", "value": "macro"},
+    ], base)
+    assert not rejected
+    assert [(d["op"], d["path"]) for d in accepted] == [
+        ("set", "prompt.actions[0]"), ("insert", "prompt.actions[1]"), ("set", "prompt.shots[1].camera")]
+    new = apply_deltas(base, accepted)
+    assert new["prompt"]["actions"] == ["jump", "spin", "wave"]
+    assert new["prompt"]["shots"] == [{"camera": "wide"}, {"camera": "macro"}]
+    assert base["prompt"]["actions"] == ["press", "wave"]
+
+
+def test_list_index_out_of_range_is_rejected():
+    accepted, rejected = validate_visual_deltas([
+        {"op": "replace", "path": "/prompt/actions/5", "value": "jump"},
+        {"op": "replace", "path": "/prompt/lighting/0", "value": "x"},     # 不是列表
+        {"op": "add", "path": "/prompt/actions/1", "value": "end"},          # 末尾插入合法
+    ], BASE)
+    assert [d["path"] for d in accepted] == ["prompt.actions[1]"]
+    assert len(rejected) == 2
+    with pytest.raises(ValueError):
+        apply_deltas(BASE, [{"op": "set", "path": "prompt.actions[3]", "value": "jump"}])
+
+
+def test_dependent_deltas_are_validated_in_sequence():
+    base = dict(BASE, prompt=dict(BASE["prompt"], actions=["press", "wave", "bow"]))
+    deltas = [
+        {"op": "set", "path": "prompt.actions", "value": []},
+        {"op": "replace", "path": "/prompt/actions/2", "value": "jump"},   # 清空之后已越界
+        {"op": "add", "path": "/prompt/actions/0", "value": "spin"},       # 清空之后在开头插入合法
+    ]
+    accepted, rejected = validate_visual_deltas(deltas, base)
+    assert [d["path"] for d in accepted] == ["prompt.actions", "prompt.actions[0]"]
+    assert rejected == [deltas[1]]
+    assert apply_deltas(base, accepted)["prompt"]["actions"] == ["spin"]
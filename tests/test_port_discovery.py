@@ -0,0 +1,61 @@
+import time
+
+import pytest
+
+pytest.importorskip("selenium")
+pytest.importorskip("webdriver_manager")
+
+from agent.generators import devtools
+from agent.generators.devtools import PortDiscovery
+
+
+@pytest.fixture
+def probes(monkeypatch):
+    alive = {9227: {"Browser": "Chrome/126.0.1.2"}}
+    calls = []
+
+    def fake_probe(port, timeout=None):
+        calls.append(port)
+        if port in alive:
+            return alive[port]
+        time.sleep(0.3)            # 模拟超时的端口
+        return None
+
+    monkeypatch.setattr(devtools, "probe_devtools_json", fake_probe)
+    monkeypatch.setattr(devtools, "_read_devtools_active_port_candidates", lambda: [])
+    monkeypatch.setattr(devtools, "_find_debug_ports_from_processes", lambda: pytest.fail("不应遍历进程"))
+    return alive, calls
+
+
+def test_concurrent_probe_first_success_wins(probes):
+    alive, calls = probes
+    d = PortDiscovery(ttl_seconds=30, max_workers=16)
+    start = time.monotonic()
+    assert d.choose(None) == 9227
+    assert time.monotonic() - start < 0.25          # 不等其他端口超时
+    assert d.info(9227)["Browser"].startswith("Chrome/126")
+
+    calls.clear()
+    assert d.choose(None) == 9227 and calls == []   # TTL 内不探测
+
+
+def test_expired_cache_revalidates_with_single_probe(probes):
+    alive, calls = probes
+    d = PortDiscovery(ttl_seconds=0, max_workers=16)
+    d.choose(None)
+    calls.clear()
+    assert d.choose(9227) == 9227
+    assert calls == [9227]
+
+    alive[9230] = alive.pop(9227)                   # 浏览器换了端口
+    calls.clear()
+    assert d.choose(None) == 9230
+    assert calls[0] == 9227
+
+
+def test_no_fallback_when_preferred_port_is_down(probes):
+    alive, calls = probes
+    d = PortDiscovery(ttl_seconds=30, max_workers=16)
+    assert d.choose(9300, fallback=False) is None
+    assert calls == [9300]                           # 不扫描其他端口（包括手动打开的浏览器）
+    assert d.choose(9300) == 9227
@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+pytest.importorskip("pydantic")
+
+from agent.enhancers import prompt_expander
+from agent.registry import store
+
+
+def _prompt(name, concept="a cat in a diner", actions=()):
+    return {
+        "name": name,
+        "meta": {"source": "manual", "topic": "cat", "created_at": "2025-01-01T00:00:00"},
+        "veo_params": {"aspect_ratio": "16:9"},
+        "prompt": {"concept": concept, "actions": list(actions), "lighting": "soft", "style": "photorealistic",
+                   "timing": {"duration_seconds": 8}},
+    }
+
+
+@pytest.fixture
+def base(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(store, "INDEX_PATH", str(tmp_path / "prompts" / "index.json"))
+    path = tmp_path / "base.json"
+    path.write_text(json.dumps(_prompt("cat_v1")), encoding="utf-8")
+    saves = []
+    orig = store._save_index
+    monkeypatch.setattr(store, "_save_index", lambda idx: saves.append(len(idx)) or orig(idx))
+    monkeypatch.setattr(prompt_expander, "dedup_cfg", lambda: {"enabled": False})
+    return str(path), saves
+
+
+def test_concurrent_mode_validates_and_registers_once(base, monkeypatch):
+    path, saves = base
+    calls = []
+
+    def fake_generate(text, **kw):
+        calls.append(kw["variant"])
+        if kw["variant"] == 1:
+            return json.dumps({"name": "broken"})          # 缺字段，校验失败
+        return json.dumps(_prompt("x", concept=f"variant {kw['variant']}"))
+
+    monkeypatch.setattr(prompt_expander, "gemini_generate", fake_generate)
+    results = prompt_expander.expand_prompt(path, 3)
+    assert sorted(calls) == [0, 1, 2]
+    assert [r["prompt_content"]["name"] for r in results] == ["cat_expanded_1", "cat_expanded_3"]
+    assert saves == [2]
+
+
+def test_batched_mode_single_call_and_top_up(base, monkeypatch):
+    path, saves = base
+    calls = []
+
+    def fake_generate(text, **kw):
+        calls.append(kw.get("variant"))
+        if kw.get("variant") is None:
+            return json.dumps({"variants": [_prompt("a"), {"bad": 1}, _prompt("b")]})
+        return json.dumps(_prompt("c"))
+
+    monkeypatch.setattr(prompt_expander, "gemini_generate", fake_generate)
+    results = prompt_expander.expand_prompt(path, 3, mode="batched")
+    assert calls == [None, 2]
+    assert len(results) == 3
+    assert saves == [3]
+    assert set(store.list_prompts()) == {"cat_expanded_1", "cat_expanded_2", "cat_expanded_3"}
+
+
+def test_near_duplicates_are_rejected_and_regenerated(base, monkeypatch):
+    path, saves = base
+    monkeypatch.setattr(prompt_expander, "dedup_cfg",
+                        lambda: {"enabled": True, "threshold": 0.85, "max_regenerations": 1})
+    prompts = []
+
+    def fake_generate(text, **kw):
+        prompts.append(text)
+        v = kw["variant"]
+        if v == 0:
+            # 与基础 Prompt 只差一个词
+            return json.dumps(_prompt("x", concept="a cat in a diner!"))
+        return json.dumps(_prompt("x", concept=f"a fox {v} rides the night subway through neon tunnels",
+                                  actions=[f"fox {v} waves"]))
+
+    monkeypatch.setattr(prompt_expander, "gemini_generate", fake_generate)
+    results = prompt_expander.expand_prompt(path, 2)
+    assert len(prompts) == 3                      # 第 0 个被拒后重新生成一次
+    assert "AVOID" in prompts[-1] and "a cat in a diner" in prompts[-1]
+    assert [r["prompt_content"]["name"] for r in results] == ["cat_expanded_1", "cat_expanded_2"]
+    assert saves == [2]
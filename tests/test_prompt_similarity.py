@@ -0,0 +1,58 @@
+import copy
+import json
+from pathlib import Path
+
+from agent.prompt.similarity import compare_prompts, dedup_cfg, find_near_duplicate, shingles, jaccard
+
+GENERATED = Path(__file__).resolve().parent.parent / "prompts" / "generated"
+
+CFG = {"threshold": 0.85, "structural_weight": 0.4, "shingle_size": 2}
+
+
+def _prompt(concept, actions, lighting="soft window light", name="p"):
+    return {"name": name, "meta": {"created_at": name},
+            "prompt": {"concept": concept, "actions": actions, "lighting": lighting,
+                       "shots": [{"camera": "macro close-up", "composition": "centered"}]}}
+
+
+BASE = _prompt("A ginger cat naps on a tiny wooden bench inside a miniature diner at dusk",
+               ["cat stretches slowly", "cat yawns and curls up"])
+
+
+def test_shingle_jaccard():
+    assert jaccard(shingles("a b c d"), shingles("a b c d")) == 1.0
+    assert jaccard(shingles("a b c d"), shingles("x y z w")) == 0.0
+    assert shingles("hi there you", size=3) == {("hi", "there", "you")}
+    assert shingles("hi", size=2) == {("hi",)}
+
+
+def test_synonym_swap_is_near_duplicate_but_new_subject_is_not():
+    synonym = _prompt("A ginger cat sleeps on a tiny wooden bench inside a miniature diner at dusk",
+                      ["cat stretches slowly", "cat yawns and curls up"], name="s")
+    fresh = _prompt("A grey rabbit hops across a rainy miniature subway platform under neon signs",
+                    ["rabbit sniffs a ticket", "rabbit boards the toy train"], lighting="cool neon", name="f")
+
+    sim = compare_prompts(BASE, synonym, CFG)
+    assert sim.changed_fields == ["$.prompt.concept"]
+    assert find_near_duplicate(synonym, [("base", BASE)], CFG)[0] == "base"
+    assert find_near_duplicate(fresh, [("base", BASE), ("s", synonym)], CFG) is None
+
+
+def test_identical_content_ignores_name_and_meta():
+    copy = dict(BASE, name="other", meta={"created_at": "later"})
+    label, sim = find_near_duplicate(copy, [("base", BASE)], dict(CFG, threshold=1.1))
+    assert label == "base" and sim.changed_fields == [] and sim.score == 1.0
+
+
+def test_default_threshold_accepts_real_variants_and_rejects_synonym_swap():
+    # 仓库里真实的扩展变体（换猫的品种/性格）应被接受，单个同义词替换应被拒绝
+    base = json.loads((GENERATED / "喵喵小镇：快餐店与地铁_expanded_1.json").read_text(encoding="utf-8"))
+    cfg = dedup_cfg()
+    for i in (1, 2, 3):
+        variant = json.loads((GENERATED / f"喵喵小镇：快餐店与地铁_expanded_1_expanded_{i}.json")
+                             .read_text(encoding="utf-8"))
+        assert find_near_duplicate(variant, [("base", base)], cfg) is None
+
+    synonym = copy.deepcopy(base)
+    synonym["prompt"]["concept"] = synonym["prompt"]["concept"].replace("playful", "mischievous", 1)
+    assert find_near_duplicate(synonym, [("base", base)], cfg)[0] == "base"
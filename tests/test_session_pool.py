@@ -0,0 +1,142 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("selenium")
+
+from selenium.common.exceptions import WebDriverException
+
+from agent.generators import session_pool
+from agent.generators.session_pool import FlowSessionPool
+
+
+class FakeSwitch:
+    def __init__(self, driver):
+        self.driver = driver
+
+    def window(self, handle):
+        self.driver.current = handle
+
+
+class FakeDriver:
+    """同一浏览器的多个会话共享 tabs（handle -> url）"""
+
+    def __init__(self, tabs):
+        self.tabs = tabs
+        self.current = next(iter(self.tabs))
+        self.switch_to = FakeSwitch(self)
+        self.alive = True
+        self.quit_calls = 0
+        self.cdp = []
+
+    @property
+    def window_handles(self):
+        return list(self.tabs)
+
+    @property
+    def current_url(self):
+        return self.tabs[self.current]
+
+    def execute_script(self, script, *args):
+        if not self.alive:
+            raise WebDriverException("disconnected")
+        return 1
+
+    def execute_cdp_cmd(self, cmd, params):
+        self.cdp.append(cmd)
+        if cmd == "Target.createTarget":
+            assert params["background"] is True
+            handle = f"t{len(self.tabs)}"
+            self.tabs[handle] = params["url"]
+            return {"targetId": handle}
+        return {}
+
+    def quit(self):
+        self.quit_calls += 1
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    drivers = []
+    tabs = {"a": "https://example.com", "b": "https://labs.google/fx/tools/flow"}
+
+    def fake_attach(port, driver_path):
+        d = FakeDriver(tabs)
+        drivers.append(d)
+        return d
+
+    monkeypatch.setattr(session_pool.chromedriver_cache, "for_port", lambda port: "/drivers/126")
+    monkeypatch.setattr(session_pool, "attach_driver", fake_attach)
+    return FlowSessionPool(idle_timeout_seconds=60, borrow_timeout_seconds=1, tabs_per_browser=2), drivers
+
+
+def test_reuses_session_and_cached_flow_tab(pool):
+    p, drivers = pool
+    with p.session(9222) as s1:
+        assert s1.flow_handle == "b" and s1.driver_path == "/drivers/126"
+        assert "Emulation.setFocusEmulationEnabled" in s1.driver.cdp
+    with p.session(9222) as s2:
+        assert s2 is s1
+    assert len(drivers) == 1
+    assert p.stats()["9222/0"]["borrowed"] is False
+
+
+def test_parallel_slots_get_distinct_background_tabs(pool, monkeypatch):
+    p, drivers = pool
+    entered = threading.Barrier(2, timeout=2)
+    handles = []
+    searching, overlaps = [], []
+    find = session_pool.find_flow_tab
+
+    def slow_find(driver, flow_url=None, exclude=None):
+        # 拉长查找窗口：未按端口串行时，两个槽位会在登记句柄前都选中 "b"
+        searching.append(driver)
+        overlaps.append(len(searching))
+        time.sleep(0.05)
+        try:
+            return find(driver, flow_url, exclude)
+        finally:
+            searching.remove(driver)
+
+    monkeypatch.setattr(session_pool, "find_flow_tab", slow_find)
+
+    def run():
+        with p.session(9222) as s:
+            handles.append(s.flow_handle)
+            entered.wait()          # 两个任务同时持有各自的槽位
+
+    threads = [threading.Thread(target=run) for _ in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sorted(handles) == ["b", "t2"]
+    assert overlaps == [1, 1]
+    assert drivers[0].tabs["t2"] == "https://labs.google/fx/tools/flow"     # 沿用已有 Flow 页面地址
+    assert len(drivers) == 2 and set(p.stats()) == {"9222/0", "9222/1"}
+
+
+def test_waits_for_free_slot_and_times_out(pool):
+    p, _ = pool
+    p.tabs_per_browser = 1
+    with p.session(9222):
+        with pytest.raises(RuntimeError):
+            with p.session(9222):
+                pass
+
+
+def test_reconnects_unhealthy_session_and_reaps_idle(pool):
+    p, drivers = pool
+    with p.session(9222):
+        pass
+    drivers[0].alive = False
+    with p.session(9222) as s:
+        assert s.driver is drivers[1]
+    assert drivers[0].quit_calls == 1
+
+    s.last_used -= 120
+    assert p.reap_idle() == 1
+    assert drivers[1].quit_calls == 1
+    p.close_all()
+    assert p.stats() == {}
@@ -0,0 +1,21 @@
+from agent.enhancers.video_fingerprint import Fingerprint, FingerprintIndex
+
+
+def test_near_duplicate_found_within_duration_window(tmp_path):
+    idx = FingerprintIndex(path=str(tmp_path / "fp.sqlite3"))
+    base = [0x0F0F0F0F0F0F0F0F, 0x123456789ABCDEF0, 0xFFFF0000FFFF0000, 0x0]
+    idx.add(Fingerprint(300.0, base), "BV_orig", "u", {"video_summary": "s"})
+
+    reupload = Fingerprint(301.0, [h ^ 0b111 for h in base])   # 每帧 3 位差异
+    hit = idx.find(reupload)
+    assert hit["video_key"] == "BV_orig" and hit["analysis"] == {"video_summary": "s"}
+    assert hit["distance"] == 3
+
+    assert idx.find(Fingerprint(400.0, base)) is None
+    assert idx.find(Fingerprint(300.0, [~h & (2 ** 64 - 1) for h in base])) is None
+
+
+def test_distance_tolerates_one_frame_shift():
+    a = Fingerprint(10, [1, 2, 4, 8])
+    b = Fingerprint(10, [0, 1, 2, 4])
+    assert a.distance(b) < a.distance(Fingerprint(10, [7, 7, 7, 7]))
@@ -0,0 +1,88 @@
+import asyncio
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("google.generativeai")
+
+from agent.enhancers import video_pipeline
+from agent.enhancers.video_pipeline import VideoAnalysisPipeline
+
+
+class StageProbe:
+    """记录各阶段的同时运行数峰值"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = {}
+        self.peak = {}
+        self.calls = {}
+
+    def run(self, stage, seconds):
+        with self.lock:
+            self.active[stage] = self.active.get(stage, 0) + 1
+            self.peak[stage] = max(self.peak.get(stage, 0), self.active[stage])
+            self.calls[stage] = self.calls.get(stage, 0) + 1
+        time.sleep(seconds)
+        with self.lock:
+            self.active[stage] -= 1
+
+
+@pytest.fixture
+def probe(monkeypatch):
+    p = StageProbe()
+
+    def prepare(url, duration):
+        if url == "bad":
+            raise RuntimeError("download failed")
+        # 排在前面的热点下载更慢，结果仍需按输入顺序返回
+        p.run("download", 0.08 if url == "u0" else 0.02)
+        return Path(f"/tmp/{url}.mp4"), {"url": url}
+
+    def find_prior(path, meta):
+        return f"fp-{meta['url']}", ({"analysis": {"seen": meta["url"]}} if meta["url"] == "u3" else None)
+
+    def upload(path):
+        p.run("upload", 0.03)
+        return "key", path.stem
+
+    async def active(obj, key):
+        return obj
+
+    def describe(obj, hotspot, key):
+        p.run("generate", 0.03)
+        return {"desc": obj}
+
+    monkeypatch.setattr(video_pipeline, "prepare_analysis_video", prepare)
+    monkeypatch.setattr(video_pipeline, "find_prior_analysis", find_prior)
+    monkeypatch.setattr(video_pipeline, "upload_video", upload)
+    monkeypatch.setattr(video_pipeline, "await_until_active", active)
+    monkeypatch.setattr(video_pipeline, "describe_video", describe)
+    monkeypatch.setattr(video_pipeline, "remember_analysis", lambda fp, url, result: None)
+    monkeypatch.setattr(video_pipeline, "compose_from_analysis",
+                        lambda analysis, series, meta: {"series": series, "analysis": analysis, "url": meta["url"]})
+    return p
+
+
+def test_results_keep_input_order_and_isolate_failures(probe):
+    hotspots = [{"url": "u0"}, {"url": "bad", "title": "broken"}, {"title": "no url"}, {"url": "u3"}, {"url": "u4"}]
+    results = asyncio.run(VideoAnalysisPipeline(download=2, upload=2, generate=2).run(hotspots, "S"))
+
+    assert [r.get("url") for r in results] == ["u0", None, None, "u3", "u4"]
+    assert results[0]["analysis"] == {"desc": "u0"}
+    assert results[1] == {"error": "download failed", "hotspot": hotspots[1]}
+    assert "url" in results[2]["error"]
+    assert results[3]["analysis"] == {"seen": "u3"}            # 已分析过的视频跳过上传与生成
+    assert probe.calls == {"download": 3, "upload": 2, "generate": 2}
+
+
+def test_stage_concurrency_limits(probe):
+    hotspots = [{"url": f"v{i}"} for i in range(6)]
+    results = asyncio.run(VideoAnalysisPipeline(download=2, upload=1, generate=3).run(hotspots, "S"))
+
+    assert all("error" not in r for r in results)
+    assert probe.peak["download"] == 2
+    assert probe.peak["upload"] == 1
+    assert probe.peak["generate"] <= 3
@@ -0,0 +1,83 @@
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from agent.enhancers import video_proxy, video_store as store_mod
+from agent.enhancers.video_store import VideoStore
+
+MP4_HEAD = b"\x00\x00\x00\x18ftypmp42"
+CFG = {"enabled": True, "max_height": 360, "max_fps": 10, "crf": 30, "keep_audio": True}
+
+
+@pytest.fixture
+def env(tmp_path, monkeypatch):
+    store = VideoStore(root=str(tmp_path / "store"), max_bytes=10 ** 9, min_age_seconds=0)
+    monkeypatch.setattr(video_proxy, "video_store", store)
+    monkeypatch.setattr(video_proxy, "_proxy_cfg", lambda: dict(CFG))
+    monkeypatch.setattr(video_proxy.shutil, "which", lambda name: "/usr/bin/ffmpeg")
+    monkeypatch.setattr(store_mod, "_probe_ok", lambda path: True)
+    source = tmp_path / "BV1.mp4"
+    source.write_bytes(MP4_HEAD + b"s" * 1000)
+    return store, source
+
+
+def test_ffmpeg_command_scales_down_and_handles_audio():
+    cmd = video_proxy.ffmpeg_proxy_command(Path("in.mp4"), Path("out.mp4"), CFG)
+    assert cmd[0] == "ffmpeg" and cmd[cmd.index("-i") + 1] == "in.mp4" and cmd[-1] == "out.mp4"
+    assert cmd[cmd.index("-vf") + 1] == "scale=-2:'min(360,ih)':flags=fast_bilinear,fps=10"
+    assert cmd[cmd.index("-c:a") + 1] == "aac" and "-an" not in cmd
+
+    silent = video_proxy.ffmpeg_proxy_command(Path("in.mp4"), Path("out.mp4"), dict(CFG, keep_audio=False))
+    assert "-an" in silent and "-c:a" not in silent
+
+
+def test_transcodes_into_store_and_reuses_cached_proxy(env, monkeypatch):
+    store, source = env
+    runs = []
+
+    def fake_run(cmd, **kw):
+        runs.append(cmd)
+        Path(cmd[-1]).write_bytes(MP4_HEAD + b"p" * 100)
+        return subprocess.CompletedProcess(cmd, 0)
+
+    monkeypatch.setattr(video_proxy.subprocess, "run", fake_run)
+    path, info = video_proxy.make_analysis_proxy(source)
+    assert path != source and info["transcoded"] and info["proxy_bytes"] < info["source_bytes"]
+    again, _ = video_proxy.make_analysis_proxy(source)
+    assert again == path and len(runs) == 1
+
+
+def test_falls_back_to_source_when_ffmpeg_missing(env, monkeypatch):
+    _, source = env
+    monkeypatch.setattr(video_proxy.shutil, "which", lambda name: None)
+    monkeypatch.setattr(video_proxy.subprocess, "run", lambda *a, **kw: pytest.fail("ffmpeg should not run"))
+    path, info = video_proxy.make_analysis_proxy(source)
+    assert path == source and info["transcoded"] is False
+
+
+@pytest.mark.parametrize("error", [subprocess.CalledProcessError(1, "ffmpeg", stderr="boom"),
+                                   subprocess.TimeoutExpired("ffmpeg", 600)])
+def test_falls_back_to_source_when_ffmpeg_fails(env, monkeypatch, error):
+    store, source = env
+
+    def fake_run(cmd, **kw):
+        Path(cmd[-1]).write_bytes(b"partial")
+        raise error
+
+    monkeypatch.setattr(video_proxy.subprocess, "run", fake_run)
+    path, info = video_proxy.make_analysis_proxy(source)
+    assert path == source and info["transcoded"] is False
+    assert list((store.root / "tmp").iterdir()) == []             # 半截临时文件已删除
+
+
+def test_keeps_source_when_proxy_is_not_smaller(env, monkeypatch):
+    store, source = env
+
+    def fake_run(cmd, **kw):
+        Path(cmd[-1]).write_bytes(MP4_HEAD + b"p" * 5000)
+        return subprocess.CompletedProcess(cmd, 0)
+
+    monkeypatch.setattr(video_proxy.subprocess, "run", fake_run)
+    path, _ = video_proxy.make_analysis_proxy(source)
+    assert path == source and store.stats()["keys"] == 0
@@ -0,0 +1,45 @@
+import os
+import time
+
+import pytest
+
+from agent.enhancers.video_store import VideoStore
+
+MP4_HEAD = b"\x00\x00\x00\x18ftypmp42"
+
+
+def _write(store, key, payload):
+    tmp = store.temp_path(key)
+    tmp.write_bytes(MP4_HEAD + payload)
+    return tmp
+
+
+def test_commit_is_content_addressed_and_rejects_truncated(tmp_path):
+    store = VideoStore(root=str(tmp_path), max_bytes=10 ** 9, min_age_seconds=0)
+    a = store.commit("BV1", _write(store, "BV1", b"a" * 100), source_url="u1")
+    b = store.commit("BV1.proxy", _write(store, "BV1.proxy", b"a" * 100))
+    assert a == b and store.sha_of(a) == a.stem
+    assert store.lookup("BV1") == a
+    assert store.stats()["objects"] == 1
+
+    bad = store.temp_path("BV2")
+    bad.write_bytes(b"garbage")
+    with pytest.raises(RuntimeError):
+        store.commit("BV2", bad)
+    assert not bad.exists() and store.lookup("BV2") is None
+
+    with open(a, "ab") as f:
+        f.write(b"x")
+    assert store.lookup("BV1") is None
+
+
+def test_lru_eviction_respects_quota(tmp_path):
+    store = VideoStore(root=str(tmp_path), max_bytes=250, min_age_seconds=0)
+    old = store.commit("old", _write(store, "old", b"o" * 100))
+    time.sleep(0.01)
+    store.commit("new", _write(store, "new", b"n" * 100))
+    store.lookup("old")
+    time.sleep(0.01)
+    store.commit("newest", _write(store, "newest", b"z" * 100))
+    assert store.lookup("new") is None
+    assert store.lookup("old") == old and os.path.exists(old)
@@ -0,0 +1,54 @@
+import pytest
+
+from agent.enhancers import video_window
+from agent.enhancers.video_window import plan_window
+
+
+@pytest.fixture
+def cfg(monkeypatch):
+    conf = {"mode": "segments", "min_duration_seconds": 120, "segments": 4, "segment_seconds": 20,
+            "head_seconds": 90}
+    monkeypatch.setattr(video_window, "config_section", lambda name: {"window": conf})
+    monkeypatch.setattr(video_window.shutil, "which", lambda name: "/usr/bin/" + name)
+    return conf
+
+
+def test_short_or_unknown_videos_download_in_full(cfg):
+    assert plan_window(None) is None
+    assert plan_window(100) is None
+
+
+def test_segments_are_evenly_spaced_within_bounds(cfg):
+    w = plan_window(1200)
+    assert w.mode == "segments" and len(w.ranges) == 4
+    assert all(0 <= s < e <= 1200 and e - s == 20 for s, e in w.ranges)
+    starts = [s for s, _ in w.ranges]
+    assert starts == sorted(starts) and starts[0] > 0
+    assert w.to_meta()["source_duration"] == 1200
+
+
+def test_head_window(cfg):
+    cfg["mode"] = "head"
+    assert plan_window(600).ranges == [(0.0, 90.0)]
+
+
+def test_source_duration_is_remembered_and_skips_probing(tmp_path, monkeypatch):
+    pytest.importorskip("google.generativeai")
+    from agent.collectors import bili_dash
+    from agent.enhancers import gemini_vision
+    from agent.enhancers.video_store import VideoStore
+
+    monkeypatch.setattr(gemini_vision, "video_store", VideoStore(root=str(tmp_path)))
+    views = []
+    monkeypatch.setattr(bili_dash, "_view_cache", {})
+    monkeypatch.setattr(bili_dash, "_api_json", lambda url, params: views.append(params) or {"cid": 1, "duration": 900})
+    monkeypatch.setattr(gemini_vision, "probe_duration", lambda url: pytest.fail("不应启动 yt-dlp 探测"))
+
+    url = "https://www.bilibili.com/video/BV1xx411c7mD"
+    assert gemini_vision.source_duration(url) == 900
+    assert bili_dash.video_info("BV1xx411c7mD")["cid"] == 1           # 原生下载复用同一次 view 请求
+    assert len(views) == 1
+
+    monkeypatch.setattr(bili_dash, "_api_json", lambda url, params: pytest.fail("已记录的时长不应再联网"))
+    monkeypatch.setattr(bili_dash, "_view_cache", {})
+    assert gemini_vision.source_duration(url) == 900